@@ -0,0 +1,240 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import re
+import json
+import time
+import threading
+import collections
+
+# twitch user names, anything else in the file is skipped
+regex_user_name = re.compile(rb"^[a-zA-Z0-9_]{1,25}$")
+
+
+# bans every name in a file, reading it a line at a time from where the last run stopped
+# the progress is saved next to the file, in <filename>.<channel>.progress and the names already banned in <filename>.<channel>.banned
+class BanListJob():
+
+	def __init__(self, bot, channel, filename, limit=None, window=20, save_interval=5):
+		self.bot = bot
+		self.channel = channel
+		self.filename = filename
+		self.limit = limit
+		self.save_interval = save_interval
+		channel_name = channel.lstrip("#")
+		self.progress_filename = f"{filename}.{channel_name}.progress"
+		self.banned_filename = f"{filename}.{channel_name}.banned"
+		# at most this many bans are waiting in the send scheduler
+		self.in_flight = threading.Semaphore(window)
+		self.window = window
+		self.stop_event = threading.Event()
+		self.lock = threading.Lock()
+		self.file_size = 0
+		# offset of the first line that hasnt been read and of the first one that hasnt been sent yet
+		self.read_offset = 0
+		self.sent_offset = 0
+		# (offset of the line, offset after the line, name) of the bans waiting to be sent, in the order they will be sent
+		self.pending = collections.deque()
+		self.banned_names = set()
+		self.new_banned_names = []
+		self.sent = 0
+		self.skipped = 0
+		self.failed = 0
+		# after a ban that couldnt be sent the progress stays before it,
+		# the next run starts from there and skips the names banned after it
+		self.failed_offset = None
+		self.start_time = None
+		self.start_offset = 0
+		self.thread = None
+
+
+	def start(self):
+		self._load_progress()
+		self.file_size = os.path.getsize(self.filename)
+		self.start_time = time.monotonic()
+		self.start_offset = self.sent_offset
+		self.thread = threading.Thread(target=self._run, name=f"banlist {self.channel}", daemon=True)
+		self.thread.start()
+
+
+	def stop(self):
+		self.stop_event.set()
+
+
+	def is_running(self):
+		return self.thread is not None and self.thread.is_alive()
+
+
+	# bans per second and seconds left, based on the bytes of the file sent since the start
+	def stats(self):
+		with self.lock:
+			elapsed = max(time.monotonic() - self.start_time, 1e-9)
+			bytes_per_second = (self.sent_offset - self.start_offset) / elapsed
+			remaining = self.file_size - self.sent_offset
+			eta = remaining / bytes_per_second if bytes_per_second > 0 else None
+			return self.sent / elapsed, eta
+
+
+	def status(self):
+		rate, eta = self.stats()
+		percent = self.sent_offset / self.file_size * 100 if self.file_size else 100
+		eta_text = f"{eta / 60:.1f} minutes" if eta is not None else "unknown"
+		return (f"{self.filename}: {self.sent} banned, {self.skipped} skipped, {self.failed} not sent, {percent:.1f}% of the file, "
+			f"{rate:.1f} bans/s, time left {eta_text}")
+
+
+	def _load_progress(self):
+		try:
+			with open(self.progress_filename, "r", encoding="utf8") as progress_file:
+				progress = json.load(progress_file)
+			self.sent_offset = progress["offset"]
+		except (IOError, ValueError, KeyError):
+			self.sent_offset = 0
+		self.read_offset = self.sent_offset
+		try:
+			with open(self.banned_filename, "r", encoding="utf8") as banned_file:
+				self.banned_names = {line.strip() for line in banned_file}
+		except IOError:
+			self.banned_names = set()
+
+
+	# written to a temporary file first, an interrupted save never leaves a broken progress file
+	def _save_progress(self):
+		with self.lock:
+			offset = self.sent_offset
+			new_banned_names = self.new_banned_names
+			self.new_banned_names = []
+		if new_banned_names:
+			with open(self.banned_filename, "a", encoding="utf8") as banned_file:
+				banned_file.write("\n".join(new_banned_names) + "\n")
+		temporary_filename = self.progress_filename + ".tmp"
+		with open(temporary_filename, "w", encoding="utf8") as progress_file:
+			json.dump({"offset": offset, "file_size": self.file_size}, progress_file)
+		os.replace(temporary_filename, self.progress_filename)
+
+
+	# called with the lock held, the progress never moves past a ban that wasnt sent
+	def _advance(self, offset):
+		if self.failed_offset is None:
+			self.sent_offset = offset
+		else:
+			self.sent_offset = self.failed_offset
+
+
+	# called by the send scheduler after a ban has been written to the socket or failed to, error is None if it was sent
+	# a failed ban stops the job, the connection is down and the next ones would fail too
+	def _on_sent(self, error):
+		with self.lock:
+			line_offset, offset, name = self.pending.popleft()
+			if error is None:
+				self._advance(offset)
+				self.new_banned_names.append(name)
+				self.sent += 1
+			else:
+				self.failed += 1
+				if self.failed_offset is None:
+					self.failed_offset = line_offset
+				self.banned_names.discard(name)
+		if error is not None:
+			self.stop_event.set()
+		self.in_flight.release()
+
+
+	# waits for a free slot in the send queue, returns False if the job was stopped in the meantime
+	def _acquire_slot(self):
+		while not self.in_flight.acquire(timeout=1):
+			if self.stop_event.is_set():
+				return False
+		return True
+
+
+	def _lines(self):
+		with open(self.filename, "rb") as banlist_file:
+			banlist_file.seek(self.read_offset)
+			for line in banlist_file:
+				yield line
+
+
+	def _run(self):
+		last_save = time.monotonic()
+		queued = 0
+		try:
+			for line in self._lines():
+				if self.stop_event.is_set() or (self.limit is not None and queued >= self.limit):
+					break
+
+				line_offset = self.read_offset
+				offset = line_offset + len(line)
+				name = line.strip().lower()
+				if regex_user_name.match(name):
+					name = name.decode("ascii")
+				else:
+					name = None
+
+				# empty lines, comments and names already banned only move the offset forward
+				if name is None or name in self.banned_names:
+					self.read_offset = offset
+					self.skipped += 1
+					with self.lock:
+						if not self.pending:
+							self._advance(offset)
+					continue
+
+				if not self._acquire_slot():
+					break
+				self.read_offset = offset
+				self.banned_names.add(name)
+				with self.lock:
+					self.pending.append((line_offset, offset, name))
+				self.bot.send_PRIVMSG(self.channel, f"/ban {name}", callback=self._on_sent)
+				queued += 1
+
+				if time.monotonic() - last_save >= self.save_interval:
+					self._save_progress()
+					last_save = time.monotonic()
+
+			# wait for the bans still in the send queue, unless the job is stopped
+			for count in range(self.window):
+				if not self._acquire_slot():
+					break
+			# the lines skipped after the last ban were never counted as sent
+			with self.lock:
+				if not self.pending:
+					self._advance(self.read_offset)
+		except IOError as error:
+			self.bot.log(f"Handled IOError: {error}", cmd="warning")
+			self.bot.send_PRIVMSG(self.channel, f"Can't read file {self.filename}")
+		finally:
+			self._save_progress()
+
+		if self.failed:
+			self.bot.send_PRIVMSG(self.channel, f"Stopped banning, a ban couldn't be sent, {self.status()}")
+		elif self.stop_event.is_set():
+			self.bot.send_PRIVMSG(self.channel, f"Stopped banning, {self.status()}")
+		elif self.sent_offset >= self.file_size:
+			self.bot.send_PRIVMSG(self.channel, f"Reached end of {self.filename}, {self.status()}")
+		else:
+			self.bot.send_PRIVMSG(self.channel, f"Done banning {queued} users, {self.status()}")
+
+
+	# forgets the progress so the next run starts from the beginning of the file
+	def reset(self):
+		for filename in (self.progress_filename, self.banned_filename):
+			try:
+				os.remove(filename)
+			except FileNotFoundError:
+				pass
@@ -0,0 +1,82 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+# how fast HistoryStore takes chat lines and how long the queries of the commands take once it holds them
+# the lines are spread over channels and chatters the way bench_presence spreads the chatters, the first ones the busiest
+# usage: python benchmarks/bench_history.py [messages]
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from history import *
+
+WORDS = ("gg", "pog", "lul", "kappa", "nice", "run", "split", "reset", "wr", "pb", "hello", "chat", "what", "is", "this", "the", "a")
+
+
+def chat_lines(count, channels, chatters, generator):
+	lines = []
+	for _ in range(count):
+		channel = min(int(generator.paretovariate(1.2)) - 1, channels - 1)
+		nick = min(int(generator.paretovariate(1.1)) - 1, chatters - 1)
+		msg = " ".join(generator.choice(WORDS) for _ in range(generator.randint(1, 8)))
+		lines.append((f"#channel{channel}", f"chatter{nick}", msg))
+	return lines
+
+
+def per_query(function, args):
+	start = time.perf_counter()
+	for arg in args:
+		function(*arg)
+	return (time.perf_counter() - start) / len(args) * 1000
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+	generator = random.Random(1)
+	lines = chat_lines(count, 100, 20000, generator)
+	with tempfile.TemporaryDirectory() as directory:
+		# big enough for the whole burst, the bot gets the lines a few at a time
+		store = HistoryStore(os.path.join(directory, "history.db"), max_pending=count)
+		start = time.perf_counter()
+		for channel, nick, msg in lines:
+			store.emit(LEVEL_CHAT, msg, nick, "PRIVMSG", channel, msg, "")
+		emitted = time.perf_counter() - start
+		while store.written < count:
+			time.sleep(0.01)
+		written = time.perf_counter() - start
+		print(f"{count} messages: emit {emitted / count * 1000000:.2f}us each, all written after {written:.2f}s "
+			f"({count / written:.0f}/s) in {store.batches} batches, "
+			f"{os.path.getsize(os.path.join(directory, 'history.db')) / count:.0f} bytes per message")
+		since = time.time() - 60 * 60
+		queries = [(channel, nick) for channel, nick, _ in generator.sample(lines, 1000)]
+		print(f"last_message: {per_query(store.last_message, queries):.3f}ms")
+		print(f"count_messages of a chatter: {per_query(lambda channel, nick: store.count_messages(channel, since, nick), queries):.3f}ms")
+		for phrase in ("gg", "kappa", "split reset"):
+			for channel in ("#channel0", "#channel10", "#channel50"):
+				print(f"count_phrase {phrase!r} in {channel} ({store.count_messages(channel, since)} messages, "
+					f"{store.count_phrase(channel, phrase, since)} matches): "
+					f"{per_query(lambda: store.count_phrase(channel, phrase, since), [()] * 20):.3f}ms")
+		store.close()
+
+
+if __name__ == "__main__":
+	main()
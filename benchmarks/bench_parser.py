@@ -0,0 +1,85 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# compares parse_message with the regex and tag splitting previously used for every line
+# usage: python benchmarks/bench_parser.py [iterations]
+
+import os
+import sys
+import re
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ircmessage import *
+
+LINES = [
+	"@badge-info=subscriber/14;badges=moderator/1,subscriber/12;client-nonce=a1b2c3;color=#1E90FF;display-name=SomeChatter;"
+	"emotes=25:0-4,12-16;first-msg=0;flags=;id=b34ccfc7-4977-403a-8a94-33c6bac34fb8;mod=1;returning-chatter=0;room-id=1337;"
+	"subscriber=1;tmi-sent-ts=1642696567751;turbo=0;user-id=9001;user-type=mod "
+	":somechatter!somechatter@somechatter.tmi.twitch.tv PRIVMSG #grayfox1996 :Kappa Keepo Kappa what a run",
+	"@badge-info=;badges=;color=;display-name=Lurker;emotes=;first-msg=0;flags=;id=1f2e3d4c;mod=0;room-id=1337;"
+	"subscriber=0;tmi-sent-ts=1642696567999;turbo=0;user-id=42;user-type= "
+	":lurker!lurker@lurker.tmi.twitch.tv PRIVMSG #grayfox1996 :!ping",
+	"PING :tmi.twitch.tv",
+	":lurker!lurker@lurker.tmi.twitch.tv JOIN #grayfox1996",
+	"@emote-only=0;followers-only=-1;r9k=0;room-id=1337;slow=0;subs-only=0 :tmi.twitch.tv ROOMSTATE #grayfox1996",
+]
+
+regex_message = re.compile("^@?(?P<tags>(?:[^\\s=;]+=[^\\s=;]*[; ])*)"
+							"(?:\\:(?P<nick>[^\\!\\@ ]+)(?:\\!(?P<user>[^\\@ ]+))?(?:\\@(?P<host>[^ ]+))? )?"
+							"(?P<cmd>[^ ]+)"
+							"(?: (?P<channel>[^\\:][^ ]*(?: [^\\:][^ ]*)*))?"
+							"(?: \\:(?P<msg>.*))?$")
+
+
+# what the bot did for every line before: the regex, the tags dict in on_PRIVMSG and the color in log
+def old_pipeline(line):
+	matches_tuple = regex_message.match(line.strip())
+	tags = matches_tuple["tags"]
+	cmd = matches_tuple["cmd"]
+	if cmd == "PRIVMSG":
+		tags_dict = {tag.split("=")[0]: tag.split("=")[1] for tag in tags.rstrip(" ").split(";")}
+		nick_color = "".join([tag.split("=")[1] for tag in tags.split(";") if tag.split("=")[0] == "color"])
+		return tags_dict["badges"], tags_dict["id"], nick_color
+	return matches_tuple["nick"], cmd, matches_tuple["msg"]
+
+
+# the same work with parse_message, only the tags that are used get decoded
+def new_pipeline(line):
+	message = parse_message(line)
+	if message.cmd == "PRIVMSG":
+		return message.tag("badges"), message.tag("id"), message.tag("color")
+	return message.nick, message.cmd, message.msg
+
+
+def main():
+	iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+	for name, function in (("regex", old_pipeline), ("parse_message", new_pipeline)):
+		for line in LINES:
+			function(line)
+		seconds = min(timeit.repeat(lambda: [function(line) for line in LINES], number=iterations, repeat=5))
+		per_line = seconds / (iterations * len(LINES)) * 1e6
+		print(f"{name:>14}: {per_line:.2f} us/line, {1 / per_line * 1e6:,.0f} lines/s")
+
+	# only parsing, without reading any tag
+	for name, function in (("regex only", lambda line: regex_message.match(line.strip())), ("parse only", parse_message)):
+		seconds = min(timeit.repeat(lambda: [function(line) for line in LINES], number=iterations, repeat=5))
+		print(f"{name:>14}: {seconds / (iterations * len(LINES)) * 1e6:.2f} us/line")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# compares PhraseMatcher with the regex alternation previously used for banned_phrases, for lists of growing size
+# usage: python benchmarks/bench_phrases.py [messages]
+
+import os
+import sys
+import re
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from phrasematcher import *
+
+WORDS = ("the", "run", "is", "going", "great", "what", "a", "split", "reset", "pb", "gg", "chat", "hello", "lol", "nice",
+	"that", "was", "close", "any%", "glitch", "skip", "frame", "perfect", "wr", "pace", "Kappa", "PogChamp", "LUL")
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def random_phrase(generator):
+	return "".join(generator.choice(LETTERS) for _ in range(generator.randint(5, 14)))
+
+
+def random_message(generator):
+	return " ".join(generator.choice(WORDS) for _ in range(generator.randint(3, 20)))
+
+
+def per_message(search, messages):
+	start = time.perf_counter()
+	for message in messages:
+		search(message)
+	return (time.perf_counter() - start) / len(messages) * 1000000
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+	generator = random.Random(1)
+	messages = [random_message(generator) for _ in range(count)]
+	print(f"{count} chat messages of {sum(map(len, messages)) / count:.0f} characters on average, none has a banned phrase")
+	print(f"{'phrases':>8} {'regex us':>9} {'matcher us':>11} {'confusables us':>15} {'build ms':>9} {'add/remove us':>14}")
+	for size in (10, 100, 1000, 10000):
+		phrases = [random_phrase(generator) for _ in range(size)]
+		regex = re.compile("(?i)" + "|".join(map(re.escape, phrases)))
+		start = time.perf_counter()
+		matcher = PhraseMatcher(phrases)
+		build = (time.perf_counter() - start) * 1000
+		normalizing_matcher = PhraseMatcher(phrases, normalize_confusables=True)
+		extra = [random_phrase(generator) for _ in range(200)]
+		start = time.perf_counter()
+		for phrase in extra:
+			matcher.add(phrase)
+		for phrase in extra:
+			matcher.remove(phrase)
+		change = (time.perf_counter() - start) / (2 * len(extra)) * 1000000
+		print(f"{size:8} {per_message(regex.search, messages):9.2f} {per_message(matcher.search, messages):11.2f} "
+			f"{per_message(normalizing_matcher.search, messages):15.2f} {build:9.1f} {change:14.1f}")
+
+
+if __name__ == "__main__":
+	main()
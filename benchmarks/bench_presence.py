@@ -0,0 +1,84 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+# the memory used by PresenceIndex and the cost of its updates and queries, for the same chatters spread over more channels
+# the nicks are built again for every event like the parser does, so only interning shares them between channels
+# usage: python benchmarks/bench_presence.py [chatters]
+
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from presence import *
+
+
+# each chatter is in 1 to 3 channels, the first channels are the most popular
+def memberships(chatters, channels, generator):
+	events = []
+	for number in range(chatters):
+		for _ in range(generator.randint(1, 3)):
+			channel = min(int(generator.paretovariate(1.2)) - 1, channels - 1)
+			events.append((f"#channel{channel}", number))
+	return events
+
+
+def per_event(function, events):
+	start = time.perf_counter()
+	for channel, number in events:
+		function(channel, f"chatter{number}")
+	return (time.perf_counter() - start) / len(events) * 1000000
+
+
+def main():
+	chatters = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	generator = random.Random(1)
+	print(f"{chatters} chatters, each in 1 to 3 channels")
+	print(f"{'channels':>8} {'entries':>8} {'MB':>6} {'bytes/entry':>12} {'join us':>8} {'seen us':>8} {'part us':>8} "
+		f"{'present us':>11} {'names ms/1000':>14} {'full seen us':>12}")
+	for channels in (1, 100, 1000):
+		events = memberships(chatters, channels, generator)
+		tracemalloc.start()
+		index = PresenceIndex(max_chatters=len(events))
+		per_event(index.join, events)
+		memory = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+		# timed again without tracemalloc slowing down the allocations
+		index = PresenceIndex(max_chatters=len(events))
+		join = per_event(index.join, events)
+		seen = per_event(index.seen, events)
+		present = per_event(index.is_present, events)
+		part = per_event(index.part, events)
+		# a NAMES reply of 1000 nicks in 353 lines of 100
+		start = time.perf_counter()
+		for line in range(10):
+			index.names("#names", " ".join(f"chatter{number}" for number in range(line * 100, line * 100 + 100)))
+		index.end_of_names("#names")
+		names = (time.perf_counter() - start) * 1000
+		# a full index, every new chatter pushes out one that wasnt seen since the recent sets last moved to the older ones
+		index = PresenceIndex(max_chatters=len(events) // 2)
+		per_event(index.seen, events[:len(events) // 2])
+		evicting = per_event(index.seen, events[len(events) // 2:])
+		print(f"{channels:8} {len(events):8} {memory / 1048576:6.1f} {memory / len(events):12.0f} {join:8.2f} {seen:8.2f} "
+			f"{part:8.2f} {present:11.2f} {names:14.2f} {evicting:12.2f}")
+
+
+if __name__ == "__main__":
+	main()
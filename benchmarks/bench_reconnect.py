@@ -0,0 +1,110 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+# how long "volpesbot.py --headless" takes to be back in all its channels after the connections are dropped,
+# after the server asks it to reconnect and after the connections go quiet without being closed
+# the bot process has to survive all of them, its metrics uptime keeps growing and it counts the reconnects
+# with more than 20 channels most of the time is spent waiting for the JOIN rate limit
+# usage: python benchmarks/bench_reconnect.py [--channels 15] [--async]
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_twitch import FakeTwitchServer
+from bench_soak import CONFIG, ROOT, free_port, bot_metrics
+
+CHANNEL_CONFIG = """
+[#reconnect{number}]
+connect_on_startup = yes
+trigger = !
+"""
+
+# fast enough to measure the quiet connections in seconds
+RECONNECT_CONFIG = """
+[DEFAULT]
+reconnect_min_delay = 0.5
+ping_idle_timeout = 3
+ping_timeout = 2
+connection_check_interval = 0.5
+"""
+
+# twitch allows 20 JOINs in 10 seconds, waiting for the window to empty measures the reconnect and not the earlier joins
+JOIN_WINDOW = 10
+
+
+# seconds until the server sees all the channels joined, None if it doesnt happen within timeout
+def wait_for_channels(server, channels, timeout=60):
+	start = time.monotonic()
+	while time.monotonic() - start < timeout:
+		if server.stats()["channels"] >= channels:
+			return time.monotonic() - start
+		time.sleep(0.05)
+	return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description="reconnect test of the bot against the fake twitch server")
+	parser.add_argument("--channels", type=int, default=15)
+	parser.add_argument("--async", dest="use_async", action="store_true", help="run the bot with --async")
+	arguments = parser.parse_args()
+
+	server = FakeTwitchServer(rate=50)
+	server.run_in_thread()
+	metrics_port = free_port()
+	channels = arguments.channels + 1
+
+	with tempfile.TemporaryDirectory() as directory:
+		with open(os.path.join(directory, "volpesbot_config.ini"), "w", encoding="utf-8") as config_file:
+			config_file.write(CONFIG.format(port=server.port, metrics_port=metrics_port, interval=1).replace("[DEFAULT]",
+				RECONNECT_CONFIG.strip()))
+			config_file.write("".join(CHANNEL_CONFIG.format(number=number) for number in range(arguments.channels)))
+		command = [sys.executable, os.path.join(ROOT, "volpesbot.py"), "--headless"] + (["--async"] if arguments.use_async else [])
+		bot = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		try:
+			print(f"{channels} channels joined in {wait_for_channels(server, channels):.2f}s")
+			for name, action in (("dropped connections", server.drop_connections), ("RECONNECT", server.send_reconnect),
+					("quiet connections", server.freeze_connections)):
+				time.sleep(JOIN_WINDOW)
+				started = time.monotonic()
+				action()
+				# the old connection has to go first, the channels of a quiet one are still counted by the server
+				while server.stats()["channels"] >= channels and time.monotonic() - started < 30:
+					time.sleep(0.01)
+				recovered = wait_for_channels(server, channels)
+				recovered = "not recovered" if recovered is None else f"{time.monotonic() - started:.2f}s"
+				print(f"{name:>20}: all channels joined again after {recovered}")
+			time.sleep(1.5)
+			metrics = bot_metrics(metrics_port) or {}
+			print(f"bot still running: {bot.poll() is None}, uptime {metrics.get('uptime', 0):.1f}s, "
+				f"reconnects {metrics.get('counters', {}).get('reconnects', 0)}")
+		finally:
+			bot.terminate()
+			try:
+				bot.wait(15)
+			except subprocess.TimeoutExpired:
+				bot.kill()
+	print(server.format_stats())
+
+
+if __name__ == "__main__":
+	main()
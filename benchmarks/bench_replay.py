@@ -0,0 +1,231 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# replays a recording made with record_file through the parser, the on_ handlers and the moderation checks
+# the bot runs headless with in-memory connections, nothing is sent over the network
+# usage: python benchmarks/bench_replay.py [recording] [--synthetic lines] [--realtime] [--speed factor] [--repeat times] [--allocations] [--log]
+# without a recording it replays synthetic chat, --realtime keeps the timing of the recording, otherwise its max speed
+
+import os
+import sys
+import gc
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from volpesbot_irc import *
+
+CONFIG = """[DEFAULT]
+server = 127.0.0.1
+port = 6667
+bot_nick = volpesbot
+bot_user = volpesbot
+bot_name = volpesbot
+bot_owner = volpesbot
+bot_password = oauth:replay
+trigger = !
+verbose_log = no
+
+[#volpesbot]
+connect_on_startup = no
+trigger = !
+"""
+
+# every channel of the recording gets all the moderation checks
+CHANNEL_CONFIG = """
+[{channel}]
+connect_on_startup = no
+trigger = !
+block_urls = yes
+banned_phrases = badword|worse phrase|scam link
+mime_emotes = Kappa|PogChamp|LUL
+mime_emotes_cooldown = 30
+"""
+
+WORDS = ("the", "run", "is", "going", "great", "what", "a", "split", "reset", "pb", "gg", "chat", "hello", "lol", "nice",
+	"that", "was", "close", "any%", "glitch", "skip", "frame", "perfect", "wr", "pace")
+EMOTES = (("25", "Kappa"), ("88", "PogChamp"), ("425618", "LUL"), ("354", "4Head"))
+
+
+# a connection that keeps what the bot writes, the lines are fed to the bot by the replay loop
+class MemoryConnection():
+
+	def __init__(self, number, server, port, on_line, on_close, **options):
+		self.number = number
+		self.on_line = on_line
+		self.on_close = on_close
+		self.written = []
+
+
+	def open(self):
+		pass
+
+
+	def write(self, line):
+		self.written.append(line)
+
+
+	def flush(self, timeout=1):
+		return True
+
+
+	def close(self):
+		self.on_close(self, None)
+
+
+class ReplayBot(IRCBot):
+
+	connection_class = MemoryConnection
+
+
+# chat lines like the ones twitch sends, a few of them with urls, banned phrases, emotes, commands and pings
+def synthetic_lines(count, channels=8, chatters=500, seed=1):
+	generator = random.Random(seed)
+	channel_names = [f"#channel{number}" for number in range(channels)]
+	entries = [(0, 0, ":tmi.twitch.tv 376 volpesbot :>")]
+	elapsed = 0
+	for number in range(count):
+		elapsed += generator.expovariate(200)
+		channel = generator.choice(channel_names)
+		nick = f"chatter{generator.randrange(chatters)}"
+		kind = generator.random()
+		if kind < 0.01:
+			line = "PING :tmi.twitch.tv"
+		elif kind < 0.03:
+			line = f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN {channel}"
+		elif kind < 0.04:
+			line = f":{nick}!{nick}@{nick}.tmi.twitch.tv PART {channel}"
+		elif kind < 0.045:
+			line = f"@room-id=1337;target-user-id=42;tmi-sent-ts={int(elapsed * 1000)} :tmi.twitch.tv CLEARCHAT {channel} :{nick}"
+		else:
+			words = [generator.choice(WORDS) for _ in range(generator.randint(1, 12))]
+			emotes = []
+			if generator.random() < 0.2:
+				emote_id, emote = generator.choice(EMOTES)
+				position = sum(len(word) + 1 for word in words)
+				emotes.append(f"{emote_id}:{position}-{position + len(emote) - 1}")
+				words.append(emote)
+			extra = generator.random()
+			if extra < 0.02:
+				words.append("check out scam link www.example.com/free")
+			elif extra < 0.04:
+				words.insert(0, "!ping")
+			elif extra < 0.05:
+				words.append("@volpesbot")
+			badges = generator.choice(("", "", "", "subscriber/12", "moderator/1,subscriber/24", "vip/1"))
+			tags = (f"badge-info=;badges={badges};color=#1E90FF;display-name={nick.capitalize()};emotes={'/'.join(emotes)};"
+				f"first-msg=0;flags=;id={number:08x}-4977-403a-8a94-33c6bac34fb8;mod={int('moderator' in badges)};room-id=1337;"
+				f"subscriber={int('subscriber' in badges)};tmi-sent-ts={1642696567751 + int(elapsed * 1000)};turbo=0;user-id={number};user-type=")
+			line = f"@{tags} :{nick}!{nick}@{nick}.tmi.twitch.tv PRIVMSG {channel} :{' '.join(words)}"
+		entries.append((elapsed, 0, line))
+	return entries
+
+
+def percentile(sorted_values, fraction):
+	return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# feeds the entries to the bot, returns the latency of each line
+def replay(bot, entries, realtime=False, speed=1):
+	latencies = []
+	start = time.perf_counter()
+	for elapsed, connection, line in entries:
+		if realtime:
+			delay = start + elapsed / speed - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+		if connection not in bot.connections:
+			connection = 0
+		line_start = time.perf_counter()
+		bot.handle_line(line, connection)
+		latencies.append(time.perf_counter() - line_start)
+	return latencies, time.perf_counter() - start
+
+
+# peak bytes allocated while handling each line, and blocks still allocated after the whole replay
+def measure_allocations(bot, entries):
+	gc.collect()
+	blocks_before = sys.getallocatedblocks()
+	tracemalloc.start()
+	peaks = []
+	for elapsed, connection, line in entries:
+		if connection not in bot.connections:
+			connection = 0
+		tracemalloc.reset_peak()
+		before = tracemalloc.get_traced_memory()[0]
+		bot.handle_line(line, connection)
+		peaks.append(tracemalloc.get_traced_memory()[1] - before)
+	tracemalloc.stop()
+	gc.collect()
+	return peaks, sys.getallocatedblocks() - blocks_before
+
+
+def main():
+	parser = argparse.ArgumentParser(description="replays a recording through the bot message path")
+	parser.add_argument("recording", nargs="?", help="a file written with record_file, .gz files are decompressed")
+	parser.add_argument("--synthetic", type=int, default=20000, help="lines of synthetic chat used without a recording")
+	parser.add_argument("--realtime", action="store_true", help="keep the timing of the recording")
+	parser.add_argument("--speed", type=float, default=1, help="with --realtime, how many times faster than the recording")
+	parser.add_argument("--repeat", type=int, default=3, help="replays of the recording, the first one warms up")
+	parser.add_argument("--allocations", action="store_true", help="also measure the memory allocated for each line")
+	parser.add_argument("--log", action="store_true", help="keep the log output, by default nothing is printed")
+	arguments = parser.parse_args()
+
+	if arguments.recording:
+		entries = list(read_recording(arguments.recording))
+		source = arguments.recording
+	else:
+		entries = synthetic_lines(arguments.synthetic)
+		source = f"{arguments.synthetic} synthetic lines"
+	channels = sorted({parse_message(line).channel for elapsed, connection, line in entries} - {None, "#volpesbot"})
+	channels = [channel for channel in channels if channel.startswith("#")]
+
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory)
+		with open("volpesbot_config.ini", "w", encoding="utf-8") as config_file:
+			config_file.write(CONFIG + "".join(CHANNEL_CONFIG.format(channel=channel) for channel in channels))
+		bot = ReplayBot(headless=True)
+		if not arguments.log:
+			bot.ui_sink.level = LEVEL_OFF
+			bot._update_log_level()
+		bot.connect()
+
+		print(f"replaying {source}, {len(entries)} lines, {len(channels)} channels, {'realtime' if arguments.realtime else 'max speed'}")
+		for number in range(max(1, arguments.repeat)):
+			latencies, seconds = replay(bot, entries, arguments.realtime, arguments.speed)
+			latencies.sort()
+			label = "warmup" if number == 0 and arguments.repeat > 1 else f"run {number}"
+			print(f"{label:>7}: {len(latencies) / seconds:9.0f} lines/s, p50 {percentile(latencies, 0.5) * 1000000:6.1f}us, "
+				f"p99 {percentile(latencies, 0.99) * 1000000:6.1f}us, max {latencies[-1] * 1000000:8.1f}us")
+
+		if arguments.allocations:
+			peaks, retained_blocks = measure_allocations(bot, entries)
+			peaks.sort()
+			print(f"allocated per line: mean {sum(peaks) / len(peaks):.0f} bytes, p99 {percentile(peaks, 0.99)} bytes, "
+				f"blocks retained per line: {retained_blocks / len(entries):.2f}")
+
+		bot.send_scheduler.flush(1)
+		written = sum(len(connection.written) for connection in bot.connections.values())
+		print(f"lines written by the bot: {written}, still queued: {bot.send_scheduler.queue_depths()}")
+		os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == "__main__":
+	main()
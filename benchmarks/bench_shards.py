@@ -0,0 +1,57 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+# how evenly HashRing spreads the channels over the workers and how many of them move to another worker when one is added,
+# against hashing the channel modulo the number of workers
+# usage: python benchmarks/bench_shards.py [channels]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shards import *
+
+
+def modulo_owner(workers):
+	return lambda channel: stable_hash(channel) % workers
+
+
+def ring_owner(workers):
+	return HashRing(range(workers)).node_for
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	channels = [f"#channel{number}" for number in range(count)]
+	print(f"{count} channels, moved is the share that changes worker when one more is added, ideal 1/(workers+1)")
+	print(f"{'workers':>7} {'method':>7} {'min share':>10} {'max share':>10} {'moved':>7} {'ideal':>7} {'lookup us':>10}")
+	for workers in (2, 4, 8, 16):
+		for method, owner in (("modulo", modulo_owner), ("ring", ring_owner)):
+			node_for = owner(workers)
+			start = time.perf_counter()
+			before = [node_for(channel) for channel in channels]
+			lookup = (time.perf_counter() - start) / count * 1000000
+			after = list(map(owner(workers + 1), channels))
+			moved = sum(old != new for old, new in zip(before, after)) / count
+			shares = [before.count(node) / count for node in range(workers)]
+			print(f"{workers:7} {method:>7} {min(shares):10.1%} {max(shares):10.1%} {moved:7.1%} {1 / (workers + 1):7.1%} {lookup:10.2f}")
+
+
+if __name__ == "__main__":
+	main()
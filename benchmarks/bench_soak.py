@@ -0,0 +1,152 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# runs "volpesbot.py --headless" against benchmarks/fake_twitch.py and samples its memory, throughput and queues
+# usage: python benchmarks/bench_soak.py [--channels 200] [--chatters 5000] [--rate 500] [--duration 120] [--interval 10] [--async]
+# [--workers N]
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_twitch import FakeTwitchServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """[DEFAULT]
+server = 127.0.0.1
+port = {port}
+bot_nick = volpesbot
+bot_user = volpesbot
+bot_name = volpesbot
+bot_owner = volpesbot
+bot_password = oauth:soak
+trigger = !
+verbose_log = no
+metrics_port = {metrics_port}
+metrics_interval = {interval}
+
+[#volpesbot]
+connect_on_startup = yes
+trigger = !
+"""
+
+CHANNEL_CONFIG = """
+[#soak{number}]
+connect_on_startup = yes
+trigger = !
+block_urls = yes
+banned_phrases = badword|scam link
+mime_emotes = Kappa|PogChamp
+mime_emotes_cooldown = 30
+"""
+
+
+def free_port():
+	with socket.socket() as probe:
+		probe.bind(("127.0.0.1", 0))
+		return probe.getsockname()[1]
+
+
+# resident memory of the process in KiB, only on linux
+def resident_memory(pid):
+	try:
+		with open(f"/proc/{pid}/status") as status:
+			for line in status:
+				if line.startswith("VmRSS:"):
+					return int(line.split()[1])
+	except OSError:
+		return None
+
+
+def bot_metrics(metrics_port):
+	try:
+		with urllib.request.urlopen(f"http://127.0.0.1:{metrics_port}/metrics.json", timeout=2) as response:
+			return json.load(response)
+	except OSError:
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description="soak test of the bot against the fake twitch server")
+	parser.add_argument("--channels", type=int, default=200)
+	parser.add_argument("--chatters", type=int, default=5000)
+	parser.add_argument("--rate", type=float, default=500, help="chat lines per second over all the channels")
+	parser.add_argument("--mod-fraction", type=float, default=0.5)
+	parser.add_argument("--duration", type=float, default=120, help="seconds")
+	parser.add_argument("--interval", type=float, default=10, help="seconds between samples")
+	parser.add_argument("--ping-interval", type=float, default=30)
+	parser.add_argument("--async", dest="use_async", action="store_true", help="run the bot with --async")
+	parser.add_argument("--workers", type=int, default=0, help="run the bot with --workers, the rss is the one of the coordinator")
+	arguments = parser.parse_args()
+
+	server = FakeTwitchServer(chatters=arguments.chatters, rate=arguments.rate, mod_fraction=arguments.mod_fraction,
+		ping_interval=arguments.ping_interval)
+	server.run_in_thread()
+	metrics_port = free_port()
+
+	with tempfile.TemporaryDirectory() as directory:
+		with open(os.path.join(directory, "volpesbot_config.ini"), "w", encoding="utf-8") as config_file:
+			config_file.write(CONFIG.format(port=server.port, metrics_port=metrics_port, interval=arguments.interval))
+			config_file.write("".join(CHANNEL_CONFIG.format(number=number) for number in range(arguments.channels)))
+		command = [sys.executable, os.path.join(ROOT, "volpesbot.py"), "--headless"] + (["--async"] if arguments.use_async else [])
+		if arguments.workers:
+			command += ["--workers", str(arguments.workers)]
+		bot = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		print(f"bot pid {bot.pid}, {arguments.channels} channels, {arguments.chatters} chatters, {arguments.rate:g} lines/s")
+		print(f"{'time':>6} {'rss KiB':>9} {'lines/s':>9} {'p99 us':>8} {'send queue':>24} {'channels':>8} {'sent':>8} {'violations':>10}")
+
+		samples = []
+		start = time.monotonic()
+		try:
+			while time.monotonic() - start < arguments.duration and bot.poll() is None:
+				time.sleep(arguments.interval)
+				rss = resident_memory(bot.pid)
+				metrics = bot_metrics(metrics_port) or {}
+				rates = metrics.get("rates", {})
+				lines_per_second = sum(rate for name, rate in rates.items() if name.startswith("lines."))
+				handler = metrics.get("histograms", {}).get("handler.PRIVMSG", {})
+				queue = metrics.get("gauges", {}).get("queue.send", {})
+				stats = server.stats()
+				samples.append(rss)
+				violations = stats["privmsg_violations"] + stats["join_violations"]
+				print(f"{time.monotonic() - start:6.0f} {rss if rss is not None else 'n/a':>9} {lines_per_second:9.0f} "
+					f"{handler.get('p99', 0) * 1000000:8.0f} {str(queue):>24} {stats['channels']:8} {stats['sent']:8} {violations:10}")
+		finally:
+			bot.terminate()
+			try:
+				bot.wait(15)
+			except subprocess.TimeoutExpired:
+				bot.kill()
+
+	print(server.format_stats())
+	measured = [rss for rss in samples[1:] if rss is not None]
+	if len(measured) >= 2:
+		print(f"memory growth after the first sample: {measured[-1] - measured[0]} KiB over {len(measured) - 1} samples")
+	if bot.returncode not in (0, None, -15):
+		print(f"the bot exited with {bot.returncode}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,81 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# measures the cold start of "volpesbot.py --headless" until it sends CAP REQ to a local server
+# usage: python benchmarks/bench_startup.py [runs] [--async]
+
+import os
+import sys
+import socket
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from volpesbot_irc import IRCBot
+
+CONFIG = """[DEFAULT]
+server = 127.0.0.1
+port = {port}
+bot_nick = volpesbot
+bot_user = volpesbot
+bot_name = volpesbot
+bot_owner = volpesbot
+bot_password = oauth:benchmark
+trigger = !
+verbose_log = no
+
+[#volpesbot]
+connect_on_startup = yes
+trigger = !
+"""
+
+
+# seconds from starting the process to receiving CAP REQ
+def run_once(directory, server, extra_args):
+	start = time.perf_counter()
+	process = subprocess.Popen([sys.executable, os.path.join(ROOT, "volpesbot.py"), "--headless"] + extra_args,
+		cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	try:
+		connection, address = server.accept()
+		with connection:
+			for line in connection.makefile("rb"):
+				if line.startswith(b"CAP REQ"):
+					return time.perf_counter() - start
+		raise RuntimeError("the bot closed the connection before sending CAP REQ")
+	finally:
+		process.terminate()
+		process.wait()
+
+
+def main():
+	runs = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 10
+	extra_args = ["--async"] if "--async" in sys.argv else []
+
+	with tempfile.TemporaryDirectory() as directory, socket.create_server(("127.0.0.1", 0)) as server:
+		server.settimeout(10)
+		with open(os.path.join(directory, "volpesbot_config.ini"), "w") as file:
+			file.write(CONFIG.format(port=server.getsockname()[1]))
+		times = sorted(run_once(directory, server, extra_args) for _ in range(runs))
+
+	print(f"cold start to CAP REQ over {runs} runs: min {times[0] * 1000:.0f}ms, median {times[runs // 2] * 1000:.0f}ms, max {times[-1] * 1000:.0f}ms")
+	print(f"budget: {IRCBot.STARTUP_BUDGET * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,61 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+# many timers over many channels on the one TimerScheduler thread: how late they fire and what adding one costs
+# usage: python benchmarks/bench_timers.py [timers]
+
+import os
+import sys
+import time
+import random
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timerscheduler import *
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	generator = random.Random(1)
+	lateness = []
+	done = threading.Event()
+
+	def fired(due):
+		lateness.append(time.monotonic() - due)
+		if len(lateness) == count:
+			done.set()
+
+	threads = threading.active_count()
+	scheduler = TimerScheduler(lambda channel, message: None)
+	start = time.perf_counter()
+	for number in range(count):
+		delay = generator.uniform(0.5, 3)
+		scheduler.once(f"#channel{number % 1000}", delay, function=lambda due=time.monotonic() + delay: fired(due))
+	added = (time.perf_counter() - start) / count * 1000000
+	# timers cancelled before firing are skipped without waking the thread for them
+	for timer in [scheduler.every("#channel0", 1, "cancelled") for _ in range(count)]:
+		timer.cancel()
+	print(f"{count} timers over 1000 channels, {threading.active_count() - threads} thread for all of them, {added:.1f}us to add one")
+	done.wait(10)
+	lateness.sort()
+	print(f"fired {len(lateness)}, late by p50 {lateness[len(lateness) // 2] * 1000:.2f}ms "
+		f"p99 {lateness[len(lateness) * 99 // 100] * 1000:.2f}ms max {lateness[-1] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,131 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+# syscalls and time per line of IRCConnection against the makefile reader and the sendall per line it replaced
+# reading: a loopback socket receives synthetic twitch lines as fast as the kernel delivers them
+# writing: bursts of lines like the send scheduler releases after a wait, and lines paced 1ms apart
+# usage: python benchmarks/bench_transport.py [lines]
+
+import os
+import sys
+import time
+import socket
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ircconnection import *
+from bench_replay import synthetic_lines
+
+
+# counts the calls that end up as syscalls
+class CountingSocket(socket.socket):
+
+	recv_calls = 0
+	send_calls = 0
+
+	def recv_into(self, *args):
+		self.recv_calls += 1
+		return super().recv_into(*args)
+
+
+	def sendall(self, *args):
+		self.send_calls += 1
+		return super().sendall(*args)
+
+
+# a connected loopback pair, the first one counts its syscalls
+def socket_pair():
+	with socket.create_server(("127.0.0.1", 0)) as listener:
+		client = socket.create_connection(listener.getsockname())
+		server, _ = listener.accept()
+	return CountingSocket(fileno=client.detach()), server
+
+
+# on_line(connection, line) like the one of the bot
+def old_read(connection, on_line):
+	handle = connection.makefile(mode="r", encoding="utf-8", errors="replace", newline="\r\n")
+	for line in handle:
+		on_line(connection, line)
+
+
+def new_read(connection, on_line):
+	transport = IRCConnection(0, None, None, on_line, lambda transport, error: None)
+	transport.socket = connection
+	transport._read()
+
+
+def measure_read(read, data, count):
+	connection, server = socket_pair()
+	received = []
+	sender = threading.Thread(target=lambda: (server.sendall(data), server.close()))
+	start = time.perf_counter()
+	sender.start()
+	read(connection, lambda connection, line: received.append(line))
+	elapsed = time.perf_counter() - start
+	sender.join()
+	connection.close()
+	assert len(received) == count, len(received)
+	return connection.recv_calls / count, elapsed / count * 1000000
+
+
+def measure_write(new, lines, burst, pause):
+	connection, server = socket_pair()
+	drain = threading.Thread(target=lambda: [None for _ in iter(lambda: server.recv(65536), b"")], daemon=True)
+	drain.start()
+	transport = None
+	if new:
+		transport = IRCConnection(0, None, None, lambda transport, line: None, lambda transport, error: None)
+		transport.socket = connection
+		transport.writer = threading.Thread(target=transport._write_queued, daemon=True)
+		transport.writer.start()
+	start = time.perf_counter()
+	for number, line in enumerate(lines):
+		if new:
+			transport.write(line)
+		else:
+			connection.sendall((line + "\r\n").encode("utf-8"))
+		if pause and number % burst == burst - 1:
+			time.sleep(pause)
+	if new:
+		transport.flush(10)
+		transport.close()
+	elapsed = time.perf_counter() - start
+	connection.close()
+	return connection.send_calls / len(lines), elapsed / len(lines) * 1000000
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	lines = [line for _, _, line in synthetic_lines(count)]
+	count = len(lines)
+	data = ("\r\n".join(lines) + "\r\n").encode("utf-8")
+	print(f"{count} lines, {len(data) / count:.0f} bytes on average")
+	print(f"{'':>26} {'old syscalls/line':>18} {'new syscalls/line':>18} {'old us/line':>12} {'new us/line':>12}")
+	old_calls, old_time = measure_read(old_read, data, count)
+	new_calls, new_time = measure_read(new_read, data, count)
+	print(f"{'read':>26} {old_calls:18.3f} {new_calls:18.3f} {old_time:12.2f} {new_time:12.2f}")
+	outgoing = [f"PRIVMSG #channel{number % 50} :reply number {number}" for number in range(count // 10)]
+	for name, burst, pause in (("write, bursts of 20", 20, 0.005), ("write, 1ms apart", 1, 0.001)):
+		old_calls, old_time = measure_write(False, outgoing[:2000] if burst == 1 else outgoing, burst, pause)
+		new_calls, new_time = measure_write(True, outgoing[:2000] if burst == 1 else outgoing, burst, pause)
+		print(f"{name:>26} {old_calls:18.3f} {new_calls:18.3f} {old_time:12.2f} {new_time:12.2f}")
+
+
+if __name__ == "__main__":
+	main()
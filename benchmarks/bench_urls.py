@@ -0,0 +1,88 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# compares URLDetector with the regex previously used for block_urls, on benchmarks/corpus/urls.txt and on adversarial lines
+# usage: python benchmarks/bench_urls.py [iterations]
+
+import os
+import sys
+import re
+import timeit
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+from urldetector import *
+
+# https://mathiasbynens.be/demo/url-regex
+REGEX_URL = re.compile("(?i)(?:\\s|\\A|\\b)(?:(?:https?://)?(?P<url>(?:[^\\s/$.?#][^\\s/]*)(\\.[^.\\s]+)))(?:\\s|\\A|\\b)")
+
+# long spam lines, the size of a twitch message is at most 500 characters
+# the regex backtracks over the whole rest of the line at every position of the ones without a dot after a separator
+ADVERSARIAL = {
+	"dots": lambda length: "a." * (length // 2),
+	"dots and spaces": lambda length: "a. " * (length // 3),
+	"hashes": lambda length: "#a" * (length // 2),
+	"dollars": lambda length: "a$?" * (length // 3),
+	"no dots": lambda length: "a" * length,
+}
+
+
+def read_corpus():
+	corpus = []
+	with open(os.path.join(BENCHMARKS, "corpus", "urls.txt"), encoding="utf-8") as corpus_file:
+		for line in corpus_file:
+			if line.startswith("#") or not line.strip():
+				continue
+			expected, message = line.rstrip("\n").split("\t", 1)
+			corpus.append((expected == "1", message))
+	return corpus
+
+
+def accuracy(search, corpus):
+	missed = [message for has_link, message in corpus if has_link and search(message) is None]
+	flagged = [message for has_link, message in corpus if not has_link and search(message) is not None]
+	return missed, flagged
+
+
+def main():
+	iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	detector = URLDetector()
+	corpus = read_corpus()
+
+	for name, search in (("regex", REGEX_URL.search), ("detector", detector.search)):
+		missed, flagged = accuracy(search, corpus)
+		seconds = timeit.timeit(lambda: [search(message) for has_link, message in corpus], number=iterations)
+		print(f"{name:>8}: {seconds / iterations / len(corpus) * 1000000:.2f} us/line on {len(corpus)} corpus lines, "
+			f"{len(missed)} links missed, {len(flagged)} lines wrongly flagged")
+		for message in missed:
+			print(f"          missed: {message}")
+		for message in flagged:
+			print(f"          flagged: {message}")
+
+	print("adversarial lines, ms per line by length:")
+	for name, make_line in ADVERSARIAL.items():
+		for search_name, search in (("regex", REGEX_URL.search), ("detector", detector.search)):
+			times = []
+			for length in (500, 1000, 2000, 4000):
+				line = make_line(length)
+				number = 3 if search_name == "regex" else 100
+				times.append(f"{length}: {timeit.timeit(lambda: search(line), number=number) / number * 1000:8.3f}")
+			print(f"  {name:>15} {search_name:>8}  " + "  ".join(times))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,331 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# a local stand-in for irc.chat.twitch.tv for load and soak tests, see benchmarks/bench_soak.py
+# answers the CAP/PASS/NICK/USER handshake, JOIN/PART and PING like twitch, sends PINGs and expects the PONGs
+# simulated chatters write tagged PRIVMSGs in every joined channel, the lines sent by the bot are checked against the twitch rate limits
+# usage: python benchmarks/fake_twitch.py [--port 6667] [--chatters 5000] [--rate 200] [--mod-fraction 0.5]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import threading
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ircmessage import *
+
+WORDS = ("the", "run", "is", "going", "great", "what", "a", "split", "reset", "pb", "gg", "chat", "hello", "lol", "nice",
+	"that", "was", "close", "any%", "glitch", "skip", "frame", "perfect", "wr", "pace")
+EMOTES = (("25", "Kappa"), ("88", "PogChamp"), ("425618", "LUL"), ("354", "4Head"))
+
+
+# a connection from the bot
+class FakeClient():
+
+	def __init__(self, number, writer):
+		self.number = number
+		self.writer = writer
+		self.nick = None
+		self.channels = set()
+		self.ping_sent = None
+		# a silent client is still open but nothing is sent to it or answered, see freeze_connections
+		self.silent = False
+
+
+	def send(self, line):
+		if not self.silent:
+			self.writer.write((line + "\r\n").encode("utf-8"))
+
+
+class FakeTwitchServer():
+
+	def __init__(self, port=0, chatters=5000, rate=200, mod_fraction=0.5, ping_interval=60, seed=1,
+			user_limit=20, mod_limit=100, time_unit=30, join_limit=20, join_time_unit=10):
+		self.port = port
+		self.chatters = chatters
+		self.rate = rate
+		self.mod_fraction = mod_fraction
+		self.ping_interval = ping_interval
+		self.random = random.Random(seed)
+		self.user_limit = user_limit
+		self.mod_limit = mod_limit
+		self.time_unit = time_unit
+		self.join_limit = join_limit
+		self.join_time_unit = join_time_unit
+		self.clients = {}
+		self.next_client = 0
+		# (client, channel) of every joined channel, the chatters write in these
+		self.joined = []
+		self.mod_channels = set()
+		# the times of the PRIVMSGs and JOINs of the bot account in the last time_unit, in total and by channel
+		self.privmsg_times = collections.deque()
+		self.channel_privmsg_times = collections.defaultdict(collections.deque)
+		self.join_times = collections.deque()
+		self.started = time.monotonic()
+		self.sent = 0
+		self.received = collections.Counter()
+		self.privmsg_violations = 0
+		self.join_violations = 0
+		self.pong_times = []
+		self.missed_pongs = 0
+		self.message_id = 0
+		self.loop = None
+		self.ready = threading.Event()
+
+
+	# starts the server on its own event loop thread and returns once it's listening
+	def run_in_thread(self):
+		thread = threading.Thread(target=lambda: asyncio.run(self.serve()), name="fake twitch", daemon=True)
+		thread.start()
+		self.ready.wait()
+		return thread
+
+
+	async def serve(self):
+		self.loop = asyncio.get_running_loop()
+		server = await asyncio.start_server(self._handle_client, "127.0.0.1", self.port)
+		self.port = server.sockets[0].getsockname()[1]
+		self.ready.set()
+		async with server:
+			await asyncio.gather(self._chat_loop(), self._ping_loop())
+
+
+	def stats(self):
+		pong_times = sorted(self.pong_times)
+		return {
+			"uptime": time.monotonic() - self.started,
+			"connections": len(self.clients),
+			"channels": len(self.joined),
+			"sent": self.sent,
+			"received": dict(self.received),
+			"privmsg_violations": self.privmsg_violations,
+			"join_violations": self.join_violations,
+			"pong_p50": pong_times[len(pong_times) // 2] if pong_times else None,
+			"pong_max": pong_times[-1] if pong_times else None,
+			"missed_pongs": self.missed_pongs,
+		}
+
+
+	def format_stats(self):
+		stats = self.stats()
+		received = ", ".join(f"{cmd} {count}" for cmd, count in sorted(stats["received"].items()))
+		pong = "no pongs" if stats["pong_max"] is None else f"pong p50 {stats['pong_p50'] * 1000:.1f}ms max {stats['pong_max'] * 1000:.1f}ms"
+		return (f"{stats['uptime']:.0f}s: {stats['connections']} connections, {stats['channels']} channels, {stats['sent']} lines sent, "
+			f"received: {received or 'nothing'}, rate limit violations: {stats['privmsg_violations']} PRIVMSG {stats['join_violations']} JOIN, "
+			f"{pong}, {stats['missed_pongs']} missed")
+
+
+	# called from other threads to see how the bot recovers, see benchmarks/bench_reconnect.py
+	# closes every connection like a network failure would
+	def drop_connections(self):
+		self.loop.call_soon_threadsafe(self._for_every_client, lambda client: client.writer.transport.abort())
+
+
+	# asks every connection to reconnect like twitch does before restarting a server
+	def send_reconnect(self):
+		self.loop.call_soon_threadsafe(self._for_every_client, lambda client: client.send(":tmi.twitch.tv RECONNECT"))
+
+
+	# the connections stay open but go quiet, like a connection that died without being closed
+	def freeze_connections(self):
+		self.loop.call_soon_threadsafe(self._for_every_client, lambda client: setattr(client, "silent", True))
+
+
+	def _for_every_client(self, function):
+		for client in list(self.clients.values()):
+			function(client)
+
+
+	async def _handle_client(self, reader, writer):
+		client = FakeClient(self.next_client, writer)
+		self.next_client += 1
+		self.clients[client.number] = client
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				if not client.silent:
+					self._handle_line(client, parse_message(line.decode("utf-8", errors="replace")))
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			del self.clients[client.number]
+			self.joined = [(other, channel) for other, channel in self.joined if other is not client]
+			writer.close()
+
+
+	def _handle_line(self, client, message):
+		cmd = message.cmd
+		self.received[cmd] += 1
+		if cmd == "CAP":
+			client.send(":tmi.twitch.tv CAP * ACK :twitch.tv/tags twitch.tv/commands")
+		elif cmd == "NICK":
+			client.nick = message.channel
+			for number, text in (("001", "Welcome, GLHF!"), ("002", "Your host is tmi.twitch.tv"), ("003", "This server is rather new"),
+					("004", "-"), ("375", "-"), ("372", "You are in a maze of twisty passages, all alike."), ("376", ">")):
+				client.send(f":tmi.twitch.tv {number} {client.nick} :{text}")
+		elif cmd == "JOIN":
+			for channel in message.channel.split(","):
+				self._check_join_limit()
+				self._join(client, channel)
+		elif cmd == "PART":
+			for channel in message.channel.split(","):
+				if channel in client.channels:
+					client.channels.discard(channel)
+					self.joined.remove((client, channel))
+					client.send(f":{client.nick}!{client.nick}@{client.nick}.tmi.twitch.tv PART {channel}")
+		elif cmd == "PING":
+			client.send(f":tmi.twitch.tv PONG tmi.twitch.tv :{message.msg}")
+		elif cmd == "PONG":
+			if client.ping_sent is not None:
+				self.pong_times.append(time.monotonic() - client.ping_sent)
+				client.ping_sent = None
+		elif cmd == "PRIVMSG":
+			self._check_privmsg_limit(message.channel)
+			client.send(self._userstate(client, message.channel))
+
+
+	def _join(self, client, channel):
+		if channel in client.channels:
+			return
+		client.channels.add(channel)
+		self.joined.append((client, channel))
+		# the bot is the broadcaster in its own channel
+		if channel == f"#{client.nick}" or self.random.random() < self.mod_fraction:
+			self.mod_channels.add(channel)
+		nick = client.nick
+		client.send(f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN {channel}")
+		client.send(f":{nick}.tmi.twitch.tv 353 {nick} = {channel} :{nick}")
+		client.send(f":{nick}.tmi.twitch.tv 366 {nick} {channel} :End of /NAMES list")
+		client.send(self._userstate(client, channel))
+		client.send(f"@emote-only=0;followers-only=-1;r9k=0;room-id={abs(hash(channel)) % 100000000};slow=0;subs-only=0 :tmi.twitch.tv ROOMSTATE {channel}")
+
+
+	def _userstate(self, client, channel):
+		if channel in self.mod_channels:
+			return f"@badge-info=;badges=moderator/1;color=;display-name={client.nick};emote-sets=0;mod=1;subscriber=0;user-type=mod :tmi.twitch.tv USERSTATE {channel}"
+		return f"@badge-info=;badges=;color=;display-name={client.nick};emote-sets=0;mod=0;subscriber=0;user-type= :tmi.twitch.tv USERSTATE {channel}"
+
+
+	# in any time_unit seconds a channel gets up to 100 messages where the bot is a moderator and 20 in the others
+	# and the account sends up to 100 in total
+	def _check_privmsg_limit(self, channel):
+		limit = self.mod_limit if channel in self.mod_channels else self.user_limit
+		channel_exceeded = self._count_in_window(self.channel_privmsg_times[channel], self.time_unit) > limit
+		if self._count_in_window(self.privmsg_times, self.time_unit) > self.mod_limit or channel_exceeded:
+			self.privmsg_violations += 1
+
+
+	def _check_join_limit(self):
+		if self._count_in_window(self.join_times, self.join_time_unit) > self.join_limit:
+			self.join_violations += 1
+
+
+	# adds now to the times and returns how many are in the last time_unit seconds
+	@staticmethod
+	def _count_in_window(times, time_unit):
+		now = time.monotonic()
+		while times and now - times[0] > time_unit:
+			times.popleft()
+		times.append(now)
+		return len(times)
+
+
+	def _chat_line(self, channel):
+		self.message_id += 1
+		nick = f"chatter{self.random.randrange(self.chatters)}"
+		words = [self.random.choice(WORDS) for _ in range(self.random.randint(1, 12))]
+		emotes = ""
+		if self.random.random() < 0.2:
+			emote_id, emote = self.random.choice(EMOTES)
+			position = sum(len(word) + 1 for word in words)
+			emotes = f"{emote_id}:{position}-{position + len(emote) - 1}"
+			words.append(emote)
+		extra = self.random.random()
+		if extra < 0.01:
+			words.append("www.example.com/free")
+		elif extra < 0.015:
+			words.insert(0, "!ping")
+		badges = self.random.choice(("", "", "", "subscriber/12", "moderator/1,subscriber/24", "vip/1"))
+		tags = (f"badge-info=;badges={badges};color=#1E90FF;display-name={nick.capitalize()};emotes={emotes};first-msg=0;flags=;"
+			f"id={self.message_id:08x}-4977-403a-8a94-33c6bac34fb8;mod={int('moderator' in badges)};room-id=1337;"
+			f"subscriber={int('subscriber' in badges)};tmi-sent-ts={int(time.time() * 1000)};turbo=0;user-id={self.message_id};user-type=")
+		return f"@{tags} :{nick}!{nick}@{nick}.tmi.twitch.tv PRIVMSG {channel} :{' '.join(words)}"
+
+
+	# writes rate lines per second spread over the joined channels
+	async def _chat_loop(self, tick=0.05):
+		owed = 0
+		while True:
+			await asyncio.sleep(tick)
+			if not self.joined:
+				continue
+			owed += self.rate * tick
+			touched = set()
+			while owed >= 1:
+				owed -= 1
+				client, channel = self.random.choice(self.joined)
+				client.send(self._chat_line(channel))
+				touched.add(client)
+				self.sent += 1
+			for client in touched:
+				try:
+					await client.writer.drain()
+				except ConnectionError:
+					pass
+
+
+	async def _ping_loop(self):
+		while True:
+			await asyncio.sleep(self.ping_interval)
+			for client in list(self.clients.values()):
+				# twitch closes the connection if the PONG doesnt arrive, here it's only counted
+				if client.ping_sent is not None:
+					self.missed_pongs += 1
+				client.ping_sent = time.monotonic()
+				client.send("PING :tmi.twitch.tv")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="local stand-in for the twitch irc server")
+	parser.add_argument("--port", type=int, default=6667)
+	parser.add_argument("--chatters", type=int, default=5000, help="simulated chatters")
+	parser.add_argument("--rate", type=float, default=200, help="chat lines per second over all the joined channels")
+	parser.add_argument("--mod-fraction", type=float, default=0.5, help="fraction of the channels where the bot is a moderator")
+	parser.add_argument("--ping-interval", type=float, default=60)
+	parser.add_argument("--report-interval", type=float, default=10)
+	arguments = parser.parse_args()
+
+	server = FakeTwitchServer(arguments.port, arguments.chatters, arguments.rate, arguments.mod_fraction, arguments.ping_interval)
+	server.run_in_thread()
+	print(f"listening on 127.0.0.1:{server.port}")
+	try:
+		while True:
+			time.sleep(arguments.report_interval)
+			print(server.format_stats())
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,45 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+
+
+# the settings of a channel converted to the right types and the regexes built from them
+# a new object is made every time the section of the channel changes, so an object is never modified after it's made
+class ChannelSettings():
+
+	__slots__ = ("channel", "trigger", "connect_on_startup", "block_urls", "command",
+		"banned_phrases", "mime_emotes", "flood_guard")
+
+	# banned_phrases, mime_emotes and flood_guard are made by the bot, so a matcher with thousands of phrases isnt rebuilt
+	# and the state of the others isnt reset with every change of the settings
+	def __init__(self, config, channel, banned_phrases=None, mime_emotes=None, flood_guard=None):
+		self.channel = channel
+		self.trigger = config.get(channel, "trigger")
+		self.connect_on_startup = config.getboolean(channel, "connect_on_startup", fallback=False)
+		self.block_urls = config.getboolean(channel, "block_urls", fallback=False)
+
+		# the trigger is a literal string, symbols like ? or $ would otherwise be read as regex syntax
+		self.command = re.compile("^" + re.escape(self.trigger) + "(?P<command>\\S+)(?:\\s+(?P<param>.+?))?\\s*$", flags=re.IGNORECASE)
+
+		# a PhraseMatcher or a regex, both have a search method that returns None if there is no banned phrase
+		self.banned_phrases = banned_phrases
+
+		# a MimeEngine or None
+		self.mime_emotes = mime_emotes
+
+		# a FloodGuard or None
+		self.flood_guard = flood_guard
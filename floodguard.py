@@ -0,0 +1,91 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import collections
+
+# appended by some chat clients to send the same message twice
+DUPLICATE_BYPASS = str.maketrans({"\U000e0000": None, "\u034f": None, "\u200b": None})
+
+
+# the recent messages of a chatter in two fixed size rings, the oldest entry is overwritten
+class ChatterHistory():
+
+	__slots__ = ("times", "times_index", "hashes", "hashes_index")
+
+	def __init__(self, flood_messages, duplicate_history):
+		# the times of the last flood_messages messages, None until there are that many
+		self.times = [None] * flood_messages
+		self.times_index = 0
+		self.hashes = [None] * duplicate_history
+		self.hashes_index = 0
+
+
+# finds chatters that send too many messages or the same message again and again, a FloodGuard is made for each channel
+# every message costs the same no matter how many chatters there are, the chatters not seen recently are forgotten first
+class FloodGuard():
+
+	def __init__(self, flood_messages=0, flood_seconds=10, duplicate_messages=0, duplicate_history=5,
+			action="delete", timeout=60, max_chatters=5000):
+		# more than flood_messages messages in flood_seconds is a flood, 0 turns it off
+		self.flood_messages = flood_messages
+		self.flood_seconds = flood_seconds
+		# the same message duplicate_messages times in the last duplicate_history messages of a chatter, 0 turns it off
+		self.duplicate_messages = duplicate_messages
+		self.duplicate_history = max(duplicate_history, duplicate_messages)
+		self.action = action
+		self.timeout = timeout
+		self.max_chatters = max_chatters
+		# nick: ChatterHistory, the least recently seen first
+		self.chatters = collections.OrderedDict()
+		self.floods = 0
+		self.duplicates = 0
+
+
+	# returns "flood", "duplicate message" or None, now is in seconds
+	def check(self, nick, msg, now):
+		history = self.chatters.get(nick)
+		if history is None:
+			history = self.chatters[nick] = ChatterHistory(self.flood_messages, self.duplicate_history if self.duplicate_messages else 0)
+			if len(self.chatters) > self.max_chatters:
+				self.chatters.popitem(last=False)
+		else:
+			self.chatters.move_to_end(nick)
+
+		reason = None
+		if self.flood_messages:
+			# the message flood_messages messages ago, if it's recent this one is one too many
+			oldest = history.times[history.times_index]
+			history.times[history.times_index] = now
+			history.times_index = (history.times_index + 1) % self.flood_messages
+			if oldest is not None and now - oldest < self.flood_seconds:
+				reason = "flood"
+				self.floods += 1
+
+		if self.duplicate_messages:
+			message_hash = hash(" ".join(msg.translate(DUPLICATE_BYPASS).casefold().split()))
+			history.hashes[history.hashes_index] = message_hash
+			history.hashes_index = (history.hashes_index + 1) % self.duplicate_history
+			if reason is None and history.hashes.count(message_hash) >= self.duplicate_messages:
+				reason = "duplicate message"
+				self.duplicates += 1
+
+		return reason
+
+
+	# after a timeout the chatter starts over
+	def forget(self, nick):
+		self.chatters.pop(nick, None)
@@ -0,0 +1,158 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import sys
+import datetime
+import threading
+import signal
+import socketserver
+from logsink import *
+
+
+# writes the console lines from its own thread, a slow or blocked console doesnt hold up the thread that prints
+class ConsoleWriter(QueuedSink):
+
+	def __init__(self, stream=None, flush_interval=0.1, max_pending=10000):
+		QueuedSink.__init__(self, "the console", flush_interval=flush_interval, max_pending=max_pending, max_batch=max_pending)
+		self.stream = sys.stdout if stream is None else stream
+		self._start_writer("console writer")
+
+
+	def write(self, line):
+		self._queue(line)
+
+
+	def _write_batch(self, batch):
+		try:
+			self.stream.write("".join(batch))
+			self.stream.flush()
+		# the console is gone, theres nowhere to print to
+		except (OSError, ValueError):
+			pass
+
+# replaces the ui when running without a display, prints to the console instead
+class HeadlessUI():
+
+	# stands in for the tk root, quit and restart close the ui with root.quit()
+	# which prints what is left in the console writer
+	class Root():
+
+		def __init__(self, console):
+			self.console = console
+
+
+		def quit(self):
+			self.console.close()
+
+
+	def __init__(self):
+		# the lines are printed from the connection and command threads, the writer keeps them in order
+		self.console = ConsoleWriter()
+		self.root = self.Root(self.console)
+		self.ui_ready = threading.Event()
+		self.quit_var = threading.Event()
+		self.restart_var = threading.Event()
+		self.ui_ready.set()
+
+
+	def print_PRIVMSG(self, channel, nick, message, nick_color=""):
+		self._print(f"<{channel}> {nick}: {message}")
+
+
+	def print_warning(self, message):
+		self._print(f"WARNING {message}")
+
+
+	def print_info(self, message):
+		self._print(message)
+
+
+	def print_NOTICE(self, channel, message):
+		self._print(f"<{channel}> {message}")
+
+
+	def print_log(self, message):
+		self._print(message)
+
+
+	def print_WHISPER(self, nick, message, nick_color=""):
+		self._print(f"Whisper from {nick}: {message}")
+
+
+	def _print(self, message):
+		current_time = datetime.datetime.now().strftime("%H:%M:%S")
+		self.console.write(f"{current_time} {message}\n")
+
+
+# SIGTERM and SIGINT quit the bot, SIGHUP restarts it, must be called from the main thread
+def install_signal_handlers(bot):
+
+	def flag_quit(signum, frame):
+		bot.ui.quit_var.set()
+		bot.wake()
+
+	def flag_restart(signum, frame):
+		bot.ui.restart_var.set()
+		bot.wake()
+
+	signal.signal(signal.SIGTERM, flag_quit)
+	signal.signal(signal.SIGINT, flag_quit)
+	# not available on windows
+	if hasattr(signal, "SIGHUP"):
+		signal.signal(signal.SIGHUP, flag_restart)
+
+
+# a line based control port on localhost, "quit", "restart" and "status" control the bot, any other line is sent to the server
+class ControlServer():
+
+	class Handler(socketserver.StreamRequestHandler):
+
+		def handle(self):
+			bot = self.server.bot
+			for line in self.rfile:
+				line = line.decode("utf-8", errors="replace").strip()
+				if not line:
+					continue
+				if line == "quit":
+					bot.ui.quit_var.set()
+					bot.wake()
+					return
+				elif line == "restart":
+					bot.ui.restart_var.set()
+					bot.wake()
+					return
+				elif line == "status":
+					channels = sum(joined for ready, joined, joining, waiting in bot.join_scheduler.status().values())
+					reply = f"connections: {len(bot.connections)}, channels joined: {channels}, queued: {bot.send_scheduler.queue_depths()}"
+				else:
+					bot.send_raw(line)
+					reply = "sent"
+				self.wfile.write(f"{reply}\n".encode("utf-8"))
+
+
+	def __init__(self, bot, port):
+		self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port), self.Handler)
+		self.server.daemon_threads = True
+		self.server.bot = bot
+		self.thread = threading.Thread(target=self.server.serve_forever, name="control server", daemon=True)
+		self.thread.start()
+		bot.log(f"Control port open on 127.0.0.1:{port}", cmd="info")
+
+
+	def close(self):
+		self.server.shutdown()
+		self.server.server_close()
@@ -0,0 +1,160 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+
+import os
+import time
+import sqlite3
+import threading
+from logsink import *
+
+# the lines kept in the history, every other cmd is ignored
+HISTORY_CMDS = ("PRIVMSG", "WHISPER", "NOTICE")
+
+# folded is msg casefolded by python, so a phrase with letters outside ascii is searched the same way it's stored
+# (channel, nick, time) answers the last message of a chatter, (channel, time) the messages of a channel in a time range
+# and (time) the retention
+SCHEMA = (
+	"CREATE TABLE IF NOT EXISTS messages (time REAL NOT NULL, cmd TEXT NOT NULL, channel TEXT, nick TEXT, msg TEXT, folded TEXT)",
+	"CREATE INDEX IF NOT EXISTS messages_channel_nick_time ON messages (channel, nick, time)",
+	"CREATE INDEX IF NOT EXISTS messages_channel_time ON messages (channel, time)",
+	"CREATE INDEX IF NOT EXISTS messages_time ON messages (time)",
+)
+
+
+# keeps the chat lines in a sqlite database, the lines are queued and inserted in batches by a background thread
+# every batch is one transaction and in wal mode the queries of the commands dont wait for it
+# read_only opens a database written by another process, a worker of a sharded bot reads the one of the coordinator
+class HistoryStore(QueuedSink):
+
+	write_errors = (sqlite3.Error, OSError)
+
+	def __init__(self, filename, level=LEVEL_CHAT, keep_days=0, flush_interval=0.5, max_batch=10000, max_pending=100000,
+			read_only=False, log=print):
+		QueuedSink.__init__(self, filename, level, flush_interval, max_pending, max_batch, log)
+		self.filename = filename
+		self.keep_days = keep_days
+		self.database = None
+		self.expired_at = 0
+		# a connection can only be used by the thread that opened it, each thread that queries opens its own
+		self.readers = threading.local()
+		if read_only:
+			return
+		directory = os.path.dirname(filename)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		# the schema exists before any query, the thread only inserts
+		database = self._connect()
+		try:
+			with database:
+				for statement in SCHEMA:
+					database.execute(statement)
+		finally:
+			database.close()
+		self._start_writer("history writer")
+
+
+	# the message is only casefolded by the writer thread
+	def emit(self, level, data, nick, cmd, channel, msg, nick_color):
+		if cmd in HISTORY_CMDS:
+			self._queue((time.time(), cmd, channel or None, nick or None, msg))
+
+
+	def _connect(self, read_only=False):
+		if read_only:
+			return sqlite3.connect(f"file:{self.filename}?mode=ro", uri=True, timeout=5)
+		database = sqlite3.connect(self.filename, timeout=5)
+		database.execute("PRAGMA journal_mode=WAL")
+		# in wal mode a crash can only lose the last transactions, not corrupt the database
+		database.execute("PRAGMA synchronous=NORMAL")
+		return database
+
+
+	def _write_batch(self, batch):
+		if self.database is None:
+			self.database = self._connect()
+		with self.database:
+			self.database.executemany("INSERT INTO messages (time, cmd, channel, nick, msg, folded) VALUES (?, ?, ?, ?, ?, ?)",
+				[(timestamp, cmd, channel, nick, msg, None if msg is None else msg.casefold()) for timestamp, cmd, channel, nick, msg in batch])
+		self._expire()
+
+
+	def _close_output(self):
+		if self.database is not None:
+			self.database.close()
+			self.database = None
+
+
+	# deletes the lines older than keep_days once an hour
+	def _expire(self):
+		if self.keep_days <= 0 or time.time() - self.expired_at < 60 * 60:
+			return
+		self.expired_at = time.time()
+		with self.database:
+			self.database.execute("DELETE FROM messages WHERE time < ?", (self.expired_at - self.keep_days * 24 * 60 * 60,))
+
+
+	def _reader(self):
+		database = getattr(self.readers, "database", None)
+		if database is None:
+			database = self.readers.database = self._connect(read_only=True)
+		return database
+
+
+	# the queries below can be called from any thread, the lines still queued are not in the results yet
+
+	# (time, msg) of the last message of nick in channel, None if there isnt one
+	def last_message(self, channel, nick):
+		return self._reader().execute("SELECT time, msg FROM messages WHERE channel = ? AND nick = ? ORDER BY time DESC LIMIT 1",
+			(channel, nick.lower())).fetchone()
+
+
+	# how many messages in channel since the timestamp contain the phrase, ignoring case
+	# the messages of exclude_nick and the ones starting with exclude_prefix are not counted, the bot and the commands asking
+	def count_phrase(self, channel, phrase, since=0, exclude_nick="", exclude_prefix=""):
+		# a trigram index would be faster for the busiest channels but it makes inserting 5 times slower,
+		# scanning 100000 messages of a channel takes less than 100ms, see benchmarks/bench_history.py
+		query = "SELECT count(*) FROM messages WHERE channel = ? AND time >= ? AND instr(folded, ?) > 0"
+		params = [channel, since, phrase.casefold()]
+		if exclude_nick:
+			query += " AND nick != ?"
+			params.append(exclude_nick.lower())
+		if exclude_prefix:
+			query += " AND substr(msg, 1, ?) != ?"
+			params += [len(exclude_prefix), exclude_prefix]
+		return self._reader().execute(query, params).fetchone()[0]
+
+
+	# how many messages in channel since the timestamp, only the ones of nick if given
+	def count_messages(self, channel, since=0, nick=None):
+		if nick is None:
+			return self._reader().execute("SELECT count(*) FROM messages WHERE channel = ? AND time >= ?", (channel, since)).fetchone()[0]
+		return self._reader().execute("SELECT count(*) FROM messages WHERE channel = ? AND nick = ? AND time >= ?",
+			(channel, nick.lower(), since)).fetchone()[0]
+
+
+# the history of history_file in the settings, None without one or if it cant be opened
+# history_days deletes the older lines, 0 keeps them all
+def open_history(config, log=print, read_only=False):
+	history_file = config.get("DEFAULT", "history_file", fallback="")
+	if not history_file:
+		return None
+	try:
+		return HistoryStore(history_file, keep_days=config.getfloat("DEFAULT", "history_days", fallback=0), read_only=read_only, log=log)
+	except (sqlite3.Error, OSError) as error:
+		log(f"Handled {type(error).__name__}: unable to open the history {history_file}: {error}", cmd="warning")
+		return None
@@ -0,0 +1,162 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import ssl
+import time
+import socket
+import threading
+
+
+# a single socket to the server, the lines it receives are passed to on_line from its own thread
+# the socket is read with recv_into in a buffer that is reused, the complete lines of each read are decoded at once
+# the lines written are queued and a writer thread sends everything queued within flush_window seconds in one sendall
+# with tls the socket is wrapped before the handshake, twitch serves irc over tls on port 6697
+class IRCConnection():
+
+	READ_SIZE = 65536
+
+	def __init__(self, number, server, port, on_line, on_close, connect_timeout=10, tls=False, flush_window=0.002):
+		self.number = number
+		self.server = server
+		self.port = port
+		self.on_line = on_line
+		self.on_close = on_close
+		self.connect_timeout = connect_timeout
+		self.tls = tls
+		self.flush_window = flush_window
+		self.socket = None
+		self.thread = None
+		self.writer = None
+		self.condition = threading.Condition()
+		self.pending = []
+		self.sending = False
+		self.closed = False
+		self.write_error = None
+		# syscalls and lines in each direction, summed by the transport gauges of the metrics
+		self.recv_calls = 0
+		self.send_calls = 0
+		self.lines_received = 0
+		self.lines_sent = 0
+
+
+	def open(self):
+		# a server that doesnt answer cant block the reconnect attempts for long
+		connection = socket.create_connection((self.server, self.port), timeout=self.connect_timeout)
+		if self.tls:
+			connection = ssl.create_default_context().wrap_socket(connection, server_hostname=self.server)
+		connection.settimeout(None)
+		self.socket = connection
+		self.thread = threading.Thread(target=self._read, name=f"connection {self.number}", daemon=True)
+		self.thread.start()
+		self.writer = threading.Thread(target=self._write_queued, name=f"connection {self.number} writer", daemon=True)
+		self.writer.start()
+
+
+	# queues the line, raises OSError if the connection is closed
+	def write(self, line):
+		with self.condition:
+			if self.closed:
+				raise self.write_error or ConnectionAbortedError(f"connection {self.number} is closed")
+			self.pending.append(line)
+			if len(self.pending) == 1:
+				self.condition.notify_all()
+
+
+	# waits until the queued lines are sent, returns False if they werent within timeout
+	def flush(self, timeout=1):
+		with self.condition:
+			return self.condition.wait_for(lambda: self.closed or not (self.pending or self.sending), timeout)
+
+
+	def close(self):
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+		try:
+			self.socket.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+
+
+	def _read(self):
+		error = None
+		buffer = bytearray(self.READ_SIZE)
+		view = memoryview(buffer)
+		filled = 0
+		recv_into = self.socket.recv_into
+		on_line = self.on_line
+		try:
+			while True:
+				# a line longer than the buffer makes it grow, the view has to be released first
+				if filled == len(buffer):
+					view.release()
+					buffer.extend(bytes(len(buffer)))
+					view = memoryview(buffer)
+				received = recv_into(view[filled:])
+				self.recv_calls += 1
+				if not received:
+					break
+				filled += received
+				end = buffer.rfind(b"\r\n", 0, filled)
+				if end == -1:
+					continue
+				lines = str(view[:end], "utf-8", "replace").split("\r\n")
+				self.lines_received += len(lines)
+				for line in lines:
+					on_line(self, line)
+				# the start of the next line goes to the front of the buffer
+				end += 2
+				buffer[:filled - end] = buffer[end:filled]
+				filled -= end
+		except OSError as read_error:
+			error = read_error
+		finally:
+			view.release()
+			with self.condition:
+				self.closed = True
+				self.condition.notify_all()
+			self.socket.close()
+			self.on_close(self, error)
+
+
+	def _write_queued(self):
+		while True:
+			with self.condition:
+				self.condition.wait_for(lambda: self.pending or self.closed)
+				if self.closed:
+					return
+			# the lines written in the meantime are sent with this one
+			if self.flush_window:
+				time.sleep(self.flush_window)
+			with self.condition:
+				lines = self.pending
+				self.pending = []
+				self.sending = True
+			try:
+				self.socket.sendall(("\r\n".join(lines) + "\r\n").encode("utf-8"))
+			except OSError as error:
+				with self.condition:
+					self.write_error = error
+					self.sending = False
+				# the read thread sees the closed socket and reports it
+				self.close()
+				return
+			self.send_calls += 1
+			self.lines_sent += len(lines)
+			with self.condition:
+				self.sending = False
+				self.condition.notify_all()
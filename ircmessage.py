@@ -0,0 +1,146 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# https://ircv3.net/specs/extensions/message-tags
+
+# escape sequences used in the tag values, anything else after a backslash is kept as is
+TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+
+# a single line received from the server
+# the tags are kept as a string until they are read, most lines never need them
+class Message():
+
+	__slots__ = ("raw", "tags_raw", "nick", "user", "host", "cmd", "channel", "msg", "connection", "_tags")
+
+	def __init__(self, raw, tags_raw="", nick=None, user=None, host=None, cmd="", channel=None, msg=None):
+		self.raw = raw
+		self.tags_raw = tags_raw
+		self.nick = nick
+		self.user = user
+		self.host = host
+		self.cmd = cmd
+		# every parameter before the trailing one, for most commands this is only the channel
+		self.channel = channel
+		self.msg = msg
+		# number of the connection the line was received from
+		self.connection = 0
+		self._tags = None
+
+
+	def __repr__(self):
+		return f"Message({self.raw!r})"
+
+
+	# all the tags decoded in a dict, built the first time it's used
+	@property
+	def tags(self):
+		if self._tags is None:
+			self._tags = {}
+			if self.tags_raw:
+				for tag in self.tags_raw.split(";"):
+					key, _, value = tag.partition("=")
+					self._tags[key] = unescape_tag_value(value)
+		return self._tags
+
+
+	# returns the value of a single tag without decoding the others
+	def tag(self, key, default=""):
+		if self._tags is not None:
+			return self._tags.get(key, default)
+
+		tags_raw = self.tags_raw
+		needle = key + "="
+		if tags_raw.startswith(needle):
+			start = len(needle)
+		else:
+			start = tags_raw.find(";" + needle)
+			if start == -1:
+				# a tag can also be sent without a value
+				if tags_raw == key or tags_raw.startswith(key + ";") or tags_raw.endswith(";" + key) or (";" + key + ";") in tags_raw:
+					return ""
+				return default
+			start += len(needle) + 1
+		end = tags_raw.find(";", start)
+		return unescape_tag_value(tags_raw[start:] if end == -1 else tags_raw[start:end])
+
+
+def unescape_tag_value(value):
+	# most values dont have anything to unescape
+	if "\\" not in value:
+		return value
+	result = []
+	index = 0
+	length = len(value)
+	while index < length:
+		char = value[index]
+		if char == "\\":
+			index += 1
+			# a backslash at the end of the value is dropped
+			if index < length:
+				result.append(TAG_ESCAPES.get(value[index], value[index]))
+		else:
+			result.append(char)
+		index += 1
+	return "".join(result)
+
+
+# splits a line in a single pass, only slicing the parts that are there
+# @tags :nick!user@host CMD param param :trailing
+def parse_message(line):
+
+	line = line.strip()
+	position = 0
+	tags_raw = ""
+	nick = user = host = channel = msg = None
+
+	if line.startswith("@"):
+		position = line.find(" ")
+		if position == -1:
+			return Message(line, line[1:])
+		tags_raw = line[1:position]
+		position += 1
+
+	if line.startswith(":", position):
+		end = line.find(" ", position)
+		if end == -1:
+			end = len(line)
+		prefix = line[position + 1:end]
+		position = end + 1
+		nick, separator, host = prefix.partition("@")
+		if not separator:
+			host = None
+		nick, separator, user = nick.partition("!")
+		if not separator:
+			user = None
+
+	end = line.find(" ", position)
+	if end == -1:
+		return Message(line, tags_raw, nick, user, host, line[position:])
+	cmd = line[position:end]
+	position = end + 1
+
+	if line.startswith(":", position):
+		msg = line[position + 1:]
+	else:
+		end = line.find(" :", position)
+		if end == -1:
+			channel = line[position:]
+		else:
+			channel = line[position:end]
+			msg = line[end + 2:]
+
+	return Message(line, tags_raw, nick, user, host, cmd, channel or None, msg)
@@ -0,0 +1,196 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# https://dev.twitch.tv/docs/irc/#rate-limits
+
+import time
+import threading
+import collections
+from tokenbucket import *
+
+
+# the join state of a single connection of the pool
+class ConnectionJoins():
+
+	__slots__ = ("number", "ready", "joined", "joining", "waiting")
+
+	def __init__(self, number):
+		self.number = number
+		# True after the server sent 376 on this connection
+		self.ready = False
+		self.joined = set()
+		self.joining = set()
+		self.waiting = collections.deque()
+
+
+	def channel_count(self):
+		return len(self.joined) + len(self.joining) + len(self.waiting)
+
+
+# decides which connection joins each channel and sends the JOINs no faster than the rate limit allows
+# connection 0 is the main one and is never closed by the scheduler
+class JoinScheduler():
+
+	# bucket replaces the JOIN limit, see SendScheduler
+	def __init__(self, open_connection, send_join, send_part, join_limit=20, time_unit=10, channels_per_connection=100, max_connections=10, log=print,
+			bucket=None):
+		self.open_connection = open_connection
+		self.send_join = send_join
+		self.send_part = send_part
+		self.channels_per_connection = channels_per_connection
+		self.max_connections = max_connections
+		self.log = log
+		self.bucket = SlidingWindow(join_limit, time_unit, margin=1) if bucket is None else bucket
+		self.condition = threading.Condition()
+		self.connections = {0: ConnectionJoins(0)}
+		# channel: number of the connection it's assigned to
+		self.assignments = {}
+		# numbers of the connections the scheduler thread has to open
+		self.to_open = []
+		self.thread = threading.Thread(target=self._run, name="join scheduler", daemon=True)
+		self.thread.start()
+
+
+	# queues a channel to be joined, returns False if it was already
+	def add(self, channel):
+		with self.condition:
+			if channel in self.assignments:
+				return False
+			connection = self._pick_connection()
+			connection.waiting.append(channel)
+			self.assignments[channel] = connection.number
+			self.condition.notify_all()
+			return True
+
+
+	def remove(self, channel):
+		with self.condition:
+			number = self.assignments.pop(channel, None)
+			if number is None:
+				return False
+			connection = self.connections[number]
+			if channel in connection.waiting:
+				connection.waiting.remove(channel)
+				return True
+			connection.joined.discard(channel)
+			connection.joining.discard(channel)
+		self.send_part(number, channel)
+		return True
+
+
+	# the connection the messages to a channel have to be sent from
+	def connection_for(self, channel):
+		return self.assignments.get(channel, 0)
+
+
+	# called when the server sent 376 on a connection
+	def connection_ready(self, number):
+		with self.condition:
+			if number not in self.connections:
+				self.connections[number] = ConnectionJoins(number)
+			self.connections[number].ready = True
+			self.condition.notify_all()
+
+
+	# called when the server confirms a JOIN
+	def joined(self, number, channel):
+		with self.condition:
+			connection = self.connections.get(number)
+			if connection is not None and channel in connection.joining:
+				connection.joining.discard(channel)
+				connection.joined.add(channel)
+
+
+	# the channels of a closed connection are spread over the others
+	def connection_lost(self, number):
+		with self.condition:
+			connection = self.connections.get(number)
+			if connection is None:
+				return
+			channels = list(connection.joined) + list(connection.joining) + list(connection.waiting)
+			if number == 0:
+				# the main connection is reopened with the same number, its channels wait for it
+				self.connections[0] = ConnectionJoins(0)
+			else:
+				del self.connections[number]
+				if number in self.to_open:
+					self.to_open.remove(number)
+			for channel in channels:
+				del self.assignments[channel]
+			for channel in channels:
+				new_connection = self._pick_connection()
+				new_connection.waiting.append(channel)
+				self.assignments[channel] = new_connection.number
+			if channels:
+				self.log(f"Connection {number} closed, {len(channels)} channels will be joined again", cmd="warning")
+			self.condition.notify_all()
+
+
+	# number: (ready, joined, joining, waiting) for every connection
+	def status(self):
+		with self.condition:
+			return {number: (connection.ready, len(connection.joined), len(connection.joining), len(connection.waiting))
+				for number, connection in sorted(self.connections.items())}
+
+
+	# the connection with the fewest channels, a new one if they are all full
+	def _pick_connection(self):
+		connection = min(self.connections.values(), key=lambda connection: (connection.channel_count(), connection.number))
+		if connection.channel_count() < self.channels_per_connection or len(self.connections) >= self.max_connections:
+			return connection
+		number = 1
+		while number in self.connections:
+			number += 1
+		connection = self.connections[number] = ConnectionJoins(number)
+		self.log(f"Opening connection {number}", cmd="info")
+		# the connection is opened outside of the lock by the scheduler thread
+		self.to_open.append(number)
+		self.condition.notify_all()
+		return connection
+
+
+	# returns the next (connection number, channel) that can be joined and the seconds to wait if there isnt one
+	def _pop_ready(self):
+		for connection in self.connections.values():
+			if connection.ready and connection.waiting:
+				# a bucket shared with other processes can run out between the two calls
+				if not self.bucket.try_get_tokens():
+					return None, self.bucket.wait_time()
+				channel = connection.waiting.popleft()
+				connection.joining.add(channel)
+				return (connection.number, channel), 0
+		return None, None
+
+
+	def _run(self):
+		while True:
+			with self.condition:
+				item, wait = self._pop_ready()
+				while item is None and not self.to_open:
+					self.condition.wait(wait)
+					item, wait = self._pop_ready()
+				to_open = self.to_open
+				self.to_open = []
+			for number in to_open:
+				try:
+					self.open_connection(number)
+				except OSError as error:
+					self.log(f"Handled {type(error).__name__} opening connection {number}: {error}", cmd="warning")
+					self.connection_lost(number)
+					# dont try again right away if the server cant be reached
+					time.sleep(5)
+			if item is not None:
+				self.send_join(*item)
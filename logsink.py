@@ -0,0 +1,258 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import time
+import json
+import threading
+import collections
+
+# the levels of the lines passed to IRCBot.log, a sink gets the lines with a level equal or higher than its own
+LEVEL_RAW = 0
+LEVEL_CHAT = 1
+LEVEL_INFO = 2
+LEVEL_WARNING = 3
+LEVEL_NAMES = {"raw": LEVEL_RAW, "chat": LEVEL_CHAT, "info": LEVEL_INFO, "warning": LEVEL_WARNING}
+LEVELS_BY_NUMBER = {number: name for name, number in LEVEL_NAMES.items()}
+# a level higher than every line, the sink gets nothing
+LEVEL_OFF = 4
+
+# the level of each cmd passed to IRCBot.log, the others are raw lines
+CMD_LEVELS = {"PRIVMSG": LEVEL_CHAT, "WHISPER": LEVEL_CHAT, "NOTICE": LEVEL_CHAT, "info": LEVEL_INFO, "warning": LEVEL_WARNING}
+
+
+# "raw", "chat", "info", "warning" or "off" from the settings
+def parse_level(name):
+	name = name.strip().lower()
+	if name == "off":
+		return LEVEL_OFF
+	return LEVEL_NAMES[name]
+
+
+# a destination for the log, emit is called from the read loop so it must never block
+class LogSink():
+
+	def __init__(self, level=LEVEL_CHAT):
+		self.level = level
+
+
+	def emit(self, level, data, nick, cmd, channel, msg, nick_color):
+		raise NotImplementedError
+
+
+	def close(self):
+		pass
+
+
+# prints the lines in the ui, the raw lines only with verbose log
+class UISink(LogSink):
+
+	def __init__(self, ui, level=LEVEL_CHAT):
+		LogSink.__init__(self, level)
+		self.ui = ui
+
+
+	def emit(self, level, data, nick, cmd, channel, msg, nick_color):
+		# with verbose log every line is also printed as it is
+		if self.level == LEVEL_RAW:
+			self.ui.print_log(data)
+		if cmd == "PRIVMSG":
+			self.ui.print_PRIVMSG(channel, nick, msg, nick_color)
+		elif cmd == "WHISPER":
+			self.ui.print_WHISPER(nick, msg, nick_color)
+		elif cmd == "NOTICE":
+			self.ui.print_NOTICE(channel, msg)
+		elif cmd == "warning":
+			self.ui.print_warning(data)
+		elif cmd == "info":
+			self.ui.print_info(data)
+
+
+# passes the lines to another process, put is like multiprocessing.Queue.put and source says where they come from
+# a worker of a sharded bot logs through the coordinator, see shards.py
+class QueueSink(LogSink):
+
+	def __init__(self, put, source, level=LEVEL_CHAT):
+		LogSink.__init__(self, level)
+		self.put = put
+		self.source = source
+
+
+	def emit(self, level, data, nick, cmd, channel, msg, nick_color):
+		self.put(("log", self.source, (level, data, nick, cmd, channel, msg, nick_color)))
+
+
+# a sink that queues what it's given and writes it in batches on a background thread, so emit never waits for the disk
+# if more than max_pending are waiting the oldest are dropped, the subclasses write them in _write_batch
+# and close what they write to in _close_output, which is called after an error in write_errors and once closed
+class QueuedSink(LogSink):
+
+	write_errors = (OSError,)
+
+	def __init__(self, name, level=LEVEL_CHAT, flush_interval=1, max_pending=10000, max_batch=10000, log=print):
+		LogSink.__init__(self, level)
+		self.name = name
+		self.flush_interval = flush_interval
+		self.max_pending = max_pending
+		self.max_batch = max_batch
+		self.log = log
+		# appending to a deque is thread safe and doesnt need the condition
+		self.pending = collections.deque()
+		self.condition = threading.Condition()
+		self.closed = False
+		self.written = 0
+		self.dropped = 0
+		self.batches = 0
+		self.thread = None
+
+
+	# called by the subclass once it's ready to write
+	def _start_writer(self, thread_name):
+		self.thread = threading.Thread(target=self._run, name=thread_name, daemon=True)
+		self.thread.start()
+
+
+	def _queue(self, item):
+		if len(self.pending) >= self.max_pending:
+			try:
+				self.pending.popleft()
+				self.dropped += 1
+			# the writer thread emptied the queue in the meantime
+			except IndexError:
+				pass
+		self.pending.append(item)
+
+
+	# writes what is still queued and stops the writer thread
+	def close(self, timeout=5):
+		if self.thread is None:
+			return
+		with self.condition:
+			self.closed = True
+			self.condition.notify()
+		self.thread.join(timeout)
+
+
+	def _run(self):
+		while True:
+			with self.condition:
+				if not self.closed:
+					self.condition.wait(self.flush_interval)
+				closed = self.closed
+			try:
+				self._write_pending()
+			except self.write_errors as error:
+				self.log(f"Handled {type(error).__name__} writing {self.name}: {error}", cmd="warning")
+				self._close_output()
+			if closed:
+				self._close_output()
+				return
+
+
+	def _write_pending(self):
+		# only the items queued so far, the ones added while writing wait for the next round
+		count = len(self.pending)
+		while count > 0:
+			size = min(count, self.max_batch)
+			self._write_batch([self.pending.popleft() for _ in range(size)])
+			self.written += size
+			self.batches += 1
+			count -= size
+
+
+	def _write_batch(self, batch):
+		raise NotImplementedError
+
+
+	def _close_output(self):
+		pass
+
+
+# writes a json object per line, the lines are queued and written in batches by a background thread
+# the file is rotated to filename.1, filename.2... when it reaches max_bytes or is older than rotate_interval seconds
+class JsonLinesSink(QueuedSink):
+
+	def __init__(self, filename, level=LEVEL_CHAT, max_bytes=10 * 1024 * 1024, rotate_interval=24 * 60 * 60, backup_count=5,
+			flush_interval=1, max_pending=10000, log=print):
+		QueuedSink.__init__(self, filename, level, flush_interval, max_pending, max_pending, log)
+		self.filename = filename
+		self.max_bytes = max_bytes
+		self.rotate_interval = rotate_interval
+		self.backup_count = backup_count
+		self.rotations = 0
+		self.file = None
+		self.opened_at = None
+		directory = os.path.dirname(filename)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		self._start_writer("log writer")
+
+
+	# the line is only encoded by the writer thread
+	def emit(self, level, data, nick, cmd, channel, msg, nick_color):
+		self._queue((time.time(), level, data, nick, cmd, channel, msg))
+
+
+	def _write_batch(self, batch):
+		lines = []
+		for timestamp, level, data, nick, cmd, channel, msg in batch:
+			record = {"time": round(timestamp, 3), "level": LEVELS_BY_NUMBER[level], "cmd": cmd}
+			if channel:
+				record["channel"] = channel
+			if nick:
+				record["nick"] = nick
+			if msg:
+				record["msg"] = msg
+			if data and data != msg:
+				record["data"] = data
+			lines.append(json.dumps(record, ensure_ascii=False))
+		lines.append("")
+		data = "\n".join(lines)
+		self._open_file()
+		if self.file.tell() > 0 and self.file.tell() + len(data) > self.max_bytes or time.time() - self.opened_at > self.rotate_interval:
+			self._rotate()
+		self.file.write(data)
+		self.file.flush()
+
+
+	def _open_file(self):
+		if self.file is None:
+			self.file = open(self.filename, "a", encoding="utf-8")
+			self.opened_at = time.time()
+
+
+	def _close_output(self):
+		if self.file is not None:
+			try:
+				self.file.close()
+			except OSError:
+				pass
+			self.file = None
+
+
+	# filename.1 becomes filename.2 and so on, the oldest one is deleted
+	def _rotate(self):
+		self._close_output()
+		for number in range(self.backup_count - 1, 0, -1):
+			if os.path.exists(f"{self.filename}.{number}"):
+				os.replace(f"{self.filename}.{number}", f"{self.filename}.{number + 1}")
+		if self.backup_count > 0:
+			os.replace(self.filename, f"{self.filename}.1")
+		else:
+			os.remove(self.filename)
+		self.rotations += 1
+		self._open_file()
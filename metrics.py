@@ -0,0 +1,361 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import time
+import json
+import bisect
+import threading
+import collections
+import http.server
+
+# upper bounds in seconds of the histogram buckets, from 1 microsecond to about 16 seconds, each twice the previous one
+# the last bucket counts everything above
+BUCKET_BOUNDS = tuple(0.000001 * 2 ** exponent for exponent in range(25))
+
+
+# counts of values by bucket, an observation is a bisect and a few additions
+class Histogram():
+
+	__slots__ = ("counts", "count", "total", "max")
+
+	def __init__(self):
+		self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+		self.count = 0
+		self.total = 0
+		self.max = 0
+
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+		self.count += 1
+		self.total += value
+		if value > self.max:
+			self.max = value
+
+
+	# the upper bound of the bucket that has the percentile, the values are at most twice as precise
+	def percentile(self, fraction):
+		if self.count == 0:
+			return 0
+		rank = fraction * self.count
+		seen = 0
+		for index, count in enumerate(self.counts):
+			seen += count
+			if seen >= rank:
+				return min(BUCKET_BOUNDS[index], self.max) if index < len(BUCKET_BOUNDS) else self.max
+		return self.max
+
+
+	def summary(self):
+		return {"count": self.count, "mean": self.total / self.count if self.count else 0, "p50": self.percentile(0.5),
+			"p90": self.percentile(0.9), "p99": self.percentile(0.99), "max": self.max}
+
+
+# counters, latency histograms and gauges, all the methods can be called from any thread
+# counter and histogram names are like "lines.PRIVMSG" or "handler.PRIVMSG", the part before the dot is the group
+class Metrics():
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.started = time.monotonic()
+		self.counters = collections.defaultdict(int)
+		self.histograms = collections.defaultdict(Histogram)
+		# name: function returning a number or a dict of numbers, called when a snapshot is taken
+		self.gauges = {}
+		# per second rate of each counter since the previous call to update_rates
+		self.rates = {}
+		self.rates_counters = {}
+		self.rates_time = self.started
+
+
+	def count(self, name, amount=1):
+		with self.lock:
+			self.counters[name] += amount
+
+
+	def observe(self, name, seconds):
+		with self.lock:
+			self.histograms[name].observe(seconds)
+
+
+	# a line handled by the bot, counted and timed by cmd
+	def line_handled(self, cmd, seconds):
+		with self.lock:
+			self.counters["lines." + cmd] += 1
+			self.histograms["handler." + cmd].observe(seconds)
+
+
+	def gauge(self, name, function):
+		self.gauges[name] = function
+
+
+	def update_rates(self):
+		now = time.monotonic()
+		with self.lock:
+			elapsed = now - self.rates_time
+			if elapsed <= 0:
+				return
+			self.rates = {name: (value - self.rates_counters.get(name, 0)) / elapsed for name, value in self.counters.items()}
+			self.rates_counters = dict(self.counters)
+			self.rates_time = now
+
+
+	def snapshot(self):
+		with self.lock:
+			snapshot = {
+				"time": time.time(),
+				"uptime": time.monotonic() - self.started,
+				"counters": dict(self.counters),
+				"rates": dict(self.rates),
+				"histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+			}
+		gauges = {}
+		for name, function in self.gauges.items():
+			try:
+				gauges[name] = function()
+			except Exception as error:
+				gauges[name] = f"{type(error).__name__}: {error}"
+		snapshot["gauges"] = gauges
+		return snapshot
+
+
+	# the counters, the histogram buckets and the number gauges, for another process to add up with load_exports
+	def export(self):
+		with self.lock:
+			export = {
+				"counters": dict(self.counters),
+				"histograms": {name: (list(histogram.counts), histogram.count, histogram.total, histogram.max)
+					for name, histogram in self.histograms.items()},
+			}
+		gauges = {}
+		for name, function in self.gauges.items():
+			try:
+				value = function()
+			except Exception:
+				continue
+			if isinstance(value, dict):
+				gauges[name] = {key: number for key, number in value.items() if isinstance(number, (int, float))}
+			elif isinstance(value, (int, float)):
+				gauges[name] = value
+		export["gauges"] = gauges
+		return export
+
+
+	# replaces the counters and histograms with the sum of the exports, the gauges are added up too
+	def load_exports(self, exports):
+		counters = collections.defaultdict(int)
+		histograms = collections.defaultdict(Histogram)
+		gauges = {}
+		for export in exports:
+			for name, value in export["counters"].items():
+				counters[name] += value
+			for name, (counts, count, total, maximum) in export["histograms"].items():
+				histogram = histograms[name]
+				histogram.counts = [mine + theirs for mine, theirs in zip(histogram.counts, counts)]
+				histogram.count += count
+				histogram.total += total
+				histogram.max = max(histogram.max, maximum)
+			for name, value in export["gauges"].items():
+				if isinstance(value, dict):
+					total = gauges.setdefault(name, {})
+					for key, number in value.items():
+						total[key] = total.get(key, 0) + number
+				else:
+					gauges[name] = gauges.get(name, 0) + value
+		with self.lock:
+			self.counters = counters
+			self.histograms = histograms
+		self.gauges = {name: lambda value=value: value for name, value in gauges.items()}
+
+
+	# one "name value" line for each number, sorted by name, the times are in seconds
+	def render_text(self):
+		snapshot = self.snapshot()
+		lines = [f"uptime {snapshot['uptime']:.1f}"]
+		for name, value in sorted(snapshot["counters"].items()):
+			lines.append(f"{name} {value}")
+		for name, value in sorted(snapshot["rates"].items()):
+			lines.append(f"{name}.per_second {value:.2f}")
+		for name, value in sorted(snapshot["gauges"].items()):
+			if isinstance(value, dict):
+				lines.extend(f"{name}.{key} {number}" for key, number in value.items())
+			else:
+				lines.append(f"{name} {value}")
+		for name, summary in sorted(snapshot["histograms"].items()):
+			lines.extend(f"{name}.{key} {value:.6f}" if isinstance(value, float) else f"{name}.{key} {value}"
+				for key, value in summary.items())
+		return "\n".join(lines) + "\n"
+
+
+# updates the rates every interval seconds and writes a json snapshot to filename if there is one
+class MetricsReporter():
+
+	def __init__(self, metrics, interval=10, filename="", log=print):
+		self.metrics = metrics
+		self.interval = interval
+		self.filename = filename
+		self.log = log
+		self.thread = threading.Thread(target=self._run, name="metrics reporter", daemon=True)
+		self.thread.start()
+
+
+	def write_snapshot(self):
+		temporary_filename = self.filename + ".tmp"
+		with open(temporary_filename, "w", encoding="utf-8") as snapshot_file:
+			json.dump(self.metrics.snapshot(), snapshot_file, indent="\t", default=str)
+		os.replace(temporary_filename, self.filename)
+
+
+	def _run(self):
+		while True:
+			time.sleep(self.interval)
+			self.metrics.update_rates()
+			if self.filename:
+				try:
+					self.write_snapshot()
+				except OSError as error:
+					self.log(f"Handled {type(error).__name__} writing {self.filename}: {error}", cmd="warning")
+
+
+# samples the stack of every thread every interval seconds while running
+# own counts the function that was running, total every function in the stack
+class SamplingProfiler():
+
+	def __init__(self, interval=0.005):
+		self.interval = interval
+		self.lock = threading.Lock()
+		self.running = False
+		self.thread = None
+		self.reset()
+
+
+	def reset(self):
+		with self.lock:
+			self.samples = 0
+			self.own = collections.Counter()
+			self.total = collections.Counter()
+
+
+	# returns False if it was already running
+	def start(self):
+		with self.lock:
+			if self.running:
+				return False
+			self.running = True
+		self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+		self.thread.start()
+		return True
+
+
+	def stop(self):
+		with self.lock:
+			was_running = self.running
+			self.running = False
+		return was_running
+
+
+	def report(self, top=20):
+		with self.lock:
+			if self.samples == 0:
+				return "no samples\n"
+			lines = [f"{self.samples} samples every {self.interval * 1000:g}ms, running: {self.running}", "own% total% function"]
+			for function, count in self.own.most_common(top):
+				lines.append(f"{count / self.samples * 100:5.1f} {self.total[function] / self.samples * 100:5.1f} {function}")
+		return "\n".join(lines) + "\n"
+
+
+	def _run(self):
+		own_thread = threading.get_ident()
+		while self.running:
+			frames = sys._current_frames()
+			with self.lock:
+				for thread_id, frame in frames.items():
+					if thread_id == own_thread:
+						continue
+					self.samples += 1
+					self.own[self._describe(frame)] += 1
+					# recursive functions are only counted once for each sample
+					functions = set()
+					while frame is not None:
+						functions.add(self._describe(frame))
+						frame = frame.f_back
+					self.total.update(functions)
+			del frames
+			time.sleep(self.interval)
+
+
+	@staticmethod
+	def _describe(frame):
+		code = frame.f_code
+		return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# serves the metrics on localhost, /metrics as text, /metrics.json as json
+# /profile shows the profiler report, /profile/start, /profile/stop and /profile/reset control it
+class MetricsServer():
+
+	class Handler(http.server.BaseHTTPRequestHandler):
+
+		def do_GET(self):
+			metrics = self.server.metrics
+			profiler = self.server.profiler
+			path = self.path.split("?")[0].rstrip("/")
+			content_type = "text/plain; charset=utf-8"
+			if path in ("", "/metrics"):
+				body = metrics.render_text()
+			elif path == "/metrics.json":
+				body = json.dumps(metrics.snapshot(), default=str)
+				content_type = "application/json"
+			elif path == "/profile":
+				body = profiler.report()
+			elif path == "/profile/start":
+				body = "started\n" if profiler.start() else "already running\n"
+			elif path == "/profile/stop":
+				body = "stopped\n" if profiler.stop() else "not running\n"
+			elif path == "/profile/reset":
+				profiler.reset()
+				body = "reset\n"
+			else:
+				self.send_error(404)
+				return
+			body = body.encode("utf-8")
+			self.send_response(200)
+			self.send_header("Content-Type", content_type)
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+
+		# the requests dont go to the log
+		def log_message(self, format, *args):
+			pass
+
+
+	def __init__(self, metrics, profiler, port):
+		self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), self.Handler)
+		self.server.daemon_threads = True
+		self.server.metrics = metrics
+		self.server.profiler = profiler
+		self.thread = threading.Thread(target=self.server.serve_forever, name="metrics server", daemon=True)
+		self.thread.start()
+
+
+	def close(self):
+		self.server.shutdown()
+		self.server.server_close()
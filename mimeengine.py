@@ -0,0 +1,124 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import collections
+
+# the emote ids seen in a channel that arent mimed, they stop being remembered past this many
+MAX_OTHER_EMOTE_IDS = 10000
+
+
+# yields (emote id, start, end) for the first position of each emote in the twitch emotes tag, like "25:0-4,12-16/1902:6-10"
+def emote_ranges(emotes_tag):
+	for emote in emotes_tag.split("/"):
+		emote_id, _, positions = emote.partition(":")
+		start, _, end = positions.partition(",")[0].partition("-")
+		try:
+			yield emote_id, int(start), int(end)
+		except ValueError:
+			continue
+
+
+# how many different chatters sent something in the last window milliseconds
+# every chatter is added once and removed once, so adding is constant time on average
+class ChatterCounter():
+
+	__slots__ = ("times", "counts")
+
+	def __init__(self):
+		# (time, nick) oldest first, and the number of times each nick is in there
+		self.times = collections.deque()
+		self.counts = {}
+
+
+	def add(self, nick, now, window):
+		times = self.times
+		counts = self.counts
+		while times and times[0][0] <= now - window:
+			old_nick = times.popleft()[1]
+			if counts[old_nick] == 1:
+				del counts[old_nick]
+			else:
+				counts[old_nick] -= 1
+		times.append((now, nick))
+		counts[nick] = counts.get(nick, 0) + 1
+		return len(counts)
+
+
+	def clear(self):
+		self.times.clear()
+		self.counts.clear()
+
+
+# decides when the bot copies an emote sent in chat, the state of a channel lives here between changes of its settings
+# the emotes are found by id in the emotes tag, the text is only scanned for emotes twitch doesnt tag, like the ones of extensions
+# with chatters above 1 an emote is only copied after that many different chatters sent it in window seconds
+class MimeEngine():
+
+	def __init__(self, emotes, cooldown=30, chatters=1, window=10, scan_text=True):
+		self.emotes = frozenset(emotes)
+		self.cooldown = cooldown * 1000
+		self.chatters = chatters
+		self.window = window * 1000
+		self.scan_text = scan_text
+		# emote id: name, learned from the emotes tag
+		self.emote_ids = {}
+		# the ids of the emotes that arent copied, so their text isnt looked at again
+		self.other_ids = set()
+		self.counters = {}
+		# tmi-sent-ts in milliseconds of the last emote copied
+		self.last_mime = None
+
+
+	# the emote of the message that can be copied, or None
+	def find(self, msg, emotes_tag):
+		if emotes_tag:
+			for emote_id, start, end in emote_ranges(emotes_tag):
+				name = self.emote_ids.get(emote_id)
+				if name is not None:
+					return name
+				if emote_id in self.other_ids:
+					continue
+				text = msg[start:end + 1]
+				if text in self.emotes:
+					self.emote_ids[emote_id] = text
+					return text
+				# the positions can be off in messages with emojis, an id is only ignored if it was read as a whole word
+				if (start == 0 or msg[start - 1] == " ") and (end + 1 == len(msg) or msg[end + 1] == " ") and " " not in text:
+					if len(self.other_ids) >= MAX_OTHER_EMOTE_IDS:
+						self.other_ids.clear()
+					self.other_ids.add(emote_id)
+		if self.scan_text:
+			for word in msg.split():
+				if word in self.emotes:
+					return word
+		return None
+
+
+	# counts the chatter and returns True if the emote should be copied now, sent is tmi-sent-ts in milliseconds
+	def should_mime(self, emote, nick, sent):
+		if self.chatters > 1:
+			counter = self.counters.get(emote)
+			if counter is None:
+				counter = self.counters[emote] = ChatterCounter()
+			if counter.add(nick, sent, self.window) < self.chatters:
+				return False
+		if self.last_mime is not None and sent - self.last_mime < self.cooldown:
+			return False
+		if self.chatters > 1:
+			self.counters[emote].clear()
+		self.last_mime = sent
+		return True
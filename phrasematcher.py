@@ -0,0 +1,241 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import threading
+import unicodedata
+
+# characters used to dodge the filter mapped to the letter they look like, used with normalize_confusables
+# the invisible characters are removed
+CONFUSABLES = str.maketrans({
+	"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g",
+	"@": "a", "$": "s", "!": "i", "|": "l", "€": "e", "£": "l",
+	# cyrillic
+	"а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c", "т": "t", "у": "y",
+	"х": "x", "і": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w",
+	# greek
+	"α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+	# zero width space, non joiner, joiner, word joiner, byte order mark and soft hyphen
+	"\u200b": None, "\u200c": None, "\u200d": None, "\u2060": None, "\ufeff": None, "\u00ad": None,
+})
+
+
+# finds any of a list of phrases in a message with an Aho-Corasick automaton
+# the time of a search depends on the length of the message, not on how many phrases there are
+# phrases can be added and removed while the matcher is used, only the nodes affected by the change are updated
+# search doesnt take the lock, a message checked during a change might not see it yet
+class PhraseMatcher():
+
+	def __init__(self, phrases=(), normalize_confusables=False):
+		self.normalize_confusables = normalize_confusables
+		self.lock = threading.Lock()
+		# each node is an index in these lists, 0 is the root
+		# goto has the children of the node by character, fail the node of the longest suffix of the node that is in the trie
+		self.goto = [{}]
+		self.fail = [0]
+		self.parent = [0]
+		self.character = [""]
+		self.depth = [0]
+		# the nodes whose fail is the node, to find the nodes a change affects
+		self.fail_children = {}
+		# the phrase that ends at the node, and the one found when a search reaches the node, its own or the one of a suffix
+		self.terminal = [None]
+		self.output = [None]
+		# normalized phrase: phrase as it was added
+		self.phrases = {}
+		self._build(phrases)
+
+
+	def __len__(self):
+		return len(self.phrases)
+
+
+	# lowercase, and if normalize_confusables is set without the tricks used to write around the filter
+	def normalize(self, text):
+		if self.normalize_confusables:
+			return unicodedata.normalize("NFKC", text).casefold().translate(CONFUSABLES)
+		return text.casefold()
+
+
+	# returns the first phrase found in the text as it was added, or None
+	def search(self, text):
+		goto = self.goto
+		fail = self.fail
+		output = self.output
+		node = 0
+		for character in self.normalize(text):
+			next_node = goto[node].get(character)
+			while next_node is None and node != 0:
+				node = fail[node]
+				next_node = goto[node].get(character)
+			node = next_node or 0
+			if output[node] is not None:
+				return self.phrases.get(output[node])
+		return None
+
+
+	# returns False if the phrase was already there or is empty
+	def add(self, phrase):
+		phrase = phrase.strip()
+		key = self.normalize(phrase)
+		if not key:
+			return False
+		with self.lock:
+			if key in self.phrases:
+				return False
+			self.phrases[key] = phrase
+			node = 0
+			new_nodes = []
+			for character in key:
+				next_node = self.goto[node].get(character)
+				if next_node is None:
+					next_node = self._new_node(node, character)
+					new_nodes.append(next_node)
+				node = next_node
+			# the new nodes are in order of depth, so the suffixes of each one are already linked
+			for new_node in new_nodes:
+				self._link_new_node(new_node)
+			self.terminal[node] = key
+			self._update_output(node)
+		return True
+
+
+	# the nodes of the phrase stay in the trie, they just dont end a phrase anymore
+	def remove(self, phrase):
+		key = self.normalize(phrase.strip())
+		with self.lock:
+			if key not in self.phrases:
+				return False
+			del self.phrases[key]
+			node = 0
+			for character in key:
+				node = self.goto[node][character]
+			self.terminal[node] = None
+			self._update_output(node)
+		return True
+
+
+	def _new_node(self, parent, character):
+		node = len(self.goto)
+		self.goto.append({})
+		self.fail.append(0)
+		self.parent.append(parent)
+		self.character.append(character)
+		self.depth.append(self.depth[parent] + 1)
+		self.terminal.append(None)
+		self.output.append(None)
+		self.fail_children.setdefault(0, set()).add(node)
+		self.goto[parent][character] = node
+		return node
+
+
+	def _set_fail(self, node, fail_node):
+		self.fail_children[self.fail[node]].discard(node)
+		self.fail[node] = fail_node
+		self.fail_children.setdefault(fail_node, set()).add(node)
+
+
+	# the node, the nodes whose fail is the node, the nodes whose fail is one of those and so on, every node before the ones linked to it
+	def _fail_subtree(self, node):
+		stack = [node]
+		while stack:
+			node = stack.pop()
+			yield node
+			stack.extend(self.fail_children.get(node, ()))
+
+
+	# the longest suffix of the node that is in the trie, following the fail links of its parent
+	def _find_fail(self, node):
+		parent = self.parent[node]
+		if parent == 0:
+			return 0
+		character = self.character[node]
+		fail_node = self.fail[parent]
+		while character not in self.goto[fail_node] and fail_node != 0:
+			fail_node = self.fail[fail_node]
+		return self.goto[fail_node].get(character, 0)
+
+
+	def _link_new_node(self, node):
+		self._set_fail(node, self._find_fail(node))
+		self.output[node] = self.terminal[node] or self.output[self.fail[node]]
+		# the nodes that end with the new node are the ones reached with the same character from a node that ends with its parent
+		character = self.character[node]
+		depth = self.depth[node]
+		for suffix_parent in list(self._fail_subtree(self.parent[node])):
+			other = self.goto[suffix_parent].get(character)
+			if other is not None and other != node and self.depth[self.fail[other]] < depth:
+				self._set_fail(other, node)
+				self._update_output(other)
+
+
+	# the output of the node and of the nodes that fail to it, after the node or its fail changed
+	def _update_output(self, node):
+		for node in self._fail_subtree(node):
+			self.output[node] = self.terminal[node] or self.output[self.fail[node]]
+
+
+	# adds all the phrases at once and links the nodes breadth first
+	def _build(self, phrases):
+		for phrase in phrases:
+			phrase = phrase.strip()
+			key = self.normalize(phrase)
+			if not key or key in self.phrases:
+				continue
+			self.phrases[key] = phrase
+			node = 0
+			for character in key:
+				next_node = self.goto[node].get(character)
+				node = self._new_node(node, character) if next_node is None else next_node
+			self.terminal[node] = key
+		queue = list(self.goto[0].values())
+		for node in queue:
+			self.output[node] = self.terminal[node]
+		position = 0
+		while position < len(queue):
+			node = queue[position]
+			position += 1
+			for child in self.goto[node].values():
+				self._set_fail(child, self._find_fail(child))
+				self.output[child] = self.terminal[child] or self.output[self.fail[child]]
+				queue.append(child)
+
+
+# the characters that make a banned_phrases setting a regex, spaces and dashes are part of plain phrases
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+# whether a phrase of banned_phrases means only itself and can go in a PhraseMatcher
+def is_literal_phrase(phrase):
+	return REGEX_METACHARACTERS.isdisjoint(phrase)
+
+
+# the phrases in a file, one for each line, the lines starting with # are ignored
+def read_phrases(filename):
+	with open(filename, encoding="utf-8") as phrases_file:
+		return [line.strip() for line in phrases_file if line.strip() and not line.startswith("#")]
+
+
+# replaces the file, a crash while writing leaves the old one
+def write_phrases(filename, phrases):
+	directory = os.path.dirname(filename)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	temporary_filename = filename + ".tmp"
+	with open(temporary_filename, "w", encoding="utf-8") as phrases_file:
+		phrases_file.write("".join(phrase + "\n" for phrase in sorted(phrases)))
+	os.replace(temporary_filename, filename)
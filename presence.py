@@ -0,0 +1,163 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import sys
+
+
+# who is in which channel, fed by NAMES replies, JOIN, PART and chat messages
+# the nicks are interned so a chatter in many channels is stored once, each channel is a set of them
+# is_present and count are O(1), past max_chatters (over all the channels) a chatter that wasnt seen for a long time is dropped,
+# without track_presence no PART arrives and chatters only leave this way
+# instead of a timestamp for every chatter there are two generations of sets: a chatter goes to the recent sets when seen,
+# and the recent sets are moved to the older ones when they hold half of max_chatters, only the older chatters are dropped
+class PresenceIndex():
+
+	def __init__(self, max_chatters=200000):
+		self.max_chatters = max_chatters
+		# channel: set of nicks seen since the last rotation
+		self.channels = {}
+		# channel: set of nicks not seen since the last rotation, only the ones that arent empty
+		self.older = {}
+		# channel: set of nicks, filled by 353 until the 366 replaces the channel sets with it
+		self.pending_names = {}
+		# the nicks stored in all the channels, pending names included
+		self.size = 0
+		self.recent_size = 0
+		self.rotations = 0
+		self.evicted = 0
+		self.dropped = 0
+
+
+	# makes room for one more nick, returns False if there is none to drop because only pending names are left
+	def _make_room(self):
+		if self.size < self.max_chatters:
+			return True
+		if not self.older:
+			self.dropped += 1
+			return False
+		# the older chatters are all as old as far as the index knows, they are dropped a channel at a time
+		channel, chatters = next(iter(self.older.items()))
+		chatters.pop()
+		if not chatters:
+			del self.older[channel]
+		self.size -= 1
+		self.evicted += 1
+		return True
+
+
+	def _added_recent(self, count):
+		self.recent_size += count
+		if self.recent_size < self.max_chatters // 2:
+			return
+		for channel, chatters in self.channels.items():
+			older = self.older.get(channel)
+			if older is None:
+				if chatters:
+					self.older[channel] = chatters
+			# the smaller set is added to the bigger one
+			elif len(older) < len(chatters):
+				chatters |= older
+				self.older[channel] = chatters
+			else:
+				older |= chatters
+		self.channels = {}
+		self.recent_size = 0
+		self.rotations += 1
+
+
+	def join(self, channel, nick):
+		chatters = self.channels.get(channel)
+		if chatters is None:
+			chatters = self.channels[channel] = set()
+		elif nick in chatters:
+			return
+		older = self.older.get(channel)
+		if older is not None and nick in older:
+			older.discard(nick)
+			if not older:
+				del self.older[channel]
+		elif self._make_room():
+			self.size += 1
+		else:
+			return
+		chatters.add(sys.intern(nick))
+		self._added_recent(1)
+
+
+	# a chat message means the chatter is there even if the JOIN never arrived
+	seen = join
+
+
+	def part(self, channel, nick):
+		chatters = self.channels.get(channel)
+		if chatters is not None and nick in chatters:
+			chatters.discard(nick)
+			self.recent_size -= 1
+			self.size -= 1
+			return
+		chatters = self.older.get(channel)
+		if chatters is not None and nick in chatters:
+			chatters.discard(nick)
+			if not chatters:
+				del self.older[channel]
+			self.size -= 1
+
+
+	# a 353 reply, nicks are separated by spaces
+	def names(self, channel, nicks):
+		chatters = self.pending_names.get(channel)
+		if chatters is None:
+			chatters = self.pending_names[channel] = set()
+		for nick in nicks.split():
+			if nick not in chatters and self._make_room():
+				chatters.add(sys.intern(nick))
+				self.size += 1
+
+
+	# a 366 reply, the NAMES list is complete and replaces what was known about the channel
+	def end_of_names(self, channel):
+		chatters = self.pending_names.pop(channel, None)
+		if chatters is None:
+			return
+		self._forget(channel)
+		self.channels[channel] = chatters
+		self._added_recent(len(chatters))
+
+
+	# when the bot leaves the channel
+	def clear(self, channel):
+		self._forget(channel)
+		self.size -= len(self.pending_names.pop(channel, ()))
+
+
+	def _forget(self, channel):
+		recent = len(self.channels.pop(channel, ()))
+		self.recent_size -= recent
+		self.size -= recent + len(self.older.pop(channel, ()))
+
+
+	def is_present(self, channel, nick):
+		return nick in self.channels.get(channel, ()) or nick in self.older.get(channel, ())
+
+
+	def count(self, channel):
+		return len(self.channels.get(channel, ())) + len(self.older.get(channel, ()))
+
+
+	# goes over every channel, for the commands not for every message
+	def channels_of(self, nick):
+		return [channel for sets in (self.channels, self.older) for channel, chatters in sets.items() if nick in chatters]
@@ -0,0 +1,125 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+import random
+import threading
+
+
+# the seconds to wait before an attempt, doubling with each one up to max_delay and randomized so many bots dont retry at once
+def backoff_delay(attempts, min_delay=1, max_delay=60):
+	delay = min(max_delay, min_delay * 2 ** attempts)
+	return random.uniform(delay / 2, delay)
+
+
+# reopens the connections that closed and closes the ones that stopped receiving anything
+# the delay before each attempt doubles up to max_delay and is randomized so many bots dont reconnect at once,
+# it goes back to min_delay when the server welcomes the connection again (376)
+# twitch sends a PING every few minutes, after idle_timeout seconds without any line the bot sends one itself
+# and if nothing arrives in pong_timeout seconds the connection is closed, which makes it reconnect
+class ReconnectSupervisor():
+
+	def __init__(self, timers, reopen, ping, close, min_delay=1, max_delay=60, idle_timeout=360, pong_timeout=30,
+			check_interval=10, log=print):
+		self.timers = timers
+		# reopen(number) raises OSError if it cant connect, ping(number) and close(number) dont wait
+		self.reopen = reopen
+		self.ping = ping
+		self.close = close
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		self.idle_timeout = idle_timeout
+		self.pong_timeout = pong_timeout
+		self.log = log
+		# number: time of the last line received
+		self.last_line = {}
+		# number: time the bot sent a PING that wasnt answered yet
+		self.ping_sent = {}
+		# number: reconnect attempts since the connection was last welcomed
+		self.attempts = {}
+		self.reconnects = 0
+		self.timers.every(None, check_interval, function=self.check, name="connection check")
+
+
+	# called for every line, so it only stores the time
+	def line_received(self, number):
+		self.last_line[number] = time.monotonic()
+		if self.ping_sent:
+			self.ping_sent.pop(number, None)
+
+
+	def connection_ready(self, number):
+		self.attempts[number] = 0
+
+
+	# the connection wont be reopened, like the extra connections whose channels go to the others
+	def forget(self, number):
+		self.last_line.pop(number, None)
+		self.ping_sent.pop(number, None)
+		self.attempts.pop(number, None)
+
+
+	# stops checking the connection until it's open again
+	def connection_closed(self, number):
+		self.last_line.pop(number, None)
+		self.ping_sent.pop(number, None)
+
+
+	# the seconds to wait before the next attempt, each call counts as an attempt
+	def backoff(self, number):
+		attempts = self.attempts.get(number, 0)
+		self.attempts[number] = attempts + 1
+		return backoff_delay(attempts, self.min_delay, self.max_delay)
+
+
+	# reopens the connection after the backoff, returns the delay
+	# the timer only starts the attempt, connecting can take seconds and would hold up the other timers
+	def schedule_reconnect(self, number):
+		self.connection_closed(number)
+		delay = self.backoff(number)
+		self.timers.once(None, delay, function=lambda: self._start_reconnect(number), name=f"reconnect {number}")
+		self.log(f"Connection {number} closed, reconnecting in {delay:.1f}s", cmd="warning")
+		return delay
+
+
+	def _start_reconnect(self, number):
+		threading.Thread(target=self._reconnect, args=(number,), name=f"reconnect {number}", daemon=True).start()
+
+
+	def _reconnect(self, number):
+		try:
+			self.reopen(number)
+		except OSError as error:
+			self.log(f"Handled {type(error).__name__} reconnecting connection {number}: {error}", cmd="warning")
+			self.schedule_reconnect(number)
+		else:
+			self.reconnects += 1
+
+
+	# finds the connections that went quiet, run every check_interval seconds
+	def check(self):
+		now = time.monotonic()
+		for number, last_line in list(self.last_line.items()):
+			ping_sent = self.ping_sent.get(number)
+			if ping_sent is None:
+				if now - last_line > self.idle_timeout:
+					self.ping_sent[number] = now
+					self.ping(number)
+			elif now - ping_sent > self.pong_timeout:
+				self.log(f"Connection {number} received nothing for {now - last_line:.0f}s, closing it", cmd="warning")
+				self.forget(number)
+				self.close(number)
@@ -0,0 +1,72 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import gzip
+import time
+from logsink import *
+
+
+# opens a recording for reading or writing, compressed if the name ends with .gz
+def open_recording(filename, mode):
+	if filename.endswith(".gz"):
+		return gzip.open(filename, mode + "t", encoding="utf-8", newline="\n")
+	return open(filename, mode, encoding="utf-8", newline="\n")
+
+
+# yields (seconds since the first line of the recording, connection number, line) for each line of a recording
+def read_recording(filename):
+	started = None
+	with open_recording(filename, "r") as recording:
+		for entry in recording:
+			milliseconds, connection, line = entry.rstrip("\n").split(" ", 2)
+			if started is None:
+				started = int(milliseconds)
+			yield (int(milliseconds) - started) / 1000, int(connection), line
+
+
+# saves the lines received from the server to replay them later, see benchmarks/bench_replay.py
+# each line of the file is "<unix time in milliseconds> <connection number> <raw line>"
+# the file is appended to, with the time of the clock a recording that spans a restart keeps going forward
+# the lines are queued and written by a background thread so recording doesnt slow down the read loop
+class LineRecorder(QueuedSink):
+
+	def __init__(self, filename, flush_interval=1, max_pending=100000, log=print):
+		QueuedSink.__init__(self, filename, LEVEL_RAW, flush_interval, max_pending, max_pending, log)
+		self.filename = filename
+		# opened here so a file that cant be written is reported when the bot starts
+		self.file = open_recording(filename, "a")
+		self._start_writer("line recorder")
+
+
+	def record(self, line, connection=0):
+		self._queue((time.time(), connection, line.rstrip("\r\n")))
+
+
+	def _write_batch(self, batch):
+		if self.file is None:
+			self.file = open_recording(self.filename, "a")
+		self.file.write("".join(f"{round(timestamp * 1000)} {connection} {line}\n" for timestamp, connection, line in batch))
+		self.file.flush()
+
+
+	def _close_output(self):
+		if self.file is not None:
+			try:
+				self.file.close()
+			except OSError:
+				pass
+			self.file = None
@@ -0,0 +1,188 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# https://dev.twitch.tv/docs/irc/#rate-limits
+
+import time
+import threading
+import collections
+from tokenbucket import *
+
+# lower numbers are sent first
+# control lines (PONG, JOIN, CAP...) dont count against the chat limits
+PRIORITY_CONTROL = 0
+# moderation commands sent as privmsgs, like /delete or /ban
+PRIORITY_MODERATION = 1
+PRIORITY_CHAT = 2
+PRIORITY_NAMES = ("control", "moderation", "chat")
+
+
+# queues the outgoing lines and sends them from its own thread as soon as the rate limits allow it
+# putting a line in the queue never waits
+# with metrics the time each line waited for the rate limits goes in the send_wait histograms
+class SendScheduler():
+
+	# global_bucket replaces the limit of the whole account, with the channels sharded over processes it's shared by all of them
+	def __init__(self, write, time_unit=30, user_limit=20, mod_limit=100, global_limit=100, max_chat_queue=100, on_error=None, metrics=None,
+			global_bucket=None):
+		self.write = write
+		self.on_error = on_error
+		self.metrics = metrics
+		self.time_unit = time_unit
+		self.user_limit = user_limit
+		self.mod_limit = mod_limit
+		self.max_chat_queue = max_chat_queue
+		self.condition = threading.Condition()
+		# one dict for every priority, channel: deque of (line, callback, target, priority, time queued)
+		# the dicts are kept in round robin order, a channel goes to the end after sending
+		self.queues = [{} for name in PRIORITY_NAMES]
+		self.depths = [0 for name in PRIORITY_NAMES]
+		self.sending = 0
+		self.sent = 0
+		self.dropped = 0
+		# the whole limit is available at startup, the same as a client that just connected
+		self.global_bucket = SlidingWindow(global_limit, time_unit, margin=1) if global_bucket is None else global_bucket
+		self.channel_buckets = {}
+		self.moderator_channels = set()
+		self.thread = threading.Thread(target=self._run, name="send scheduler", daemon=True)
+		self.thread.start()
+
+
+	# channel is None for lines that dont go to a channel
+	# callback is called once the line is written with None, or with the error if writing it failed
+	# target is passed to the write function as is, the bot uses it to choose the connection
+	def put(self, line, channel=None, priority=PRIORITY_CHAT, callback=None, target=None):
+		with self.condition:
+			# control lines are never rate limited and stay in a single queue to keep their order
+			if priority == PRIORITY_CONTROL:
+				channel = None
+			queue = self.queues[priority].get(channel)
+			if queue is None:
+				queue = self.queues[priority][channel] = collections.deque()
+			# chat replies are the only thing that can be thrown away if a channel has too many waiting
+			elif priority == PRIORITY_CHAT and len(queue) >= self.max_chat_queue:
+				self.dropped += 1
+				return False
+			queue.append((line, callback, target, priority, time.monotonic()))
+			self.depths[priority] += 1
+			self.condition.notify_all()
+		return True
+
+
+	# the limits of a channel are higher if the bot is a moderator there
+	def set_moderator(self, channel, is_moderator):
+		with self.condition:
+			if is_moderator:
+				self.moderator_channels.add(channel)
+			else:
+				self.moderator_channels.discard(channel)
+			if channel in self.channel_buckets:
+				self.channel_buckets[channel].resize(self.mod_limit if is_moderator else self.user_limit)
+			self.condition.notify_all()
+
+
+	def queue_depths(self):
+		with self.condition:
+			return dict(zip(PRIORITY_NAMES, self.depths))
+
+
+	def channel_depth(self, channel):
+		with self.condition:
+			return sum(len(queues[channel]) for queues in self.queues if channel in queues)
+
+
+	# waits until everything in the queue has been written, returns False on timeout
+	def flush(self, timeout=None):
+		with self.condition:
+			return self.condition.wait_for(lambda: self.sending == 0 and sum(self.depths) == 0, timeout)
+
+
+	def _channel_bucket(self, channel):
+		bucket = self.channel_buckets.get(channel)
+		if bucket is None:
+			limit = self.mod_limit if channel in self.moderator_channels else self.user_limit
+			bucket = self.channel_buckets[channel] = SlidingWindow(limit, self.time_unit, margin=1)
+		return bucket
+
+
+	# returns the next line that can be sent and the seconds to wait if there isnt one
+	def _pop_ready(self):
+		wait = None
+		for priority, queues in enumerate(self.queues):
+			if not queues:
+				continue
+			ready_channel = None
+			if priority == PRIORITY_CONTROL:
+				ready = True
+			else:
+				ready = False
+				global_wait = self.global_bucket.wait_time()
+				if global_wait > 0:
+					wait = global_wait if wait is None else min(wait, global_wait)
+					continue
+				for channel in queues:
+					channel_wait = self._channel_bucket(channel).wait_time()
+					if channel_wait == 0:
+						ready_channel = channel
+						ready = True
+						break
+					wait = channel_wait if wait is None else min(wait, channel_wait)
+			if ready:
+				if priority != PRIORITY_CONTROL:
+					# another process can take the last token of a shared global bucket since wait_time
+					if not self.global_bucket.try_get_tokens():
+						global_wait = self.global_bucket.wait_time()
+						wait = global_wait if wait is None else min(wait, global_wait)
+						continue
+					self.channel_buckets[ready_channel].try_get_tokens()
+				queue = queues.pop(ready_channel)
+				item = queue.popleft()
+				# put the channel at the end so the others get their turn
+				if queue:
+					queues[ready_channel] = queue
+				self.depths[priority] -= 1
+				return item, 0
+		return None, wait
+
+
+	def _run(self):
+		while True:
+			with self.condition:
+				item, wait = self._pop_ready()
+				while item is None:
+					self.condition.wait(wait)
+					item, wait = self._pop_ready()
+				self.sending += 1
+			line, callback, target, priority, queued = item
+			if self.metrics is not None:
+				self.metrics.observe("send_wait." + PRIORITY_NAMES[priority], time.monotonic() - queued)
+			try:
+				try:
+					self.write(line, target)
+				except Exception as error:
+					if callback is not None:
+						callback(error)
+					raise
+				self.sent += 1
+				if callback is not None:
+					callback(None)
+			except Exception as error:
+				if self.on_error is not None:
+					self.on_error(error)
+			finally:
+				with self.condition:
+					self.sending -= 1
+					self.condition.notify_all()
@@ -0,0 +1,91 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import os
+import time
+import threading
+
+
+# writes the config to a temporary file, makes sure it's on disk and only then replaces the old file
+# a crash while saving leaves either the old file or the new one, never half of it
+# lock only keeps the config from changing while it's serialized, two calls at once would share the temporary file
+# so every save of a running bot goes through SettingsWriter.save_now
+def write_config_atomically(config, filename, lock):
+	with lock:
+		text_buffer = io.StringIO()
+		config.write(text_buffer)
+	temporary_filename = filename + ".tmp"
+	with open(temporary_filename, "w", encoding="utf-8") as settings_file:
+		settings_file.write(text_buffer.getvalue())
+		settings_file.flush()
+		os.fsync(settings_file.fileno())
+	os.replace(temporary_filename, filename)
+
+
+# saves the config in the background, a burst of changes is saved once after nothing changed for debounce_time seconds
+# write(config, filename, lock) saves the file, a worker of a sharded bot only saves its own sections
+class SettingsWriter():
+
+	def __init__(self, config, filename, lock, debounce_time=2, log=print, write=write_config_atomically):
+		self.config = config
+		self.write = write
+		self.filename = filename
+		self.lock = lock
+		self.debounce_time = debounce_time
+		self.log = log
+		self.condition = threading.Condition()
+		# held from writing the temporary file to replacing the old one, the writer thread and quit can save at the same time
+		self.write_lock = threading.Lock()
+		self.last_request = None
+		self.writes = 0
+		self.thread = threading.Thread(target=self._run, name="settings writer", daemon=True)
+		self.thread.start()
+
+
+	# never waits, the file is written later by the writer thread
+	def request_save(self):
+		with self.condition:
+			self.last_request = time.monotonic()
+			self.condition.notify()
+
+
+	# writes the file right away, returns False if it couldnt be saved
+	def save_now(self):
+		with self.condition:
+			self.last_request = None
+		with self.write_lock:
+			try:
+				self.write(self.config, self.filename, self.lock)
+			except IOError as error:
+				self.log(f"IOError: Unable to save settings! {error}", cmd="warning")
+				return False
+			self.writes += 1
+		return True
+
+
+	def _run(self):
+		while True:
+			with self.condition:
+				# wait for a change and then until there are no changes for debounce_time seconds
+				while self.last_request is None or time.monotonic() - self.last_request < self.debounce_time:
+					if self.last_request is None:
+						self.condition.wait()
+					else:
+						self.condition.wait(self.last_request + self.debounce_time - time.monotonic())
+				self.last_request = None
+			if self.save_now():
+				self.log("Settings saved!", cmd="info")
@@ -0,0 +1,350 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import time
+import queue
+import bisect
+import signal
+import hashlib
+import threading
+import configparser
+import multiprocessing
+from logsink import *
+from history import *
+from metrics import *
+from headless import *
+from settingswriter import *
+from reconnect import *
+
+# spawn works the same on every os and the workers dont inherit the threads of the coordinator
+CONTEXT = multiprocessing.get_context("spawn")
+
+
+# the same on every process, unlike hash() of a string
+def stable_hash(text):
+	return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# consistent hashing, each node owns the keys between its points and the previous ones on the ring
+# with replicas points per node a new node takes about 1/n of the keys and only from the others
+class HashRing():
+
+	def __init__(self, nodes, replicas=100):
+		self.nodes = list(nodes)
+		points = sorted((stable_hash(f"{node}:{replica}"), node) for node in self.nodes for replica in range(replicas))
+		self.points = [point for point, _ in points]
+		self.owners = [node for _, node in points]
+
+
+	def node_for(self, key):
+		return self.owners[bisect.bisect(self.points, stable_hash(key)) % len(self.points)]
+
+
+# a SlidingWindow shared by every process, the times of the last limit tokens are kept in shared memory
+# the oldest one is at next, so wait_time and try_get_tokens dont depend on the number of tokens in the window
+class SharedSlidingWindow():
+
+	def __init__(self, limit, time_unit, margin=0):
+		self.limit = limit
+		self.time_unit = time_unit + margin
+		self.lock = CONTEXT.Lock()
+		self.times = CONTEXT.RawArray("d", [-1e18] * limit)
+		self.next = CONTEXT.RawValue("i", 0)
+
+
+	# the size of the shared memory cant change, the global limits never do
+	def resize(self, limit):
+		pass
+
+
+	def _wait_time(self, tokens, time_now):
+		# the token that has to leave the window for these to fit
+		oldest = self.times[(self.next.value + min(tokens, self.limit) - 1) % self.limit]
+		return max(0, oldest + self.time_unit - time_now)
+
+
+	def wait_time(self, tokens=1):
+		with self.lock:
+			return self._wait_time(tokens, time.monotonic())
+
+
+	def try_get_tokens(self, tokens=1):
+		with self.lock:
+			time_now = time.monotonic()
+			if self._wait_time(tokens, time_now) > 0:
+				return False
+			for _ in range(tokens):
+				self.times[self.next.value] = time_now
+				self.next.value = (self.next.value + 1) % self.limit
+			return True
+
+
+# what a worker process gets from the coordinator, passed to IRCBot as shard
+class ShardContext():
+
+	def __init__(self, number, ring, events, send_budget, join_budget, config_lock, metrics_interval, log_level):
+		self.number = number
+		self.ring = ring
+		# everything the worker tells the coordinator: logs, metrics, quit, restart and the joins, parts and messages of channels of other workers
+		self.events = events
+		# what the coordinator tells the worker: ("join", channel), ("part", channel), ("privmsg", channel, text) and ("quit",)
+		self.control = CONTEXT.Queue()
+		self.send_budget = send_budget
+		self.join_budget = join_budget
+		# the workers save their sections of the same settings file
+		self.config_lock = config_lock
+		self.metrics_interval = metrics_interval
+		self.log_level = log_level
+		# set in the worker when the coordinator tells it to quit
+		self.stopping = False
+
+
+	def owns(self, channel):
+		return self.ring.node_for(channel) == self.number
+
+
+	def send(self, event):
+		self.events.put(event)
+
+
+	# the file is read again and only the sections of this worker are replaced, DEFAULT belongs to the coordinator
+	def write_config(self, config, filename, lock):
+		with self.config_lock:
+			current = configparser.ConfigParser(allow_no_value=False, delimiters=("="), comment_prefixes=("#"), empty_lines_in_values=False)
+			current.read(filename, encoding="utf-8")
+			with lock:
+				defaults = config.defaults()
+				for section in set(config.sections()) | set(current.sections()):
+					if not self.owns(section):
+						continue
+					current.remove_section(section)
+					if config.has_section(section):
+						current.add_section(section)
+						for option, value in config.items(section, raw=True):
+							if option not in defaults or defaults[option] != value:
+								current.set(section, option, value)
+			write_config_atomically(current, filename, threading.Lock())
+
+
+	# runs the commands of the coordinator on a thread of the worker
+	def start_control(self, bot):
+		thread = threading.Thread(target=self._control, args=(bot,), name="shard control", daemon=True)
+		thread.start()
+
+
+	def _control(self, bot):
+		while True:
+			event = self.control.get()
+			if event[0] == "join":
+				bot._join(event[1])
+			elif event[0] == "part":
+				bot._part(event[1])
+			elif event[0] == "privmsg":
+				bot.send_PRIVMSG(event[1], event[2])
+			elif event[0] == "quit":
+				self.stopping = True
+				bot.ui.quit_var.set()
+				bot.wake()
+
+
+	# sends the counters and histograms, the coordinator adds up the ones of every worker
+	def start_metrics(self, bot):
+		bot.timers.every(None, self.metrics_interval, function=lambda: self.send(("metrics", self.number, bot.metrics.export())),
+			name="shard metrics")
+
+
+# the entry point of a worker process, the same loop as volpesbot.py for the channels of this worker
+def run_worker(shard):
+	# ctrl+c reaches every process, the coordinator decides when the workers quit
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	from volpesbot_irc import IRCBot
+	bot = IRCBot(headless=True, shard=shard)
+	bot.connect()
+	for connection, line in bot.lines():
+		bot.handle_line(line, connection)
+
+
+# runs the workers and does what has to be done once for the bot account: the rate limits of the account,
+# the log file, the metrics port and restarting the workers that stop
+class ShardCoordinator():
+
+	def __init__(self, workers, startup_clock=None):
+		self.startup_clock = time.perf_counter() if startup_clock is None else startup_clock
+		self.config = configparser.ConfigParser(allow_no_value=False, delimiters=("="), comment_prefixes=("#"), empty_lines_in_values=False)
+		with open("volpesbot_config.ini") as settings_file:
+			self.config.read_file(settings_file)
+		self.ring = HashRing(range(workers))
+		self.ui = HeadlessUI()
+		self.log_sinks = [UISink(self.ui, LEVEL_RAW if self.config.getboolean("DEFAULT", "verbose_log") else LEVEL_CHAT)]
+		log_file = self.config.get("DEFAULT", "log_file", fallback="")
+		if log_file:
+			self.log_sinks.append(JsonLinesSink(log_file,
+				level=parse_level(self.config.get("DEFAULT", "log_file_level", fallback="chat")),
+				max_bytes=self.config.getint("DEFAULT", "log_file_max_bytes", fallback=10 * 1024 * 1024),
+				rotate_interval=self.config.getfloat("DEFAULT", "log_file_rotate_hours", fallback=24) * 60 * 60,
+				backup_count=self.config.getint("DEFAULT", "log_file_backups", fallback=5), log=self.log))
+		# the workers only read the history, so the database exists before they start
+		history = open_history(self.config, self.log)
+		if history is not None:
+			self.log_sinks.append(history)
+		# the same limits as SendScheduler and JoinScheduler use for the whole account
+		self.send_budget = SharedSlidingWindow(100, 30, margin=1)
+		self.join_budget = SharedSlidingWindow(self.config.getint("DEFAULT", "join_rate_limit", fallback=20), 10, margin=1)
+		self.events = CONTEXT.Queue()
+		config_lock = CONTEXT.Lock()
+		metrics_interval = self.config.getfloat("DEFAULT", "metrics_interval", fallback=10)
+		log_level = min(sink.level for sink in self.log_sinks)
+		self.shards = [ShardContext(number, self.ring, self.events, self.send_budget, self.join_budget, config_lock,
+			metrics_interval, log_level) for number in range(workers)]
+		self.processes = {}
+		# number: time the worker was started, times it stopped in a row and when it's started again, see _check_workers
+		self.started_at = {}
+		self.restarts = {}
+		self.restart_at = {}
+		self.restart_min_delay = self.config.getfloat("DEFAULT", "reconnect_min_delay", fallback=1)
+		self.restart_max_delay = self.config.getfloat("DEFAULT", "reconnect_max_delay", fallback=60)
+		# number: the last metrics export of each worker
+		self.worker_metrics = {}
+		self.metrics = Metrics()
+		self.reporter = MetricsReporter(self.metrics, interval=metrics_interval,
+			filename=self.config.get("DEFAULT", "metrics_snapshot_file", fallback=""), log=self.log)
+		metrics_port = self.config.getint("DEFAULT", "metrics_port", fallback=0)
+		if metrics_port:
+			try:
+				self.metrics_server = MetricsServer(self.metrics, SamplingProfiler(), metrics_port)
+			except OSError as error:
+				self.log(f"Handled {type(error).__name__}: unable to serve the metrics on port {metrics_port}: {error}", cmd="warning")
+		self.quitting = False
+		self.restarting = False
+
+
+	def log(self, data, nick="", cmd="", channel="", msg="", nick_color="", level=None):
+		level = CMD_LEVELS.get(cmd, LEVEL_RAW) if level is None else level
+		for sink in self.log_sinks:
+			if level >= sink.level:
+				sink.emit(level, data, nick, cmd, channel, msg, nick_color)
+
+
+	def _start_worker(self, number):
+		process = CONTEXT.Process(target=run_worker, args=(self.shards[number],), name=f"worker {number}")
+		process.start()
+		self.processes[number] = process
+		self.started_at[number] = time.monotonic()
+
+
+	def run(self):
+		install_signal_handlers(self)
+		channels = [channel for channel in self.config.sections() if self.config.getboolean(channel, "connect_on_startup")]
+		for number in range(len(self.shards)):
+			self._start_worker(number)
+			owned = sum(1 for channel in channels if self.ring.node_for(channel) == number)
+			self.log(f"Worker {number} started with {owned} channels", cmd="info")
+		while True:
+			try:
+				event = self.events.get(timeout=1)
+			except queue.Empty:
+				event = None
+			# a quit or restart from a worker is handled before that worker is seen stopping
+			if event is not None:
+				self._handle_event(event)
+			if self.ui.quit_var.is_set() or self.ui.restart_var.is_set():
+				self._stop_workers()
+				if self.ui.restart_var.is_set():
+					self.log("Restarting the workers", cmd="info")
+					self._close_log_sinks()
+					self.ui.root.quit()
+					os.execv(sys.executable, [sys.executable] + sys.argv)
+				self._close_log_sinks()
+				self.ui.root.quit()
+				return
+			self._check_workers()
+
+
+	# the signal handlers and the workers wake the coordinator with an event
+	def wake(self):
+		self.events.put(("wake",))
+
+
+	def _handle_event(self, event):
+		kind = event[0]
+		if kind == "log":
+			level, data, nick, cmd, channel, msg, nick_color = event[2]
+			if cmd in ("info", "warning"):
+				data = f"worker {event[1]}: {data}"
+			self.log(data, nick, cmd, channel, msg, nick_color, level=level)
+		elif kind == "metrics":
+			self.worker_metrics[event[1]] = event[2]
+			self.metrics.load_exports(self.worker_metrics.values())
+		elif kind in ("join", "part", "privmsg"):
+			self.shards[self.ring.node_for(event[1])].control.put(event)
+		elif kind == "quit":
+			self.ui.quit_var.set()
+		elif kind == "restart":
+			self.ui.restart_var.set()
+
+
+	# a worker that stopped on its own is started again with the same channels, after the same backoff as a reconnect
+	# so a worker that cant start doesnt start a new process every second
+	def _check_workers(self):
+		now = time.monotonic()
+		for number, process in list(self.processes.items()):
+			if process.exitcode is None:
+				continue
+			restart_at = self.restart_at.get(number)
+			if restart_at is None:
+				# a worker that ran for longer than the longest delay didnt stop because of how it was started
+				if now - self.started_at[number] > self.restart_max_delay:
+					self.restarts[number] = 0
+				restarts = self.restarts.get(number, 0)
+				self.restarts[number] = restarts + 1
+				delay = backoff_delay(restarts, self.restart_min_delay, self.restart_max_delay)
+				self.restart_at[number] = now + delay
+				if restarts:
+					self.log(f"Worker {number} keeps stopping, exit code {process.exitcode}, {restarts + 1} times in a row, "
+						f"starting it again in {delay:.1f}s", cmd="warning")
+				else:
+					self.log(f"Worker {number} stopped with exit code {process.exitcode}, starting it again in {delay:.1f}s",
+						cmd="warning")
+			elif now >= restart_at:
+				del self.restart_at[number]
+				self._start_worker(number)
+
+
+	def _stop_workers(self, timeout=15):
+		for shard in self.shards:
+			shard.control.put(("quit",))
+		deadline = time.monotonic() + timeout
+		for number, process in self.processes.items():
+			process.join(max(0, deadline - time.monotonic()))
+			if process.exitcode is None:
+				self.log(f"Worker {number} didnt quit in time, terminating it", cmd="warning")
+				process.terminate()
+		# the last log lines of the workers
+		while True:
+			try:
+				event = self.events.get_nowait()
+			except queue.Empty:
+				break
+			if event[0] == "log":
+				self._handle_event(event)
+
+
+	def _close_log_sinks(self):
+		for sink in self.log_sinks:
+			sink.close()
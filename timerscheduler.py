@@ -0,0 +1,155 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import math
+import heapq
+import time
+import threading
+import itertools
+
+
+# seconds to wait before a timer, raises ValueError unless it's a positive number, float() also takes "nan" and "inf"
+def parse_delay(text):
+	delay = float(text)
+	if not math.isfinite(delay) or delay <= 0:
+		raise ValueError(f"invalid delay: {text}")
+	return delay
+
+
+# "<seconds> [<min messages>] <message>" to (seconds, min messages, message), raises ValueError
+# a message that starts with a number needs the min messages before it, even if it's 0
+def parse_timer(text):
+	interval, _, rest = text.strip().partition(" ")
+	interval = parse_delay(interval)
+	min_messages, _, message = rest.strip().partition(" ")
+	if min_messages.isdigit() and message.strip():
+		min_messages = int(min_messages)
+	else:
+		min_messages, message = 0, rest
+	message = message.strip()
+	if not message:
+		raise ValueError(f"invalid timer: {text}")
+	return interval, min_messages, message
+
+
+class ChannelTimer():
+
+	__slots__ = ("channel", "name", "message", "function", "interval", "repeat", "min_messages", "due", "messages_seen",
+		"cancelled")
+
+	def __init__(self, channel, name, message, function, interval, repeat, min_messages, due, messages_seen):
+		self.channel = channel
+		self.name = name
+		self.message = message
+		# called instead of sending the message if it's not None
+		self.function = function
+		# a timer that doesnt repeat is forgotten after firing, until then it's tried every interval
+		self.interval = interval
+		self.repeat = repeat
+		self.min_messages = min_messages
+		self.due = due
+		# the chat messages of the channel when the timer was set or last fired
+		self.messages_seen = messages_seen
+		self.cancelled = False
+
+
+	def cancel(self):
+		self.cancelled = True
+
+
+# every timer of every channel waits on one thread, the next one to fire is at the top of a heap
+# a timer with min_messages only fires if that many chat messages were sent since it was set or last fired,
+# otherwise it waits for its next interval, a cancelled timer is left in the heap and skipped when it comes up
+class TimerScheduler():
+
+	def __init__(self, send, log=print):
+		# send(channel, message) for the timers without a function
+		self.send = send
+		self.log = log
+		# (due, sequence, timer), the sequence keeps the order of timers due at the same time
+		self.heap = []
+		self.sequence = itertools.count()
+		self.condition = threading.Condition()
+		# channel: number of chat messages seen, only ever grows
+		self.chat_messages = {}
+		self.fired = 0
+		self.skipped = 0
+		self.thread = threading.Thread(target=self._run, name="timers", daemon=True)
+		self.thread.start()
+
+
+	# called for every chat message
+	def chat_message(self, channel):
+		self.chat_messages[channel] = self.chat_messages.get(channel, 0) + 1
+
+
+	# fires every interval seconds, the first time after delay seconds (interval if it's None)
+	def every(self, channel, interval, message=None, function=None, name=None, min_messages=0, delay=None):
+		return self._add(channel, name, message, function, interval, True, min_messages,
+			interval if delay is None else delay)
+
+
+	# fires once after delay seconds, with min_messages it's tried again every delay seconds until enough messages are sent
+	def once(self, channel, delay, message=None, function=None, name=None, min_messages=0):
+		return self._add(channel, name, message, function, delay, False, min_messages, delay)
+
+
+	def _add(self, channel, name, message, function, interval, repeat, min_messages, delay):
+		timer = ChannelTimer(channel, name, message, function, max(interval, 1), repeat, min_messages,
+			time.monotonic() + delay, self.chat_messages.get(channel, 0))
+		with self.condition:
+			heapq.heappush(self.heap, (timer.due, next(self.sequence), timer))
+			# the thread only needs to wake up if it was waiting for a later timer
+			if self.heap[0][2] is timer:
+				self.condition.notify()
+		return timer
+
+
+	# the timers not cancelled, optionally only of one channel, sorted by when they fire next
+	def timers(self, channel=None):
+		with self.condition:
+			entries = sorted(self.heap)
+		return [timer for _, _, timer in entries if not timer.cancelled and (channel is None or timer.channel == channel)]
+
+
+	def _run(self):
+		while True:
+			with self.condition:
+				while not self.heap or self.heap[0][0] > time.monotonic():
+					self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+				_, _, timer = heapq.heappop(self.heap)
+				if timer.cancelled:
+					continue
+				messages = self.chat_messages.get(timer.channel, 0)
+				fire = messages - timer.messages_seen >= timer.min_messages
+				if fire:
+					timer.messages_seen = messages
+				if timer.repeat or not fire:
+					# after a long stall the timer fires once, not once for each interval missed
+					timer.due = max(timer.due + timer.interval, time.monotonic())
+					heapq.heappush(self.heap, (timer.due, next(self.sequence), timer))
+			if not fire:
+				self.skipped += 1
+				continue
+			self.fired += 1
+			try:
+				if timer.function is not None:
+					timer.function()
+				else:
+					self.send(timer.channel, timer.message)
+			except Exception as error:
+				self.log(f"Handled {type(error).__name__} in the timer {timer.name or timer.message}: {error}", cmd="warning")
@@ -17,33 +17,45 @@
 # https://dev.twitch.tv/docs/irc/guide
 
 import time
+import collections
 
-class TokenBucket():
+# allows at most limit tokens in any time_unit seconds, the same way twitch counts the messages
+# unlike a token bucket, which allows its whole size at once and then keeps refilling, up to twice the limit in the first time_unit
+class SlidingWindow():
 
-	def __init__(self, bucket_size, time_unit):
-		self.bucket_size = bucket_size
-		self.tokens = 0
-		self.time_unit = time_unit
-		self.filling_rate = bucket_size / time_unit
-		self.last_fill = time.time()
+	# margin is added to time_unit, the server counts when the lines arrive and some can arrive closer together than they were sent
+	def __init__(self, limit, time_unit, margin=0):
+		self.limit = limit
+		self.time_unit = time_unit + margin
+		# when the tokens in the window were taken, oldest first
+		self.times = collections.deque()
 
-	def get_tokens(self, tokens=1):
 
-		# setup time variables
-		time_now = time.time()
-		time_elapsed = time_now - self.last_fill
-		self.last_fill = time_now
+	def _expire(self, time_now):
+		while self.times and time_now - self.times[0] >= self.time_unit:
+			self.times.popleft()
 
-		#fill the bucket
-		self.tokens = self.tokens + (time_elapsed * self.filling_rate)
 
-		# discard overflowing tokens
-		if self.tokens > self.bucket_size:
-			self.tokens = self.bucket_size
+	# tokens taken in the last time_unit still count against the new limit
+	def resize(self, limit):
+		self.limit = limit
 
-		# either remove tokens from the bucket or wait for the appropriate amount of time
-		if self.tokens >= tokens:
-			self.tokens -= tokens
-		else:
-			time.sleep(tokens / self.filling_rate)
-			self.log(f"Hit rate limit, {self.tokens} tokens left after refilling.")
\ No newline at end of file
+
+	# seconds until enough tokens leave the window, 0 if they can be taken now
+	def wait_time(self, tokens=1):
+		time_now = time.monotonic()
+		self._expire(time_now)
+		excess = len(self.times) + tokens - self.limit
+		if excess <= 0:
+			return 0
+		return self.times[excess - 1] + self.time_unit - time_now
+
+
+	# takes the tokens without waiting, returns False if there arent enough
+	def try_get_tokens(self, tokens=1):
+		if self.wait_time(tokens) > 0:
+			return False
+		time_now = time.monotonic()
+		for _ in range(tokens):
+			self.times.append(time_now)
+		return True
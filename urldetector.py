@@ -0,0 +1,110 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+# finds links in chat messages looking at each word once, the time is linear in the length of the message
+# a word is a link if it starts with http:// or https:// or if its host ends with a known top level domain
+
+# generic top level domains that show up in chat, plus punycode ones checked separately
+GENERIC_TLDS = """
+com net org info biz edu gov mil int arpa io co me tv gg ly xyz app dev online site store shop tech club live stream fun
+top vip link click icu buzz cloud page blog news media games game moe art design space website world today email
+network digital team zone chat social fans ai to sh cc ws su ru eu asia mobi pro name tel travel jobs museum aero coop cat
+lol wtf gay porn sex xxx adult casino bet poker win money cash loan finance crypto bitcoin nft exchange trade market
+"""
+
+# every two letter country code top level domain
+COUNTRY_TLDS = """
+ac ad ae af ag ai al am ao aq ar as at au aw ax az ba bb bd be bf bg bh bi bj bm bn bo br bs bt bw by bz ca cc cd cf cg ch
+ci ck cl cm cn co cr cu cv cw cx cy cz de dj dk dm do dz ec ee eg er es et eu fi fj fk fm fo fr ga gd ge gf gg gh gi gl gm
+gn gp gq gr gs gt gu gw gy hk hm hn hr ht hu id ie il im in io iq ir is it je jm jo jp ke kg kh ki km kn kp kr kw ky kz la
+lb lc li lk lr ls lt lu lv ly ma mc md me mg mh mk ml mm mn mo mp mq mr ms mt mu mv mw mx my mz na nc ne nf ng ni nl no np
+nr nu nz om pa pe pf pg ph pk pl pm pn pr ps pt pw py qa re ro rs ru rw sa sb sc sd se sg sh si sk sl sm sn so sr ss st su
+sv sx sy sz tc td tf tg th tj tk tl tm tn to tr tt tv tw tz ua ug uk us uy uz va vc ve vg vi vn vu wf ws ye yt za zm zw
+"""
+
+TLDS = frozenset(GENERIC_TLDS.split()) | frozenset(COUNTRY_TLDS.split())
+
+# characters around a word that are not part of the link, like "(example.com)," or "<https://example.com>"
+LEADING_PUNCTUATION = "([{<\"'`*"
+TRAILING_PUNCTUATION = ".,;:!?)]}>\"'`*"
+# the host ends at the first of these
+HOST_END = "/?#:"
+
+
+class URLDetector():
+
+	# extra_tlds are added to TLDS, for example the ones read from a file
+	def __init__(self, extra_tlds=()):
+		self.tlds = TLDS | frozenset(tld.lower().lstrip(".") for tld in extra_tlds)
+
+
+	# returns the first link in the text or None
+	def search(self, text):
+		# most messages dont have a dot, those cant have a link without a scheme
+		if "." not in text and "://" not in text:
+			return None
+		for word in text.split():
+			if ("." in word or "://" in word) and self.is_url(word):
+				return word
+		return None
+
+
+	def is_url(self, word):
+		word = word.lstrip(LEADING_PUNCTUATION).rstrip(TRAILING_PUNCTUATION)
+		# a sentence ending with a dot
+		if "." not in word and "://" not in word:
+			return False
+		lowered = word.lower()
+		scheme_end = lowered.find("://")
+		if scheme_end != -1 and lowered[:scheme_end] in ("http", "https"):
+			# anything after the scheme is a link, even if the host isnt valid
+			return len(word) > scheme_end + 3
+		host = lowered
+		# user@host or an email address
+		at = host.rfind("@")
+		if at != -1:
+			host = host[at + 1:]
+		for character in HOST_END:
+			end = host.find(character)
+			if end != -1:
+				host = host[:end]
+		return self.is_host(host.rstrip(TRAILING_PUNCTUATION))
+
+
+	# a domain with a known top level domain or an ipv4 address
+	def is_host(self, host):
+		labels = host.split(".")
+		if len(labels) < 2:
+			return False
+		tld = labels[-1]
+		# the cheapest check first, most words with a dot dont end with a top level domain
+		if tld not in self.tlds and not tld.startswith("xn--") and not tld.isdigit():
+			return False
+		for label in labels:
+			if not label or len(label) > 63 or label[0] == "-" or label[-1] == "-":
+				return False
+			if not label.replace("-", "").isalnum():
+				return False
+		if tld.isdigit():
+			return len(labels) == 4 and all(label.isdigit() and len(label) <= 3 and int(label) <= 255 for label in labels)
+		return True
+
+
+# the top level domains in a file, one for each line, the lines starting with # are ignored
+def read_tlds(filename):
+	with open(filename, encoding="utf-8") as tlds_file:
+		return [line.strip() for line in tlds_file if line.strip() and not line.startswith("#")]
@@ -14,50 +14,39 @@
 # 	You should have received a copy of the GNU General Public License
 # 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+# measured before anything else is imported, see IRCBot.STARTUP_BUDGET
+import time
+startup_clock = time.perf_counter()
+
+import sys
 from volpesbot_irc import *
 
-irc_bot = IRCBot()
-
-irc_bot.connect()
-
-# iterate all the lines in the buffer
-for line in irc_bot.handle:
-
-	# remove spaces from the end of the string
-	line = line.strip()
-
-	# divide all the data into appropriate variables
-	matches_tuple = irc_bot.regex_message.match(line)
-	data = line
-	tags = matches_tuple["tags"]
-	nick = matches_tuple["nick"]
-	user = matches_tuple["user"]
-	host = matches_tuple["host"]
-	cmd = matches_tuple["cmd"]
-	channel = matches_tuple["channel"]
-	msg = matches_tuple["msg"]
-
-
-	# log data received
-	irc_bot.log(data, tags, nick, user, host, cmd, channel, msg)
-
-	# call the appropriate function if it exists
-	try:
-		if cmd not in ("CAP", "001", "002", "003", "004", "375", "372", "353", "366", "USERSTATE", "ROOMSTATE", "HOSTTARGET"):
-			getattr(irc_bot, "on_" + cmd)(data, tags, nick, user, host, cmd, channel, msg)
-	except AttributeError as error:
-		irc_bot.log(f"Handled AttributeError: {error}")
-	except ConnectionResetError as error:
-		irc_bot.log(f"Handled ConnectionResetError: {error}", cmd="warning")
-		irc_bot.ui.restart_var.set()
-	except ConnectionAbortedError as error:
-		irc_bot.log(f"Handled ConnectionResetError: {error}", cmd="warning")
-		irc_bot.ui.restart_var.set()
-
-	# if the program has been flagged to be closed
-	if irc_bot.ui.quit_var.is_set():
-		irc_bot.quit()
-	# if the program has been flagged to be restarted
-	if irc_bot.ui.restart_var.is_set():
-		irc_bot.restart()
+# --headless or "headless = yes" in the settings runs the bot without tkinter
+headless = "--headless" in sys.argv
+
+# the worker processes of --workers import this file again, only the main process runs the bot
+if __name__ != "__main__":
+	pass
+
+# --workers N spreads the channels over N headless processes, see shards.py
+elif "--workers" in sys.argv:
+	from shards import *
+
+	ShardCoordinator(int(sys.argv[sys.argv.index("--workers") + 1]), startup_clock).run()
+
+# the asyncio runtime keeps reading from the server while messages wait for the rate limit
+elif "--async" in sys.argv:
+	from volpesbot_async import *
+
+	irc_bot = AsyncIRCBot(headless, startup_clock)
+	irc_bot.run()
+
+else:
+	irc_bot = IRCBot(headless, startup_clock)
+
+	irc_bot.connect()
+
+	# iterate all the lines received by every connection, closed connections are reopened in the background
+	for connection, line in irc_bot.lines():
 
+		irc_bot.handle_line(line, connection)
@@ -0,0 +1,237 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import ssl
+import asyncio
+import inspect
+from volpesbot_irc import *
+
+
+# a connection of AsyncIRCBot, write can be called from any thread
+class AsyncIRCConnection():
+
+	def __init__(self, bot, number):
+		self.bot = bot
+		self.number = number
+		self.reader = None
+		self.writer = None
+		self.outbound_queue = None
+		self.write_task = None
+		self.closed = False
+		self.write_error = None
+		# the writes to the transport and the lines in each direction, see IRCConnection
+		self.send_calls = 0
+		self.lines_received = 0
+		self.lines_sent = 0
+
+
+	async def open(self):
+		context = ssl.create_default_context() if self.bot.tls else None
+		self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.bot.server, self.bot.port, ssl=context), 10)
+		self.outbound_queue = asyncio.Queue()
+		self.write_task = asyncio.create_task(self._write_loop())
+
+
+	# the queue is only touched from the event loop thread, raises OSError if the connection is closed
+	# like IRCConnection.write, so the lines written after close arent counted as sent
+	def write(self, line):
+		if self.closed:
+			raise self.write_error or ConnectionAbortedError(f"connection {self.number} is closed")
+		self.bot.loop.call_soon_threadsafe(self.outbound_queue.put_nowait, line)
+
+
+	# the queue is already empty when the bot quits, _flags_loop waits for it
+	def flush(self, timeout=1):
+		return True
+
+
+	# called on the event loop thread, _write calls it again from the scheduler after write raised, which does nothing
+	def close(self):
+		if self.closed:
+			return
+		self.closed = True
+		self.write_task.cancel()
+		self.writer.close()
+
+
+	# returns the error that closed the connection, None if the server closed it
+	async def read_loop(self):
+		while True:
+			try:
+				line = await self.reader.readline()
+			# any socket error, an ssl.SSLError or a TimeoutError too, closes the connection and the bot reconnects
+			except OSError as error:
+				return error
+			# an empty line means the server closed the connection
+			if not line:
+				return None
+			self.lines_received += 1
+			await self.bot.handle_line_async(line.decode("utf-8", errors="replace"), self.number)
+
+
+	# writes the queued lines to the socket, the ones queued within the flush window go in the same write
+	async def _write_loop(self):
+		while True:
+			messages = [await self.outbound_queue.get()]
+			if self.bot.write_flush_window:
+				await asyncio.sleep(self.bot.write_flush_window)
+			while not self.outbound_queue.empty():
+				messages.append(self.outbound_queue.get_nowait())
+			try:
+				self.writer.write(("\r\n".join(messages) + "\r\n").encode("utf-8"))
+				self.send_calls += 1
+				self.lines_sent += len(messages)
+				# only waits if the socket buffer is full
+				await self.writer.drain()
+			# the read loop sees the closed socket and the connection is reopened
+			except OSError as error:
+				self.write_error = error
+				self.bot.log(f"Handled {type(error).__name__} on connection {self.number}: {error}", cmd="warning")
+				self.close()
+			finally:
+				for _ in messages:
+					self.outbound_queue.task_done()
+
+
+# same bot as IRCBot but reading and writing run as separate tasks on an event loop
+class AsyncIRCBot(IRCBot):
+
+	def __init__(self, headless=False, startup_clock=None):
+		IRCBot.__init__(self, headless, startup_clock)
+		# created when the event loop starts
+		self.loop = None
+
+
+	# starts the event loop, the main connection is reopened when it closes
+	def run(self):
+		asyncio.run(self._main())
+
+
+	async def _main(self):
+		self.loop = asyncio.get_running_loop()
+
+		# started first so quit and restart work while the first connection is retried
+		flags_task = asyncio.create_task(self._flags_loop())
+		try:
+			self.log(f"Connecting to: {self.server}", cmd="info")
+			# if the first attempt fails the next ones wait the same backoff as the reconnects
+			try:
+				connection = await self._open_connection_async(0)
+			except (OSError, asyncio.TimeoutError) as error:
+				self.log(f"Handled {type(error).__name__} connecting to {self.server}: {error}", cmd="warning")
+				connection = await self._reconnect_async(0)
+
+			while True:
+				error = await connection.read_loop()
+				if error is not None:
+					self.log(f"Handled {type(error).__name__}: {error}", cmd="warning")
+				connection.close()
+				self.connections.pop(0, None)
+				# the channels wait for the main connection to be open again
+				self.join_scheduler.connection_lost(0)
+				connection = await self._reconnect_async(0)
+		finally:
+			flags_task.cancel()
+			for connection in list(self.connections.values()):
+				connection.close()
+
+
+	async def _open_connection_async(self, number):
+		connection = AsyncIRCConnection(self, number)
+		await connection.open()
+		self.connections[number] = connection
+		self.supervisor.line_received(number)
+		self._authenticate(number)
+		# the main connection is read by _main
+		if number != 0:
+			asyncio.create_task(self._read_connection(connection))
+		return connection
+
+
+	# waits the backoff of the supervisor before each attempt
+	async def _reconnect_async(self, number):
+		self.supervisor.connection_closed(number)
+		while True:
+			delay = self.supervisor.backoff(number)
+			self.log(f"Connection {number} closed, reconnecting in {delay:.1f}s", cmd="warning")
+			await asyncio.sleep(delay)
+			try:
+				connection = await self._open_connection_async(number)
+			except (OSError, asyncio.TimeoutError) as error:
+				self.log(f"Handled {type(error).__name__} reconnecting connection {number}: {error}", cmd="warning")
+			else:
+				self.supervisor.reconnects += 1
+				return connection
+
+
+	# called from the timer thread when the supervisor finds a dead connection
+	def _close_connection(self, number):
+		connection = self.connections.get(number)
+		if connection is not None:
+			self.loop.call_soon_threadsafe(connection.close)
+
+
+	# called by the join scheduler thread, waits until the connection is open
+	def _open_connection(self, number):
+		asyncio.run_coroutine_threadsafe(self._open_connection_async(number), self.loop).result()
+
+
+	async def _read_connection(self, connection):
+		error = await connection.read_loop()
+		if error is not None:
+			self.log(f"Handled {type(error).__name__} on connection {connection.number}: {error}", cmd="warning")
+		connection.close()
+		self.connections.pop(connection.number, None)
+		self.supervisor.forget(connection.number)
+		# the channels are moved to the connections still open
+		self.join_scheduler.connection_lost(connection.number)
+
+
+	# same as handle_line, on_ functions can either be normal functions or coroutines
+	async def handle_line_async(self, line, connection=0):
+		start = time.perf_counter()
+		message, result = self._handle_message(line, connection)
+		if inspect.isawaitable(result):
+			try:
+				await result
+			except self.HANDLER_ERRORS as error:
+				self._handler_error(error)
+		self.metrics.line_handled(message.cmd, time.perf_counter() - start)
+
+
+	# checks if the program has been flagged to be closed or restarted
+	async def _flags_loop(self):
+		while True:
+			await asyncio.sleep(0.2)
+			if self.ui.quit_var.is_set() or self.ui.restart_var.is_set():
+				# give the queued messages a few seconds to be sent
+				try:
+					await asyncio.to_thread(self.send_scheduler.flush, 5)
+					queues = [connection.outbound_queue.join() for connection in self.connections.values()]
+					await asyncio.wait_for(asyncio.gather(*queues), 5)
+				except asyncio.TimeoutError:
+					self.log("Closing with unsent messages in the queue", cmd="warning")
+				if self.ui.quit_var.is_set():
+					self.quit()
+				else:
+					self.restart()
+
+
+	# the PONG skips the queue so a full queue cant get the bot disconnected
+	async def on_PING(self, message):
+		pong = f"PONG :{message.msg}"
+		self.log(pong, nick=self.bot_nick, cmd="PONG", msg=message.msg)
+		self.connections[message.connection].writer.write((pong + "\r\n").encode("utf-8"))
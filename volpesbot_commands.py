@@ -0,0 +1,377 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+import datetime
+import math
+from banlist import *
+from phrasematcher import *
+from timerscheduler import *
+
+
+# who can use a command, ROLE_MOD includes the broadcaster and the bot owner
+ROLE_EVERYONE = 0
+ROLE_MOD = 1
+
+# every command the bot knows, filled by the command decorator when this module is imported
+COMMANDS = {}
+
+
+class Command():
+
+	__slots__ = ("name", "function", "role", "aliases")
+
+	def __init__(self, name, function, role=ROLE_EVERYONE, aliases=()):
+		self.name = name
+		self.function = function
+		self.role = role
+		self.aliases = aliases
+
+
+# everything a command needs to know about the message that called it
+class CommandContext():
+
+	__slots__ = ("message", "channel", "nick", "user", "command", "param",
+		"user_is_bot_owner", "user_is_broadcaster", "user_is_mod", "user_is_vip")
+
+	def __init__(self, message, command, param, user_is_bot_owner, user_is_broadcaster, user_is_mod, user_is_vip):
+		self.message = message
+		self.channel = message.channel
+		self.nick = message.nick
+		self.user = message.user
+		self.command = command
+		self.param = param
+		self.user_is_bot_owner = user_is_bot_owner
+		self.user_is_broadcaster = user_is_broadcaster
+		self.user_is_mod = user_is_mod
+		self.user_is_vip = user_is_vip
+
+
+	def has_role(self, role):
+		if role == ROLE_MOD:
+			return self.user_is_mod or self.user_is_broadcaster or self.user_is_bot_owner
+		return True
+
+
+# registers the function as a command, the name defaults to the function name without "command_"
+def command(name=None, role=ROLE_EVERYONE, aliases=()):
+	def register(function):
+		registered_command = Command(name or function.__name__.removeprefix("command_"), function, role, aliases)
+		for command_name in (registered_command.name,) + tuple(aliases):
+			COMMANDS[command_name] = registered_command
+		return function
+	return register
+
+
+def user_not_authorized(bot, context):
+	bot.log(f"User {context.nick}(owner: {context.user_is_bot_owner}, broadcaster: {context.user_is_broadcaster}, "
+		f"mod: {context.user_is_mod}, vip: {context.user_is_vip}) used command \"{context.command}\"", cmd="warning")
+	bot.send_PRIVMSG(context.channel, "grayfoxWeirdDude you cant use that command")
+
+
+# command_ functions are called when the user types a command in chat
+@command()
+def command_ping(bot, context):
+	uptime = str(datetime.timedelta(seconds = math.floor(time.time() - bot.session_variables["startup_time"])))
+	bot.send_PRIVMSG(context.channel, f"Uptime: {uptime}")
+
+
+@command()
+def command_redbar(bot, context):
+	if context.param is None:
+		bot.send_PRIVMSG(context.channel, "When the player's Pokémon is at 5/24 or less of their max HP there will be a beeping sound and "
+			"you are able to input during Pokémon cries, saving ~1 second every time a Pokémon enters the battle.")
+	else:
+		try:
+			max_hp = int(context.param.split(maxsplit=1)[0])
+			treshold = math.floor(max_hp * 5 / 24)
+			bot.send_PRIVMSG(context.channel, f"{treshold}/{max_hp}")
+		except ValueError:
+			bot.send_PRIVMSG(context.channel, f"Usage: {bot._channel_settings(context.channel).trigger}{context.command} max_health")
+
+
+@command(role=ROLE_MOD)
+def command_gettags(bot, context):
+	bot.send_PRIVMSG(context.channel, context.message.raw)
+
+
+@command()
+def command_connectedchannels(bot, context):
+	response = "I'm connected to these channels: " + ", ".join(bot.session_variables["connected_channels"]) + "."
+	bot.send_PRIVMSG(context.channel, response)
+
+
+# accepts more than one channel, the settings are saved once after all of them are joined
+@command(role=ROLE_MOD)
+def command_joinchannel(bot, context):
+	joined = []
+	already_joined = []
+	for newchannel in context.param.split():
+		newchannel = "#" + newchannel.lower().lstrip("#")
+		if bot._join(newchannel):
+			joined.append(newchannel)
+		else:
+			already_joined.append(newchannel)
+	if joined:
+		bot.send_PRIVMSG(context.channel, "Joined channel " + ", ".join(joined))
+	if already_joined:
+		bot.send_PRIVMSG(context.channel, "Already joined channel " + ", ".join(already_joined))
+
+
+@command(role=ROLE_MOD, aliases=("leavechannel",))
+def command_partchannel(bot, context):
+	removedchannel = "#" + context.param.split()[0].lower()
+	if removedchannel == "#" + bot.bot_nick:
+		bot.send_PRIVMSG(context.channel, "I can't leave my own channel, if you don't want me to join this chat on startup edit the settings file")
+	elif removedchannel == context.channel:
+		bot.send_PRIVMSG(context.channel, "If you want me to leave this chat use the command in my chat")
+	else:
+		if bot._part(removedchannel):
+			bot.send_PRIVMSG(context.channel, "Left channel " + removedchannel)
+		else:
+			bot.send_PRIVMSG(context.channel, "I'm not connected to channel " + removedchannel)
+
+
+# banlist [filename] [amount], banlist status, banlist stop, banlist reset [filename]
+# running it again with the same file resumes from where it stopped
+@command(role=ROLE_MOD)
+def command_banlist(bot, context):
+	channel = context.channel
+	params = context.param.split() if context.param is not None else []
+	action = params[0].lower() if params else ""
+	job = bot.banlist_jobs.get(channel)
+
+	if action == "status":
+		if job is None:
+			bot.send_PRIVMSG(channel, "No banlist has been started in this channel")
+		else:
+			state = "Running" if job.is_running() else "Finished"
+			bot.send_PRIVMSG(channel, f"{state}, {job.status()}")
+
+	elif action == "stop":
+		if job is not None and job.is_running():
+			job.stop()
+		else:
+			bot.send_PRIVMSG(channel, "No banlist is running in this channel")
+
+	elif job is not None and job.is_running():
+		bot.send_PRIVMSG(channel, f"Already banning, {job.status()}")
+
+	elif action == "reset":
+		filename = params[1] if len(params) >= 2 else "banlist.txt"
+		BanListJob(bot, channel, filename).reset()
+		bot.send_PRIVMSG(channel, f"The next banlist with file {filename} will start from the beginning")
+
+	else:
+		try:
+			filename = params[0] if len(params) >= 1 else "banlist.txt"
+			limit = int(params[1]) if len(params) >= 2 else None
+		except ValueError as error:
+			bot.log(f"Handled ValueError: {error}")
+			bot.send_PRIVMSG(channel, f"Usage: {bot._channel_settings(channel).trigger}{context.command} [filename] [amount]")
+			return
+		job = BanListJob(bot, channel, filename, limit)
+		try:
+			job.start()
+		except IOError as error:
+			bot.log(f"Handled IOError: {error}")
+			bot.send_PRIVMSG(channel, f"Can't find or access file {filename}")
+			return
+		bot.banlist_jobs[channel] = job
+		bot.send_PRIVMSG(channel, f"Banning users from file {filename} starting at byte {job.sent_offset} of {job.file_size}")
+
+
+@command(role=ROLE_MOD, aliases=("queues",))
+def command_sendqueue(bot, context):
+	depths = ", ".join(f"{name}: {depth}" for name, depth in bot.send_scheduler.queue_depths().items())
+	bot.send_PRIVMSG(context.channel, f"Messages waiting to be sent, {depths}. Dropped so far: {bot.send_scheduler.dropped}")
+
+
+# "add <phrase>" or "remove <phrase>" change the banned phrases of the channel, "count" says how many there are
+@command(role=ROLE_MOD, aliases=("bannedphrases",))
+def command_bannedphrase(bot, context):
+	action, _, phrase = (context.param or "").partition(" ")
+	phrase = phrase.strip()
+	if action in ("add", "remove") and phrase:
+		error = bot.edit_banned_phrases(context.channel, phrase, add=action == "add")
+		if error is None:
+			bot.send_PRIVMSG(context.channel, "Banned phrase added" if action == "add" else "Banned phrase removed")
+		else:
+			bot.send_PRIVMSG(context.channel, f"Unable to change the banned phrases: {error}")
+	elif action == "count":
+		matcher = bot._channel_settings(context.channel).banned_phrases
+		if matcher is None:
+			count = 0
+		else:
+			count = len(matcher) if isinstance(matcher, PhraseMatcher) else "a regex of"
+		bot.send_PRIVMSG(context.channel, f"This channel has {count} banned phrases")
+	else:
+		bot.send_PRIVMSG(context.channel, "Usage: bannedphrase add <phrase>, bannedphrase remove <phrase> or bannedphrase count")
+
+
+# a short summary of the metrics, the full ones are on the metrics port
+@command(role=ROLE_MOD, aliases=("stats",))
+def command_metrics(bot, context):
+	snapshot = bot.metrics.snapshot()
+	lines_per_second = sum(rate for name, rate in snapshot["rates"].items() if name.startswith("lines."))
+	handler = snapshot["histograms"].get("handler.PRIVMSG")
+	send_wait = snapshot["histograms"].get("send_wait.chat")
+	summary = [f"Lines per second: {lines_per_second:.1f}"]
+	if handler is not None:
+		summary.append(f"PRIVMSG handler p50 {handler['p50'] * 1000000:.0f}us p99 {handler['p99'] * 1000000:.0f}us")
+	if send_wait is not None:
+		summary.append(f"chat send wait p50 {send_wait['p50'] * 1000:.0f}ms p99 {send_wait['p99'] * 1000:.0f}ms")
+	bot.send_PRIVMSG(context.channel, " | ".join(summary))
+
+
+# the sampling profiler, "start", "stop", "reset" or without parameters the functions seen running the most
+@command(role=ROLE_MOD)
+def command_profile(bot, context):
+	if context.param == "start":
+		started = bot.profiler.start()
+		bot.send_PRIVMSG(context.channel, "Profiler started" if started else "The profiler is already running")
+	elif context.param == "stop":
+		stopped = bot.profiler.stop()
+		bot.send_PRIVMSG(context.channel, "Profiler stopped" if stopped else "The profiler is not running")
+	elif context.param == "reset":
+		bot.profiler.reset()
+		bot.send_PRIVMSG(context.channel, "Profiler samples deleted")
+	else:
+		report = bot.profiler.report(top=3).splitlines()
+		bot.send_PRIVMSG(context.channel, " | ".join(report))
+		bot.log(bot.profiler.report(), cmd="info")
+
+
+# "presence <nick>" says if the chatter is in this channel, without a nick how many chatters are in it
+@command(aliases=("here",))
+def command_presence(bot, context):
+	if context.param:
+		nick = context.param.split()[0].lower().lstrip("@")
+		if bot.presence.is_present(context.channel, nick):
+			bot.send_PRIVMSG(context.channel, f"{nick} is in this chat")
+		else:
+			bot.send_PRIVMSG(context.channel, f"{nick} is not in this chat as far as I know")
+	else:
+		bot.send_PRIVMSG(context.channel, f"{bot.presence.count(context.channel)} chatters in this chat as far as I know")
+
+
+# "lastseen <nick>" says when the chatter last wrote in this channel and what, the history needs history_file in the settings
+@command(aliases=("seen", "lastmessage"))
+def command_lastseen(bot, context):
+	if bot.history is None:
+		bot.send_PRIVMSG(context.channel, "I don't keep the chat history")
+	elif not context.param:
+		bot.send_PRIVMSG(context.channel, f"Usage: {bot._channel_settings(context.channel).trigger}{context.command} <nick>")
+	else:
+		nick = context.param.split()[0].lower().lstrip("@")
+		last = bot.history.last_message(context.channel, nick)
+		if last is None:
+			bot.send_PRIVMSG(context.channel, f"I haven't seen {nick} write in this chat")
+		else:
+			ago = str(datetime.timedelta(seconds = math.floor(time.time() - last[0])))
+			bot.send_PRIVMSG(context.channel, f"{nick} wrote {ago} ago: {last[1]}")
+
+
+# "said <phrase>" counts the messages in this channel that contain the phrase since midnight, not the commands and the bot
+@command(aliases=("saidtoday",))
+def command_said(bot, context):
+	trigger = bot._channel_settings(context.channel).trigger
+	if bot.history is None:
+		bot.send_PRIVMSG(context.channel, "I don't keep the chat history")
+	elif not context.param or not context.param.strip():
+		bot.send_PRIVMSG(context.channel, f"Usage: {trigger}{context.command} <phrase>")
+	else:
+		phrase = context.param.strip()
+		midnight = datetime.datetime.combine(datetime.date.today(), datetime.time()).timestamp()
+		count = bot.history.count_phrase(context.channel, phrase, since=midnight, exclude_nick=bot.bot_nick, exclude_prefix=trigger)
+		bot.send_PRIVMSG(context.channel, f"\"{phrase}\" was said in {count} messages today")
+
+
+@command(role=ROLE_MOD, aliases=("connections",))
+def command_joinstatus(bot, context):
+	states = []
+	for number, (ready, joined, joining, waiting) in bot.join_scheduler.status().items():
+		state = "connected" if ready else "connecting"
+		states.append(f"{number}: {state}, {joined} joined, {joining} joining, {waiting} waiting")
+	bot.send_PRIVMSG(context.channel, "Connections " + " | ".join(states))
+
+
+@command(role=ROLE_MOD)
+def command_quit(bot, context):
+	bot.send_PRIVMSG(context.channel, "Closing the bot")
+	bot.ui.quit_var.set()
+	bot.wake()
+
+
+@command(role=ROLE_MOD, aliases=("reload",))
+def command_restart(bot, context):
+	bot.send_PRIVMSG(context.channel, "Restarting the bot")
+	bot.ui.restart_var.set()
+	bot.wake()
+
+
+@command()
+def command_newcommand(bot, context): pass
+
+
+@command(role=ROLE_MOD)
+def command_temptimer(bot, context):
+	bot.timers.once(context.channel, 5, "timer ended")
+
+
+# "timer add <name> <seconds> [<min messages>] <message>" saves a timer in the settings, "timer remove <name>" deletes it
+# "timer once <seconds> <message>" sends a message once, "timer list" the timers of the channel
+@command(role=ROLE_MOD, aliases=("timers",))
+def command_timer(bot, context):
+	action, _, rest = (context.param or "").partition(" ")
+	name, _, value = rest.strip().partition(" ")
+	name = name.lower()
+	if action == "add" and name and value:
+		try:
+			parse_timer(value)
+		except ValueError:
+			bot.send_PRIVMSG(context.channel, "The timer should be: timer add <name> <seconds> [<min messages>] <message>")
+			return
+		with bot.config_lock:
+			# the settings are interpolated, a % in the message is saved as %% and read back as %
+			bot.config.set(context.channel, "timer_" + name, value.strip().replace("%", "%%"))
+			bot._channel_changed(context.channel)
+		bot.send_PRIVMSG(context.channel, f"Timer {name} set")
+	elif action == "remove" and name:
+		with bot.config_lock:
+			removed = bot.config.remove_option(context.channel, "timer_" + name)
+			if removed:
+				bot._channel_changed(context.channel)
+		bot.send_PRIVMSG(context.channel, f"Timer {name} removed" if removed else f"There is no timer {name}")
+	elif action == "once" and name and value:
+		try:
+			delay = parse_delay(name)
+		except ValueError:
+			bot.send_PRIVMSG(context.channel, "Usage: timer once <seconds> <message>")
+			return
+		bot.timers.once(context.channel, delay, value.strip())
+		bot.send_PRIVMSG(context.channel, f"I'll send it in {delay:g} seconds")
+	elif action == "list":
+		timers = [f"{timer.name or 'once'} ({timer.due - time.monotonic():.0f}s)" for timer in bot.timers.timers(context.channel)]
+		bot.send_PRIVMSG(context.channel, "Timers: " + (", ".join(timers) if timers else "none"))
+	else:
+		bot.send_PRIVMSG(context.channel, "Usage: timer add <name> <seconds> [<min messages>] <message>, timer remove <name>, "
+			"timer once <seconds> <message> or timer list")
+
+
+@command()
+def command_error(bot, context):
+	user_not_authorized(bot, context)
@@ -16,26 +16,69 @@
 
 import os
 import sys
-import socket
+import queue
 import time
-import datetime
-import math
 import configparser
 import re
 import threading
-from volpesbot_ui import *
-from tokenbucket import *
+from headless import *
+from sendscheduler import *
+from ircmessage import *
+from channelsettings import *
+from workerpool import *
+from settingswriter import *
+from logsink import *
+from metrics import *
+from recorder import *
+from urldetector import *
+from phrasematcher import *
+from mimeengine import *
+from floodguard import *
+from presence import *
+from history import *
+from timerscheduler import *
+from reconnect import *
+from joinscheduler import *
+from ircconnection import *
+from volpesbot_commands import *
 
 
 class IRCBot:
 
 	class AuthorizationError(Exception): pass
 
+	# commands received from the server that dont need to be handled
+	IGNORED_COMMANDS = ("CAP", "001", "002", "003", "004", "375", "372", "ROOMSTATE", "HOSTTARGET")
 
-	def __init__(self):
-		# Define the socket
-		self.irc = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.handle = self.irc.makefile(mode="rw", buffering=1, encoding="utf-8", newline="\r\n")
+	# privmsgs starting with these are sent before the normal chat messages
+	MODERATION_COMMANDS = ("/delete", "/ban", "/unban", "/timeout", "/untimeout", "/clear")
+
+	# the errors of an on_ function that are logged instead of stopping the bot
+	HANDLER_ERRORS = (AttributeError, ConnectionResetError, ConnectionAbortedError)
+
+
+	# the class of the connections to the server, replaced by an in-memory connection in benchmarks/bench_replay.py
+	connection_class = IRCConnection
+
+	# the budget in seconds from startup_clock to sending CAP REQ, a warning is logged if it takes longer
+	STARTUP_BUDGET = 0.5
+
+	# headless doesnt use tkinter, the ui is replaced by the console and the bot is controlled with signals or the control port
+	# startup_clock is the time.perf_counter() of when the program started
+	# shard is a ShardContext when the bot is a worker process that only has some of the channels, see shards.py
+	def __init__(self, headless=False, startup_clock=None, shard=None):
+		self.startup_clock = time.perf_counter() if startup_clock is None else startup_clock
+		self.shard = shard
+		# where the log goes, see log, the lines logged before the ui is created are lost
+		self.log_sinks = []
+		self.log_level = LEVEL_OFF
+		# the open connections by number, 0 is the main one, the others are opened when there are too many channels
+		self.connections = {}
+		# (connection number, line, error) received by the connection threads, line is None when the connection closes
+		self.incoming = queue.Queue()
+
+		# the config is changed from the command threads and saved from the settings writer thread
+		self.config_lock = threading.RLock()
 
 		# create the config object
 		self.config = configparser.ConfigParser(allow_no_value=False, delimiters=("="), comment_prefixes=("#"), empty_lines_in_values=False)
@@ -50,9 +93,16 @@ class IRCBot:
 			print("Settings file not found, follow the instructions to create one.")
 			self._make_config_file()
 
+		# saves the settings a few seconds after they change
+		self.settings_writer = SettingsWriter(self.config, "volpesbot_config.ini", self.config_lock, log=self.log,
+			write=write_config_atomically if shard is None else shard.write_config)
+
 		# making the settings variable names easier to use later
 		self.server = self.config.get("DEFAULT", "server")
 		self.port = self.config.getint("DEFAULT", "port")
+		# twitch serves irc over tls on 6697, the lines written within write_flush_window seconds are sent together
+		self.tls = self.config.getboolean("DEFAULT", "tls", fallback=self.port == 6697)
+		self.write_flush_window = self.config.getfloat("DEFAULT", "write_flush_window", fallback=0.002)
 		self.bot_nick = self.config.get("DEFAULT", "bot_nick")
 		self.bot_user = self.config.get("DEFAULT", "bot_user")
 		self.bot_name = self.config.get("DEFAULT", "bot_name")
@@ -62,36 +112,206 @@ class IRCBot:
 		# make a dict used to store session information
 		self.session_variables = {
 			"startup_time": time.time(),
-			"connected_channels": []
+			"connected_channels": [],
+			# the channels in the settings are joined after the first 376, not after a reconnect
+			"joined_startup_channels": False
 		}
 
-		# initialize the token bucket
-		self.token_bucket = TokenBucket(100, 30)
+		# lines, handler and command latencies and the time spent waiting for the rate limits, see _start_metrics
+		self.metrics = Metrics()
+		self.profiler = SamplingProfiler(self.config.getfloat("DEFAULT", "profiler_interval", fallback=0.005))
+
+		# every outgoing line goes through the scheduler, it waits for the rate limits in its own thread
+		# the limits of the whole account are shared by the workers of a sharded bot
+		self.send_scheduler = SendScheduler(self._send_now, on_error=self._send_error, metrics=self.metrics,
+			global_bucket=None if shard is None else shard.send_budget)
+
+		# spreads the channels over the connections and sends the JOINs within the rate limit
+		self.join_scheduler = JoinScheduler(self._open_connection, self._send_join, self._send_part,
+			join_limit=self.config.getint("DEFAULT", "join_rate_limit", fallback=20),
+			channels_per_connection=self.config.getint("DEFAULT", "channels_per_connection", fallback=100),
+			max_connections=self.config.getint("DEFAULT", "max_connections", fallback=10), log=self.log,
+			bucket=None if shard is None else shard.join_budget)
+
+		# the commands run on a few threads, if too many are waiting the new ones are dropped
+		self.command_pool = WorkerPool(self.config.getint("DEFAULT", "command_workers", fallback=4),
+			self.config.getint("DEFAULT", "command_queue_size", fallback=32), name="command")
 
 		# compile the regex functions
-		self.regex_message = re.compile("^@?(?P<tags>(?:[^\s=;]+=[^\s=;]*[; ])*)"
-										"(?:\:(?P<nick>[^\!\@ ]+)(?:\!(?P<user>[^\@ ]+))?(?:\@(?P<host>[^ ]+))? )?"
-										"(?P<cmd>[^ ]+)"
-										"(?: (?P<channel>[^\:][^ ]*(?: [^\:][^ ]*)*))?"
-										"(?: \:(?P<msg>.*))?$")
+		self.regex_send_raw = re.compile("^(?P<command>[A-Z ]*)(?: )(?P<channel>#[^\s]*)?(?: ?:?(?P<msg>.*))?$")
+				# CAP REQ :twitch.tv/tags twitch.tv/commands
+				# PASS oauth:******************************
+				# NICK volpesbot
+				# USER volpesbot 0 * :volpesbot
+				# JOIN #volpesbot,#grayfox1996
+				# PRIVMSG #volpesbot :test
+				# PONG :tmi.twitch.tv
 		self.regex_pinged = re.compile("(?i)(?:\s|\A|\b)(@" + self.bot_nick + ")(?:\s|$|\b)")
-		# https://mathiasbynens.be/demo/url-regex
-		self.regex_url = re.compile("(?i)(?:\s|\A|\b)(?:(?:https?://)?(?P<url>(?:[^\s/$.?#][^\s/]*)(\.[^.\s]+)))(?:\s|\A|\b)")
-		# create the ui
-		self.ui = UI()
-		# wait for the ui thread to complete the startup
-		while not self.ui.ui_ready.isSet():
-			print("Waiting for UI")
-			self.ui.ui_ready.wait(2)
-		print("UI open")
+		# finds the links in the channels with block_urls, see _load_url_tlds
+		self.url_detector = URLDetector()
+		# the settings of each channel, see _channel_settings
+		self.channel_settings = {}
+		# channel: (where the phrases came from, matcher), see _banned_phrases
+		self.banned_phrase_matchers = {}
+		# channel: (mime settings, engine), see _mime_engine
+		self.mime_engines = {}
+		# channel: (flood settings, guard), see _flood_guard
+		self.flood_guards = {}
+		# who is in the joined channels, the JOIN, PART and NAMES of other chatters need track_presence
+		self.presence = PresenceIndex(self.config.getint("DEFAULT", "presence_max_chatters", fallback=200000))
+		self.track_presence = self.config.getboolean("DEFAULT", "track_presence", fallback=False)
+		# the timers of all the channels run on one thread
+		self.timers = TimerScheduler(self.send_PRIVMSG, log=self.log)
+		# channel: (timer settings, timers), see _load_timers
+		self.config_timers = {}
+		# reopens the closed connections after a backoff, each attempt on a thread of its own, the session state stays as it is
+		self.supervisor = ReconnectSupervisor(self.timers, self._open_connection, self._send_ping, self._close_connection,
+			min_delay=self.config.getfloat("DEFAULT", "reconnect_min_delay", fallback=1),
+			max_delay=self.config.getfloat("DEFAULT", "reconnect_max_delay", fallback=60),
+			idle_timeout=self.config.getfloat("DEFAULT", "ping_idle_timeout", fallback=360),
+			pong_timeout=self.config.getfloat("DEFAULT", "ping_timeout", fallback=30),
+			check_interval=self.config.getfloat("DEFAULT", "connection_check_interval", fallback=10), log=self.log)
+		self.verbose_log = self.config.getboolean("DEFAULT", "verbose_log")
+		# the banlist started in each channel, see command_banlist
+		self.banlist_jobs = {}
+		# create the ui, the bot doesnt wait for it to open since the lines to print are queued
+		self.headless = headless or self.config.getboolean("DEFAULT", "headless", fallback=False)
+		# a worker is stopped by the coordinator, which also has the control port
+		if shard is not None:
+			self.ui = HeadlessUI()
+		elif self.headless:
+			self.ui = HeadlessUI()
+			install_signal_handlers(self)
+		else:
+			# tkinter is only imported when the ui is used
+			from volpesbot_ui import UI
+			self.ui = UI(on_message_out=self.send_raw, on_flag=self.wake)
+		self._open_log_sinks()
+		self._start_control_server()
+		self._start_metrics()
+		self._load_url_tlds()
+		# record_file saves every line received, to replay them with benchmarks/bench_replay.py
+		self.recorder = None
+		record_file = self.config.get("DEFAULT", "record_file", fallback="")
+		if record_file and shard is not None:
+			# each worker has its own recording, "lines.txt.gz" becomes "lines.txt-1.gz"
+			root, extension = os.path.splitext(record_file)
+			record_file = f"{root}-{shard.number}{extension}"
+		if record_file:
+			try:
+				self.recorder = LineRecorder(record_file, log=self.log)
+			except OSError as error:
+				self.log(f"Handled {type(error).__name__}: unable to open the recording {record_file}: {error}", cmd="warning")
+		# the joins, parts and quit sent by the coordinator
+		if shard is not None:
+			shard.start_control(self)
+
+
+	# the ui gets the raw lines only with verbose log, the log file has its own level
+	def _open_log_sinks(self):
+		# the log of a worker goes to the coordinator, which has the console, the log file and writes the history
+		if self.shard is not None:
+			self.ui_sink = QueueSink(self.shard.send, self.shard.number, self.shard.log_level)
+			self.log_sinks = [self.ui_sink]
+			self._update_log_level()
+			self.history = open_history(self.config, self.log, read_only=True)
+			return
+		self.ui_sink = UISink(self.ui, LEVEL_RAW if self.verbose_log else LEVEL_CHAT)
+		self.log_sinks = [self.ui_sink]
+		log_file = self.config.get("DEFAULT", "log_file", fallback="")
+		if log_file:
+			try:
+				self.log_sinks.append(JsonLinesSink(log_file,
+					level=parse_level(self.config.get("DEFAULT", "log_file_level", fallback="chat")),
+					max_bytes=self.config.getint("DEFAULT", "log_file_max_bytes", fallback=10 * 1024 * 1024),
+					rotate_interval=self.config.getfloat("DEFAULT", "log_file_rotate_hours", fallback=24) * 60 * 60,
+					backup_count=self.config.getint("DEFAULT", "log_file_backups", fallback=5), log=self.log))
+			except (OSError, KeyError) as error:
+				self.log(f"Handled {type(error).__name__}: unable to open the log file {log_file}: {error}", cmd="warning")
+		self.history = open_history(self.config, self.log)
+		if self.history is not None:
+			self.log_sinks.append(self.history)
+		self._update_log_level()
+
+
+	# url_tlds_file adds top level domains to the ones the url detector knows
+	def _load_url_tlds(self):
+		tlds_file = self.config.get("DEFAULT", "url_tlds_file", fallback="")
+		if not tlds_file:
+			return
+		try:
+			self.url_detector = URLDetector(read_tlds(tlds_file))
+		except OSError as error:
+			self.log(f"Handled {type(error).__name__}: unable to read the top level domains in {tlds_file}: {error}", cmd="warning")
 
-		# set an observer for the input box variable
-		self.ui.message_out_var.trace("w", lambda a, b, c: self.send_raw(self.ui.message_out_var.get()))
+
+	# the lowest level wanted by a sink, the lines below it are discarded right away
+	def _update_log_level(self):
+		self.log_level = min(sink.level for sink in self.log_sinks)
+
+
+	# the control port of a headless bot, after the log sinks so a port already in use gets to the console
+	def _start_control_server(self):
+		self.control_server = None
+		if not self.headless or self.shard is not None:
+			return
+		control_port = self.config.getint("DEFAULT", "control_port", fallback=0)
+		if control_port:
+			try:
+				self.control_server = ControlServer(self, control_port)
+			except OSError as error:
+				self.log(f"Handled {type(error).__name__}: unable to open the control port {control_port}: {error}", cmd="warning")
+
+
+	# the metrics are always collected, metrics_port serves them over http and metrics_snapshot_file saves them periodically
+	def _start_metrics(self):
+		self.metrics.gauge("queue.send", self.send_scheduler.queue_depths)
+		self.metrics.gauge("queue.incoming", self.incoming.qsize)
+		self.metrics.gauge("queue.commands", self.command_pool.pending)
+		self.metrics.gauge("send.sent", lambda: self.send_scheduler.sent)
+		self.metrics.gauge("send.dropped", lambda: self.send_scheduler.dropped)
+		for counter in ("recv_calls", "send_calls", "lines_received", "lines_sent"):
+			self.metrics.gauge("transport." + counter, lambda counter=counter: self._transport_counter(counter))
+		# the coordinator adds up the metrics of the workers and serves them
+		if self.shard is not None:
+			self.shard.start_metrics(self)
+			return
+		if self.history is not None:
+			self.metrics.gauge("history.written", lambda: self.history.written)
+			self.metrics.gauge("history.dropped", lambda: self.history.dropped)
+			self.metrics.gauge("history.pending", lambda: len(self.history.pending))
+		self.metrics_reporter = MetricsReporter(self.metrics,
+			interval=self.config.getfloat("DEFAULT", "metrics_interval", fallback=10),
+			filename=self.config.get("DEFAULT", "metrics_snapshot_file", fallback=""), log=self.log)
+		metrics_port = self.config.getint("DEFAULT", "metrics_port", fallback=0)
+		if metrics_port:
+			try:
+				self.metrics_server = MetricsServer(self.metrics, self.profiler, metrics_port)
+			except OSError as error:
+				self.log(f"Handled {type(error).__name__}: unable to serve the metrics on port {metrics_port}: {error}", cmd="warning")
+			else:
+				self.log(f"Metrics served on http://127.0.0.1:{metrics_port}/metrics", cmd="info")
+
+
+	# summed over the open connections, so it drops when one closes
+	def _transport_counter(self, counter):
+		return sum(getattr(connection, counter, 0) for connection in list(self.connections.values()))
+
+
+	# waits for the lines the connections still have queued
+	def _flush_connections(self, timeout=1):
+		for connection in list(self.connections.values()):
+			connection.flush(timeout)
+
+
+	def _close_log_sinks(self):
+		for sink in self.log_sinks:
+			sink.close()
 
 
 	def _make_config_file(self):
 		self.config.set("DEFAULT", "server", "irc.chat.twitch.tv")
-		self.config.set("DEFAULT", "port", "6667")
+		self.config.set("DEFAULT", "port", "6697")
 		bot_nick_user_name = input("Enter the name of the bot account:").lower()
 		self.config.set("DEFAULT", "bot_nick", bot_nick_user_name)
 		self.config.set("DEFAULT", "bot_user", bot_nick_user_name)
@@ -110,112 +330,406 @@ class IRCBot:
 		self.config.add_section(f"#{bot_owner}")
 		self.config.set(f"#{bot_owner}", "connect_on_startup", "yes")
 		self.config.set(f"#{bot_owner}", "trigger", self.config.get("DEFAULT", "trigger"))
-		self.save_settings()
+		# the ui doesnt exist yet, so this cant use save_settings
+		write_config_atomically(self.config, "volpesbot_config.ini", self.config_lock)
 
 
 	# connects to the server address and sends all the messages needed to connect to irc
 	def connect(self):
 		# Connect to the server
 		self.log(f"Connecting to: {self.server}", cmd="info")
-		self.irc.connect((self.server, self.port))
+		# if the first attempt fails the next ones wait the same backoff as the reconnects
+		try:
+			self._open_connection(0)
+		except OSError as error:
+			self.log(f"Handled {type(error).__name__} connecting to {self.server}: {error}", cmd="warning")
+			self.supervisor.schedule_reconnect(0)
+
+
+	# also called by the join scheduler thread when the open connections are full
+	def _open_connection(self, number):
+		connection = self.connection_class(number, self.server, self.port, self._line_received, self._connection_closed,
+			tls=self.tls, flush_window=self.write_flush_window)
+		connection.open()
+		self.connections[number] = connection
+		self.supervisor.line_received(number)
+		self._authenticate(number)
+
+
+	def _close_connection(self, number):
+		connection = self.connections.get(number)
+		if connection is not None:
+			connection.close()
+
+
+	# checks if a quiet connection is still alive, any line received in time is enough
+	def _send_ping(self, number):
+		self.send_raw("PING :tmi.twitch.tv", number)
+
+
+	# sends the messages needed to log in after the connection is open
+	def _authenticate(self, connection=0):
 		# Perform user authentication
-		self.send_raw("CAP REQ :twitch.tv/tags twitch.tv/commands")
-		self.send_PASS(self.bot_password)
-		self.send_raw(f"NICK {self.bot_nick}")
-		self.send_raw(f"USER {self.bot_user} 0 * :{self.bot_name}")
+		if self.track_presence:
+			self.send_raw("CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership", connection)
+		else:
+			self.send_raw("CAP REQ :twitch.tv/tags twitch.tv/commands", connection)
+		self.send_PASS(self.bot_password, connection)
+		self.send_raw(f"NICK {self.bot_nick}", connection)
+		self.send_raw(f"USER {self.bot_user} 0 * :{self.bot_name}", connection)
+
+
+	# called from the connection threads
+	def _line_received(self, connection, line):
+		self.incoming.put((connection.number, line, None))
+
+
+	def _connection_closed(self, connection, error):
+		self.incoming.put((connection.number, None, error))
+
+
+	# makes lines() check quit_var and restart_var without waiting for the next line
+	def wake(self):
+		self.incoming.put((None, None, None))
+
+
+	# yields (connection number, line) for the lines received by every connection
+	# never returns, the main connection is reopened when it closes and quit or restart end the program
+	def lines(self):
+		while True:
+			number, line, error = self.incoming.get()
+
+			# if the program has been flagged to be closed
+			if self.ui.quit_var.is_set():
+				self.quit()
+			# if the program has been flagged to be restarted
+			if self.ui.restart_var.is_set():
+				self.restart()
+
+			if number is None:
+				continue
+			if line is not None:
+				yield number, line
+				continue
+			self.connections.pop(number, None)
+			if error is not None:
+				self.log(f"Handled {type(error).__name__} on connection {number}: {error}", cmd="warning")
+			# the channels of the main connection wait for it to reconnect,
+			# the channels of the other connections are moved to the ones still open
+			self.join_scheduler.connection_lost(number)
+			if number == 0:
+				self.supervisor.schedule_reconnect(number)
+			else:
+				self.supervisor.forget(number)
+
+
+	# parses a line received from the server, logs it and calls the appropriate on_ function
+	def handle_line(self, line, connection=0):
+		start = time.perf_counter()
+		message, result = self._handle_message(line, connection)
+		self.metrics.line_handled(message.cmd, time.perf_counter() - start)
+
+
+	# the part of handle_line shared with the async bot, returns the message and what its on_ function returned
+	def _handle_message(self, line, connection):
+		if self.recorder is not None:
+			self.recorder.record(line, connection)
+		self.supervisor.line_received(connection)
+		message = parse_message(line)
+		message.connection = connection
+
+		# log data received, only chat messages need the nick color
+		if message.cmd in ("PRIVMSG", "WHISPER"):
+			self.log(message.raw, message.nick, message.cmd, message.channel, message.msg, message.tag("color"))
+		else:
+			self.log(message.raw, message.nick, message.cmd, message.channel, message.msg)
+
+		# call the appropriate function if it exists
+		# a broken connection is closed by _write and reopened by the supervisor
+		result = None
+		try:
+			if message.cmd not in self.IGNORED_COMMANDS:
+				result = getattr(self, "on_" + message.cmd)(message)
+		except self.HANDLER_ERRORS as error:
+			self._handler_error(error)
+		return message, result
+
+
+	def _handler_error(self, error):
+		if isinstance(error, AttributeError):
+			self.log(f"Handled AttributeError: {error}")
+		else:
+			self.log(f"Handled {type(error).__name__}: {error}", cmd="warning")
 
 
 	# passing a channel makes it connect to it, otherwise connects to all the channel in the settings
-	def _join(self, data, tags, nick, user, host, cmd, channel, msg, newchannel=None):
+	def _join(self, newchannel=None):
 		# join the channels
 		if newchannel is None:
 			channels = ""
 			for newchannel in self.config.sections():
+				if self.shard is not None and not self.shard.owns(newchannel):
+					continue
 				if self.config.getboolean(newchannel, "connect_on_startup"):
 					self.session_variables["connected_channels"].append(newchannel)
-					self.session_variables[newchannel] = {"last_mime_emote": 0}
+					self.join_scheduler.add(newchannel)
+					self._load_timers(newchannel)
 					channels = channels + newchannel + ","
 			channels = channels.removesuffix(",")
-			self.send_raw(f"JOIN {channels}")
-			self.log(f"Connected to {channels}", cmd="info")
+			self.log(f"Joining {channels}", cmd="info")
+		# the channel belongs to another worker of a sharded bot
+		elif self.shard is not None and not self.shard.owns(newchannel):
+			self.shard.send(("join", newchannel))
+			return True
 		else:
-			# if the channel is in the settings
-			if self.config.has_section(newchannel):
-				# if already connected to the channel
-				if newchannel in self.session_variables["connected_channels"]:
-					return False
-				# if not connected makes it connect on startup
+			with self.config_lock:
+				# if the channel is in the settings
+				if self.config.has_section(newchannel):
+					# if already connected to the channel
+					if newchannel in self.session_variables["connected_channels"]:
+						return False
+					# if not connected makes it connect on startup
+					else:
+						self.log(f"Joining {newchannel}", cmd="info")
+						self.config.set(newchannel, "connect_on_startup", "yes")
+						self._channel_changed(newchannel)
+						self.session_variables["connected_channels"].append(newchannel)
+						self.join_scheduler.add(newchannel)
+						self._load_timers(newchannel)
+						return True
+				# if not in the settings create a section for it
 				else:
-					self.log(f"Joining {newchannel}", cmd="info")
+					self.config.add_section(newchannel)
 					self.config.set(newchannel, "connect_on_startup", "yes")
+					self.config.set(newchannel, "trigger", self.config.get("DEFAULT", "trigger"))
+					self._channel_changed(newchannel)
 					self.session_variables["connected_channels"].append(newchannel)
-					self.send_raw(f"JOIN {newchannel}")
+					self.join_scheduler.add(newchannel)
+					self._load_timers(newchannel)
 					return True
-			# if not in the settings create a section for it
-			else:
-				self.config.add_section(newchannel)
-				self.config.set(newchannel, "connect_on_startup", "yes")
-				self.config.set(newchannel, "trigger", self.config.get("DEFAULT", "trigger"))
-				self.session_variables["connected_channels"].append(newchannel)
-				self.send_raw(f"JOIN {newchannel}")
-				return True
 
 
 	# parts a channel
-	def _part(self, data, tags, nick, user, host, cmd, channel, msg, removedchannel):
-		# if connected to that channel removes it from startup
-		if removedchannel in self.session_variables["connected_channels"]:
-			self.log(f"Parting {removedchannel}", cmd="info")
-			self.session_variables["connected_channels"].remove(removedchannel)
-			self.config.set(removedchannel, "connect_on_startup", "no")
-			self.send_raw(f"PART {removedchannel}")
+	def _part(self, removedchannel):
+		if self.shard is not None and not self.shard.owns(removedchannel):
+			self.shard.send(("part", removedchannel))
 			return True
-		else:
-			return False
-
-
-	# outputs to the log
-	def log(self, data, tags="", nick="", user="", host="", cmd="", channel="", msg=""):
-
-		# print everything to the ui only if verbose log is active
-		if self.config.getboolean("DEFAULT", "verbose_log"):
-			self.ui.print_log(data)
-
-		# these cmds are always printed with specific formatting
-		if cmd == "PRIVMSG":
-			# get the nick color from the tags
-			nick_color = "".join([tag.split("=")[1] for tag in tags.split(";") if tag.split("=")[0] == "color"])
-			self.ui.print_PRIVMSG(channel, nick, msg, nick_color)
-		elif cmd == "WHISPER":
-			nick_color = "".join([tag.split("=")[1] for tag in tags.split(";") if tag.split("=")[0] == "color"])
-			self.ui.print_WHISPER(nick, msg, nick_color)
-		elif cmd == "NOTICE":
-			self.ui.print_NOTICE(channel, msg)
-		# not an actual IRC command, used internally to print these messages in a different style
-		elif cmd == "warning":
-			self.ui.print_warning(data)
-		# a real irc command but not supported by twitch, used internally to print these messages in a different style
-		elif cmd == "info":
-			self.ui.print_info(data)
-
-
-	# saves the setting in the settings file
-	def save_settings(self):
+		with self.config_lock:
+			# if connected to that channel removes it from startup
+			if removedchannel in self.session_variables["connected_channels"]:
+				self.log(f"Parting {removedchannel}", cmd="info")
+				self.session_variables["connected_channels"].remove(removedchannel)
+				self.config.set(removedchannel, "connect_on_startup", "no")
+				self._channel_changed(removedchannel)
+				self.join_scheduler.remove(removedchannel)
+				self._load_timers(removedchannel)
+				return True
+			else:
+				return False
+
+
+	# returns the settings of the channel, reading them from the config the first time
+	def _channel_settings(self, channel):
 		try:
-			with open("volpesbot_config.ini", "w") as settings_file:
-				self.config.write(settings_file)
-		except IOError:
-			self.log("IOError: Unable to save settings!", cmd="warning")
-		else:
+			return self.channel_settings[channel]
+		except KeyError:
+			return self._load_channel_settings(channel)
+
+
+	# the old settings object is replaced, not modified, so a thread still using it sees consistent values
+	def _load_channel_settings(self, channel):
+		with self.config_lock:
+			settings = ChannelSettings(self.config, channel, self._banned_phrases(channel), self._mime_engine(channel),
+				self._flood_guard(channel))
+		self.channel_settings[channel] = settings
+		return settings
+
+
+	# the banned phrases are a list separated by | in banned_phrases and one per line in the file banned_phrases_file
+	# banned_phrases_normalize also matches them written with numbers, symbols or letters of other alphabets
+	# the matcher is only rebuilt when one of these settings changes, adding or removing a phrase changes it in place
+	def _banned_phrases(self, channel):
+		inline = self.config.get(channel, "banned_phrases", fallback="")
+		filename = self.config.get(channel, "banned_phrases_file", fallback="")
+		normalize = self.config.getboolean(channel, "banned_phrases_normalize", fallback=False)
+		source = (inline, filename, normalize)
+		cached = self.banned_phrase_matchers.get(channel)
+		if cached is not None and cached[0] == source:
+			return cached[1]
+
+		matcher = None
+		phrases = []
+		if inline:
+			inline_phrases = inline.split("|")
+			if all(is_literal_phrase(phrase) for phrase in inline_phrases):
+				phrases.extend(inline_phrases)
+			elif filename:
+				self.log(f"banned_phrases of {channel} is a regex, it's ignored because the channel has a banned_phrases_file", cmd="warning")
+			else:
+				# an old style regex, it still works but the time it takes grows with the number of phrases
+				try:
+					matcher = re.compile("(?i)" + inline)
+				except re.error as error:
+					self.log(f"Invalid regex in the settings of {channel}: {error}", cmd="warning")
+		if filename:
+			try:
+				phrases.extend(read_phrases(filename))
+			except OSError as error:
+				self.log(f"Handled {type(error).__name__}: unable to read the banned phrases of {channel}: {error}", cmd="warning")
+		if matcher is None and (phrases or filename):
+			matcher = PhraseMatcher(phrases, normalize)
+		self.banned_phrase_matchers[channel] = (source, matcher)
+		return matcher
+
+
+	# mime_emotes are the names of the emotes copied separated by |, mime_emotes_cooldown the seconds between two copies
+	# mime_emotes_chatters different chatters have to send the emote within mime_emotes_window seconds before it's copied
+	# the engine, and with it the cooldown, is only replaced when one of these settings changes
+	def _mime_engine(self, channel):
+		if not self.config.has_option(channel, "mime_emotes"):
+			self.mime_engines.pop(channel, None)
+			return None
+		source = (self.config.get(channel, "mime_emotes"),
+			self.config.getint(channel, "mime_emotes_cooldown", fallback=30),
+			self.config.getint(channel, "mime_emotes_chatters", fallback=1),
+			self.config.getfloat(channel, "mime_emotes_window", fallback=10),
+			self.config.getboolean(channel, "mime_emotes_scan_text", fallback=True))
+		cached = self.mime_engines.get(channel)
+		if cached is not None and cached[0] == source:
+			return cached[1]
+		emotes, cooldown, chatters, window, scan_text = source
+		engine = MimeEngine([emote.strip() for emote in emotes.split("|") if emote.strip()], cooldown, chatters, window, scan_text)
+		self.mime_engines[channel] = (source, engine)
+		return engine
+
+
+	# flood_messages is how many messages a chatter can send in flood_seconds, duplicate_messages how many times
+	# the same message can be in the last duplicate_history messages of a chatter, 0 turns them off
+	# flood_action is "delete" or "timeout" for flood_timeout seconds, flood_max_chatters the chatters remembered
+	def _flood_guard(self, channel):
+		source = (self.config.getint(channel, "flood_messages", fallback=0),
+			self.config.getfloat(channel, "flood_seconds", fallback=10),
+			self.config.getint(channel, "duplicate_messages", fallback=0),
+			self.config.getint(channel, "duplicate_history", fallback=5),
+			self.config.get(channel, "flood_action", fallback="delete"),
+			self.config.getint(channel, "flood_timeout", fallback=60),
+			self.config.getint(channel, "flood_max_chatters", fallback=5000))
+		if source[0] <= 0 and source[2] <= 0:
+			self.flood_guards.pop(channel, None)
+			return None
+		cached = self.flood_guards.get(channel)
+		if cached is not None and cached[0] == source:
+			return cached[1]
+		guard = FloodGuard(*source)
+		self.flood_guards[channel] = (source, guard)
+		return guard
+
+
+	# the timers in the channel section while the bot is in the channel, "timer_<name> = <seconds> [<min messages>] <message>"
+	# the timers are only set again if they changed, so editing other settings doesnt restart them
+	def _load_timers(self, channel):
+		source = ()
+		if channel in self.session_variables["connected_channels"] and self.config.has_section(channel):
+			source = tuple((option, value) for option, value in self.config.items(channel) if option.startswith("timer_"))
+		cached = self.config_timers.get(channel)
+		if cached is not None and cached[0] == source:
+			return
+		# the timers that didnt change keep running
+		previous = dict(zip(cached[0], cached[1])) if cached is not None else {}
+		for setting, timer in previous.items():
+			if setting not in source and timer is not None:
+				timer.cancel()
+		timers = []
+		for option, value in source:
+			if (option, value) in previous:
+				timers.append(previous[(option, value)])
+				continue
+			try:
+				interval, min_messages, message = parse_timer(value)
+			except ValueError:
+				self.log(f"The setting {option} of {channel} should be \"<seconds> [<min messages>] <message>\"", cmd="warning")
+				# keeps the timers in the same order as their settings
+				timers.append(None)
+				continue
+			timers.append(self.timers.every(channel, interval, message, name=option.removeprefix("timer_"), min_messages=min_messages))
+		if source or cached is not None:
+			self.config_timers[channel] = (source, timers)
+
+
+	# adds or removes a banned phrase of the channel and saves them in its banned_phrases_file
+	# the first time the phrases in banned_phrases are moved to a new file, returns an error message or None
+	def edit_banned_phrases(self, channel, phrase, add=True):
+		with self.config_lock:
+			inline = self.config.get(channel, "banned_phrases", fallback="")
+			filename = self.config.get(channel, "banned_phrases_file", fallback="")
+			if inline:
+				inline_phrases = inline.split("|")
+				if not all(is_literal_phrase(phrase) for phrase in inline_phrases):
+					return "the banned phrases of this channel are a regex, they can only be changed in the settings file"
+			if inline or not filename:
+				if not filename:
+					filename = os.path.join("banned_phrases", channel.lstrip("#") + ".txt")
+				try:
+					existing = read_phrases(filename) if os.path.exists(filename) else []
+					write_phrases(filename, set(existing) | set(inline.split("|") if inline else []))
+				except OSError as error:
+					return f"unable to write {filename}: {error}"
+				self.config.set(channel, "banned_phrases_file", filename)
+				self.config.remove_option(channel, "banned_phrases")
+				self._channel_changed(channel)
+			matcher = self._channel_settings(channel).banned_phrases
+			changed = matcher.add(phrase) if add else matcher.remove(phrase)
+			if not changed:
+				return "the phrase was already there" if add else "the phrase wasnt there"
+			try:
+				write_phrases(filename, matcher.phrases.values())
+			except OSError as error:
+				return f"unable to write {filename}: {error}"
+		return None
+
+
+	# has to be called after changing the settings of a channel
+	def _channel_changed(self, channel):
+		self._load_channel_settings(channel)
+		self._load_timers(channel)
+		# the file is written once the changes stop for a few seconds
+		self.settings_writer.request_save()
+
+
+	# outputs to the log, the level comes from cmd: chat messages, "info", "warning" and raw lines for everything else
+	# "warning" and "info" are not actual irc commands, they are used internally to print these messages in a different style
+	def log(self, data, nick="", cmd="", channel="", msg="", nick_color=""):
+		level = CMD_LEVELS.get(cmd, LEVEL_RAW)
+		# most lines are raw lines that no sink wants
+		if level < self.log_level:
+			return
+		for sink in self.log_sinks:
+			if level >= sink.level:
+				sink.emit(level, data, nick, cmd, channel, msg, nick_color)
+
+
+	# saves the setting in the settings file right away
+	def save_settings(self):
+		if self.settings_writer.save_now():
 			self.log("Settings saved!", cmd="info")
 
 
 	def quit(self):
 		print("Closing script")
+		# give the queued messages a few seconds to be sent
+		self.send_scheduler.flush(5)
+		self._flush_connections()
 		# save the settings in the settings file
 		self.save_settings()
+		# write what is left of the log and the recording
+		self._close_log_sinks()
+		if self.recorder is not None:
+			self.recorder.close()
 		# close the ui (its running in different thread)
 		self.ui.root.quit()
+		# a quit from the chat stops every worker, the coordinator would start this one again
+		if self.shard is not None and not self.shard.stopping:
+			self.shard.send(("quit",))
 		print("You can now close this window")
 		# close the program
 		quit()
@@ -223,10 +737,21 @@ class IRCBot:
 
 	def restart(self):
 		print("Restarting script")
+		# give the queued messages a few seconds to be sent
+		self.send_scheduler.flush(5)
+		self._flush_connections()
 		# save the settings in the settings file
 		self.save_settings()
+		# write what is left of the log and the recording
+		self._close_log_sinks()
+		if self.recorder is not None:
+			self.recorder.close()
 		# close the ui (its running in different thread)
 		self.ui.root.quit()
+		# the coordinator restarts every worker
+		if self.shard is not None:
+			self.shard.send(("restart",))
+			quit()
 		# print some info
 		print("sys.argv was", sys.argv)
 		print("sys.executable was", sys.executable)
@@ -236,227 +761,247 @@ class IRCBot:
 
 
 	# send anything to the irc server, accepts a string
-	def send_raw(self, message):
-		send_raw_regex = "^(?P<command>[A-Z ]*)(?: )(?P<channel>#[^\s]*)?(?: ?:?(?P<msg>.*))?$"
-			# CAP REQ :twitch.tv/tags twitch.tv/commands
-			# PASS oauth:******************************
-			# NICK volpesbot
-			# USER volpesbot 0 * :volpesbot
-			# JOIN #volpesbot,#grayfox1996
-			# PRIVMSG #volpesbot :test
-			# PONG :tmi.twitch.tv
-		matches_tuple = re.match(send_raw_regex, message)
-		if matches_tuple is not None:
+	# without a connection number the line goes to the connection of its channel, or the main one
+	def send_raw(self, message, connection=None):
+		# the message is only sent if it's valid
+		if self.regex_send_raw.match(message) is not None:
+			self.send_scheduler.put(message, priority=PRIORITY_CONTROL, target=connection)
+
+
+	# accepts a channel and a string to send as a privmsg once the rate limits allow it
+	# a worker of a sharded bot passes the messages for the channels of the other workers to them,
+	# so each channel is only rate limited in one process
+	def send_PRIVMSG(self, channel, text, callback=None):
+		if self.shard is not None and not self.shard.owns(channel):
+			self.shard.send(("privmsg", channel, text))
+			return
+		priority = PRIORITY_MODERATION if text.startswith(self.MODERATION_COMMANDS) else PRIORITY_CHAT
+		self.send_scheduler.put(f"PRIVMSG {channel} :{text}", channel, priority, callback)
+
+
+	def send_PASS(self, password, connection=None):
+		self.send_scheduler.put(f"PASS {password}", priority=PRIORITY_CONTROL, target=connection)
+
+
+	# called by the join scheduler
+	def _send_join(self, connection, channel):
+		self.send_raw(f"JOIN {channel}", connection)
+
+
+	def _send_part(self, connection, channel):
+		self.send_raw(f"PART {channel}", connection)
+
+
+	# called by the send scheduler when a line can be sent
+	def _send_now(self, message, connection=None):
+		# special case for PASS, this way the console doesnt output the password as plain text
+		if message.startswith("PASS "):
+			self.log("PASS oauth:******************************", nick=self.bot_nick, cmd="PASS", msg="oauth:******************************")
+		else:
+			if message.startswith("CAP REQ") and "connected_after" not in self.session_variables:
+				self._check_startup_time()
+			matches_tuple = self.regex_send_raw.match(message)
 			self.log(message, nick=self.bot_nick, cmd=matches_tuple["command"], channel=matches_tuple["channel"],
-				msg=matches_tuple["msg"], tags="color=#B22222;display-name=VolpesBot")
-			# this writes to the socket file if the message is valid
-			print(message, file=self.handle, flush=True)
+				msg=matches_tuple["msg"], nick_color="#B22222")
+			if connection is None and matches_tuple["channel"] is not None:
+				connection = self.join_scheduler.connection_for(matches_tuple["channel"])
+		self._write(message, 0 if connection is None else connection)
+
+
+	# the time from the start of the program to the first CAP REQ
+	def _check_startup_time(self):
+		connected_after = time.perf_counter() - self.startup_clock
+		self.session_variables["connected_after"] = connected_after
+		budget = self.config.getfloat("DEFAULT", "startup_budget", fallback=self.STARTUP_BUDGET)
+		if connected_after > budget:
+			self.log(f"Startup took {connected_after * 1000:.0f}ms, more than the budget of {budget * 1000:.0f}ms", cmd="warning")
+		else:
+			self.log(f"Startup took {connected_after * 1000:.0f}ms", cmd="info")
 
 
-	# accepts a channel and a string to send directly as a privmsg
-	def send_PRIVMSG(self, channel, text):
-		self.token_bucket.get_tokens()
-		message = f"PRIVMSG {channel} :{text}"
-		self.send_raw(message)
+	def _send_error(self, error):
+		self.log(f"Handled {type(error).__name__} while sending: {error}", cmd="warning")
 
 
-	# special "send_raw" case, this way the console doesnt output the password as plain text
-	def send_PASS(self, password):
-		self.log("PASS oauth:******************************", nick=self.bot_nick, cmd="PASS", msg="oauth:******************************")
-		print("PASS", password, file=self.handle, flush=True)
+	# writes a line to the socket of a connection, every outgoing message goes through here
+	# raises if the line cant be written, so the send scheduler tells the callback it wasnt sent
+	def _write(self, message, number=0):
+		connection = self.connections.get(number)
+		if connection is None:
+			raise ConnectionError(f"connection {number} is closed, {message.split(' ', 1)[0]} not sent")
+		try:
+			connection.write(message)
+		except OSError:
+			# the read thread sees the closed socket and the connection is reopened
+			connection.close()
+			raise
 
 
 	# answers to a PING message with a PONG message
-	def on_PING(self, data, tags, nick, user, host, cmd, channel, msg):
-		self.send_raw(f"PONG :{msg}")
+	def on_PING(self, message):
+		self.send_raw(f"PONG :{message.msg}", message.connection)
 		# self.save_settings()
 
 
 	# sends a message in the bot own channel every time it joins a channel
 	# JOIN is not reliable when connecting to 2+ channels, the server doesnt send JOIN messages for all the channels
-	def on_JOIN(self, data, tags, nick, user, host, cmd, channel, msg):
-		self.send_PRIVMSG(f"#{self.bot_nick}", f"Joined channel: {channel}")
-		pass
+	# with track_presence the JOIN of every chatter arrives too, twitch sends them in batches every few seconds
+	def on_JOIN(self, message):
+		if message.nick == self.bot_nick:
+			self.join_scheduler.joined(message.connection, message.channel)
+			self.send_PRIVMSG(f"#{self.bot_nick}", f"Joined channel: {message.channel}")
+		self.presence.join(message.channel, message.nick)
 
 
 	# sends a message in the bot own channel every time it parts a channel
 	# PART might not be reliable so dont use it for anything important
-	def on_PART(self, data, tags, nick, user, host, cmd, channel, msg):
-		self.send_PRIVMSG(f"#{self.bot_nick}", f"Parted channel: {channel}")
-		pass
+	def on_PART(self, message):
+		if message.nick == self.bot_nick:
+			self.presence.clear(message.channel)
+			self.send_PRIVMSG(f"#{self.bot_nick}", f"Parted channel: {message.channel}")
+		else:
+			self.presence.part(message.channel, message.nick)
 
 
-	# answers to a 376 message with a join message
-	def on_376(self, data, tags, nick, user, host, cmd, channel, msg):
-		self.can_connect = True
-		self._join(data, tags, nick, user, host, cmd, channel, msg)
+	# a NAMES reply, ":tmi.twitch.tv 353 nick = #channel :nick1 nick2 ..."
+	def on_353(self, message):
+		self.presence.names(message.channel.rpartition(" ")[2], message.msg or "")
 
 
-	def on_NOTICE(self, data, tags, nick, user, host, cmd, channel, msg): pass
+	# the end of the NAMES replies, ":tmi.twitch.tv 366 nick #channel :End of /NAMES list"
+	def on_366(self, message):
+		self.presence.end_of_names(message.channel.rpartition(" ")[2])
 
 
-	def on_PRIVMSG(self, data, tags, nick, user, host, cmd, channel, msg):
+	# the bot has higher rate limits in the channels where it's a moderator
+	def on_USERSTATE(self, message):
+		is_moderator = message.tag("mod") == "1" or "broadcaster" in message.tag("badges")
+		self.send_scheduler.set_moderator(message.channel, is_moderator)
 
-		def user_not_authorized():
-			self.log(f"User {nick}(owner: {user_is_bot_owner}, broadcaster: {user_is_broadcaster}, "
-				f"mod: {user_is_mod}, vip: {user_is_vip}) used command \"{command}\"", cmd="warning")
-			self.send_PRIVMSG(channel, "grayfoxWeirdDude you cant use that command")
 
-		# command_ functions are called when the user types a command in chat
-		def command_ping():
-			uptime = str(datetime.timedelta(seconds = math.floor(time.time() - self.session_variables["startup_time"])))
-			self.send_PRIVMSG(channel, f"Uptime: {uptime}")
+	# answers to a 376 message with a join message
+	def on_376(self, message):
+		self.can_connect = True
+		self.supervisor.connection_ready(message.connection)
+		# the other connections only take the channels the join scheduler gives them
+		# after a reconnect the join scheduler already has the channels of the main connection
+		if message.connection == 0 and not self.session_variables["joined_startup_channels"]:
+			self.session_variables["joined_startup_channels"] = True
+			self._join()
+		elif message.connection == 0:
+			self.metrics.count("reconnects")
+		self.join_scheduler.connection_ready(message.connection)
 
-		def command_redbar():
-			if param is None:
-				self.send_PRIVMSG(channel, "When the player's Pokémon is at 5/24 or less of their max HP there will be a beeping sound and "
-					"you are able to input during Pokémon cries, saving ~1 second every time a Pokémon enters the battle.")
-			else:
-				try:
-					max_hp = int(param.split(maxsplit=1)[0])
-					treshold = math.floor(max_hp * 5 / 24)
-					self.send_PRIVMSG(channel, f"{treshold}/{max_hp}")
-				except ValueError:
-					self.send_PRIVMSG(channel, f"Usage: {self.config.get(channel, 'trigger')}{command} max_health")
-
-		def command_gettags():
-			if user_is_mod or user_is_broadcaster or user_is_bot_owner:
-				self.send_PRIVMSG(channel, data)
-			else: user_not_authorized()
-
-		def command_connectedchannels():
-			response = "I'm connected to these channels: " + ", ".join(self.session_variables["connected_channels"]) + "."
-			self.send_PRIVMSG(channel, response)
-
-		def command_joinchannel():
-			if user_is_mod or user_is_broadcaster or user_is_bot_owner:
-				newchannel = "#" + param.split()[0].lower()
-				if self._join(data, tags, nick, user, host, cmd, channel, msg, newchannel):
-					self.send_PRIVMSG(channel, "Joined channel " + newchannel)
-				else:
-					self.send_PRIVMSG(channel, "Already joined channel " + newchannel)
-			else: user_not_authorized()
-
-		def command_partchannel():
-			if user_is_mod or user_is_broadcaster or user_is_bot_owner:
-				removedchannel = "#" + param.split()[0].lower()
-				if removedchannel == "#" + self.bot_nick:
-					self.send_PRIVMSG(channel, "I can't leave my own channel, if you don't want me to join this chat on startup edit the settings file")
-				elif removedchannel == channel:
-					self.send_PRIVMSG(channel, "If you want me to leave this chat use the command in my chat")
-				else:
-					if self._part(data, tags, nick, user, host, cmd, channel, msg, removedchannel=removedchannel):
-						self.send_PRIVMSG(channel, "Left channel " + removedchannel)
-					else:
-						self.send_PRIVMSG(channel, "I'm not connected to channel " + removedchannel)
-			else: user_not_authorized()
 
-		# alias for partchannel
-		command_leavechannel = command_partchannel
+	# the server is going to restart and asks to connect again, the supervisor reopens the connection
+	def on_RECONNECT(self, message):
+		self.log(f"The server asked connection {message.connection} to reconnect", cmd="info")
+		self._close_connection(message.connection)
+
+
+	def on_NOTICE(self, message): pass
 
-		def command_banlist():
-			if user_is_mod or user_is_broadcaster or user_is_bot_owner:
-				try:
-					with param.split(maxsplit=3) as params:
-						start = int(params_list[0]) if len(params_list) >= 1 else 50
-						limit = int(params_list[1]) if len(params_list) >= 2 else 50
-						filename = params_list[2] if len(params_list) == 3 else "banlist.txt"
-					self.send_PRIVMSG(channel, f"Banning {limit} users starting at line {start} from file {filename}")
-				except (AttributeError, ValueError) as error:
-					self.log(f"Handled AttributeError or ValueError): {error}")
-					self.send_PRIVMSG(channel, f"Usage: {self.config.get(channel, 'trigger')}{command} start amount [filename]")
-				else:
-					end = start + limit
-					try:
-						with open(filename, "r", encoding="utf8") as banlist_file:
-							banlist = banlist_file.readlines()
-						for count in range(start, end):
-							banned_user = banlist[count].strip(" \r\n")
-							self.send_PRIVMSG(channel, "/ban " + banned_user)
-							# time.sleep(0.35)
-					except IOError as error:
-						self.log(f"Handled IOError: {error}")
-						self.send_PRIVMSG(channel, f"Can't find or access file {filename}")
-					except IndexError as error:
-						self.log(f"Handled IndexError: {error}")
-						self.send_PRIVMSG(channel, f"Reached end of {filename}")
-				self.send_PRIVMSG(channel, f"Done banning {limit} users starting at line {start} from file {filename}")
-			else: user_not_authorized()
-
-		def command_quit():
-			if user_is_mod or user_is_broadcaster or user_is_bot_owner:
-				self.send_PRIVMSG(channel, "Closing the bot")
-				self.ui.quit_var.set()
-			else: user_not_authorized()
-
-		def command_restart():
-			if user_is_mod or user_is_broadcaster or user_is_bot_owner:
-				self.send_PRIVMSG(channel, "Restarting the bot")
-				self.ui.restart_var.set()
-			else: user_not_authorized()
-
-		# alias for restart
-		command_reload = command_restart
-
-		def command_newcommand(): pass
-
-		def command_temptimer():
-			if user_is_mod or user_is_broadcaster or user_is_bot_owner:
-				threading.Timer(5, self.send_PRIVMSG, args=[channel, "timer ended"]).start()
-			else: user_not_authorized()
-
-		def command_error():
-			user_not_authorized()
-
-
-		# create a dictionary for the tags
-		tags_dict = {tag.split("=")[0]: tag.split("=")[1] for tag in tags.split(";")}
+
+	def on_PRIVMSG(self, message):
+
+		nick = message.nick
+		user = message.user
+		channel = message.channel
+		msg = message.msg
 
 		# retrieve information about the user
+		badges = message.tag("badges")
 		user_is_bot_owner = True if nick == self.bot_owner else False
-		user_is_broadcaster = True if "broadcaster" in tags_dict["badges"] else False
-		user_is_mod = True if "moderator" in tags_dict["badges"] else False
-		user_is_vip = True if "vip" in tags_dict["badges"] else False
+		user_is_broadcaster = True if "broadcaster" in badges else False
+		user_is_mod = True if "moderator" in badges else False
+		user_is_vip = True if "vip" in badges else False
+
+		self.presence.seen(channel, nick)
+		self.timers.chat_message(channel)
+		settings = self._channel_settings(channel)
 
 		# check if the bot is setup to delete urls
-		if self.config.has_option(channel, "block_urls") and self.config.getboolean(channel, "block_urls") and not (user_is_broadcaster or user_is_mod or user_is_vip):
-				if self.regex_url.search(msg) is not None:
-					self.send_PRIVMSG(channel, "/delete " + tags_dict["id"])
+		if settings.block_urls and not (user_is_broadcaster or user_is_mod or user_is_vip):
+				start = time.perf_counter()
+				url_found = self.url_detector.search(msg) is not None
+				self.metrics.observe("check.urls", time.perf_counter() - start)
+				if url_found:
+					self.send_PRIVMSG(channel, "/delete " + message.tag("id"))
 					self.send_PRIVMSG(channel, "grayfoxWeirdDude no urls")
 					self.log(f"Message deleted from user {user}, message content: {msg}", cmd="info")
 					return
 
 		# check if the bot is setup to delete messages
-		if self.config.has_option(channel, "banned_phrases"):
+		if settings.banned_phrases is not None:
 			# check if a banned string is in the message
-			if re.search("(?i)" + self.config.get(channel, "banned_phrases"), msg) is not None and not (user_is_broadcaster or user_is_mod):
-				self.send_PRIVMSG(channel, "/delete " + tags_dict["id"])
+			start = time.perf_counter()
+			banned_phrase_found = settings.banned_phrases.search(msg) is not None
+			self.metrics.observe("check.banned_phrases", time.perf_counter() - start)
+			if banned_phrase_found and not (user_is_broadcaster or user_is_mod):
+				self.send_PRIVMSG(channel, "/delete " + message.tag("id"))
 				self.log(f"Message deleted from user {user}, message content: {msg}", cmd="info")
 				return
 
+		# check if the user is flooding the chat or repeating the same message
+		if settings.flood_guard is not None and not (user_is_broadcaster or user_is_mod or user_is_vip):
+			start = time.perf_counter()
+			reason = settings.flood_guard.check(nick, msg, time.monotonic())
+			self.metrics.observe("check.flood", time.perf_counter() - start)
+			if reason is not None:
+				if settings.flood_guard.action == "timeout":
+					self.send_PRIVMSG(channel, f"/timeout {nick} {settings.flood_guard.timeout} {reason}")
+					settings.flood_guard.forget(nick)
+				else:
+					self.send_PRIVMSG(channel, "/delete " + message.tag("id"))
+				self.log(f"Message from user {user} is a {reason} ({settings.flood_guard.action}), message content: {msg}", cmd="info")
+				return
+
 		# check if the bot is setup to copy specific emotes
-		if self.config.has_option(channel, "mime_emotes"):
+		if settings.mime_emotes is not None:
 			# check if the emote is in the message
-			mime_emotes_result = re.search("(?:\s|\A|\b)(?P<emote>" + self.config.get(channel, "mime_emotes") + ")(?:\s|$|\b)", msg)
-			if mime_emotes_result is not None:
-				cooldown = self.config.getint(channel, "mime_emotes_cooldown", fallback=30)
-				if (int(self.session_variables[channel]["last_mime_emote"]) + self.config.getint(channel, "mime_emotes_cooldown") - int(tags_dict["tmi-sent-ts"])) < 0:
-					self.session_variables[channel]["last_mime_emote"] = tags_dict["tmi-sent-ts"]
-					self.send_PRIVMSG(channel, mime_emotes_result["emote"])
+			start = time.perf_counter()
+			emote = settings.mime_emotes.find(msg, message.tag("emotes"))
+			self.metrics.observe("check.mime_emotes", time.perf_counter() - start)
+			if emote is not None:
+				try:
+					sent = int(message.tag("tmi-sent-ts"))
+				except ValueError:
+					sent = int(time.time() * 1000)
+				if settings.mime_emotes.should_mime(emote, nick, sent):
+					self.send_PRIVMSG(channel, emote)
 
 		# check if the bot has been pinged
-		if self.regex_pinged.search(msg) is not None:
-			self.send_PRIVMSG(channel, f"👋 FeelsDankMan hi {tags_dict['display-name']}! I'm a bot.")
+		start = time.perf_counter()
+		pinged = self.regex_pinged.search(msg) is not None
+		self.metrics.observe("check.pinged", time.perf_counter() - start)
+		if pinged:
+			self.send_PRIVMSG(channel, f"👋 FeelsDankMan hi {message.tag('display-name')}! I'm a bot.")
 
-		# create the re.match needle to be used in the if statements for the commands
-		command_regex = "^" + self.config.get(channel, "trigger") + "(?P<command>\S+)(?:\s+(?P<param>.+?))?\s*$"
-		full_command = re.match(command_regex, msg, flags=re.IGNORECASE)
+		# match the trigger of the channel followed by a command
+		full_command = settings.command.match(msg)
 
 		# commands
 		if full_command is not None:
 			command = full_command["command"]
-			param = full_command["param"]
 			try:
-				threading.Thread(target=locals()["command_" + command], name=command, daemon=True).start()
+				registered_command = COMMANDS[command]
 			except KeyError as error:
 				self.log(f"Handled KeyError: The command {command} doesnt exist")
+			else:
+				context = CommandContext(message, command, full_command["param"],
+					user_is_bot_owner, user_is_broadcaster, user_is_mod, user_is_vip)
+				if not self.command_pool.submit(self._run_command, registered_command, context):
+					self.log(f"Dropped command {command} from {nick}, {self.command_pool.pending()} commands already waiting")
+
+
+	# runs on the command pool threads
+	def _run_command(self, registered_command, context):
+		if not context.has_role(registered_command.role):
+			user_not_authorized(self, context)
+			return
+		start = time.perf_counter()
+		try:
+			registered_command.function(self, context)
+		except Exception as error:
+			self.log(f"Handled {type(error).__name__} in command {context.command}: {error}", cmd="warning")
+		self.metrics.observe("command." + registered_command.name, time.perf_counter() - start)
@@ -19,11 +19,28 @@ from tkinter import messagebox
 from tkinter import font
 import threading
 import datetime
+import collections
 
 # Run tkinter code in another thread
+# the print_ functions can be called from any thread, the lines are queued and added to the chat box in batches by the ui thread
 class UI(threading.Thread):
 
-	def __init__(self):
+	# milliseconds between each batch
+	FRAME_TIME = 50
+	# the most lines added in a single batch
+	BATCH_SIZE = 200
+	# lines waiting to be shown, if the ui falls behind the oldest ones are dropped
+	MAX_PENDING_LINES = 2000
+	# lines kept in the chat box, the oldest ones are deleted
+	MAX_CHAT_LINES = 5000
+
+	# on_message_out is called with the lines typed in the input box, on_flag when quit_var or restart_var are set
+	def __init__(self, on_message_out=None, on_flag=None):
+		self.on_message_out = on_message_out
+		self.on_flag = on_flag
+		self.pending_lines = collections.deque()
+		self.dropped_lines = 0
+		self.color_tags = set()
 		self.ui_ready = threading.Event()
 		self.quit_var = threading.Event()
 		self.restart_var = threading.Event()
@@ -35,6 +52,8 @@ class UI(threading.Thread):
 		if messagebox.askokcancel("Quit", "Do you want to quit?"):
 			if threading.main_thread().is_alive():
 				self.quit_var.set()
+				if self.on_flag is not None:
+					self.on_flag()
 			else:
 				self.root.destroy()
 
@@ -52,7 +71,11 @@ class UI(threading.Thread):
 		# execute a function when the window is closed
 		self.root.protocol("WM_DELETE_WINDOW", self.on_ui_close)
 		self.root.title("VolpesBot")
-		self.root.iconbitmap("files/VolpesBotTwitch.ico")
+		# .ico files only work on windows
+		try:
+			self.root.iconbitmap("files/VolpesBotTwitch.ico")
+		except tk.TclError:
+			pass
 		self.root.geometry("800x800")
 
 		# font
@@ -99,6 +122,12 @@ class UI(threading.Thread):
 
 		# create the variable where to store the message to send
 		self.message_out_var = tk.StringVar()
+		# set an observer for the input box variable
+		if self.on_message_out is not None:
+			self.message_out_var.trace("w", lambda a, b, c: self.on_message_out(self.message_out_var.get()))
+
+		# start adding the queued lines to the chat box
+		self.root.after(self.FRAME_TIME, self._print_pending)
 
 		# unpause the main thread and start the ui loop
 		self.ui_ready.set()
@@ -111,13 +140,7 @@ class UI(threading.Thread):
 		nick = f"{nick}"
 		message = f": {message}\n"
 
-		# if the tag for the specific nick color doesnt exist create one
-		if nick_color in self.chat_box.tag_names():
-			pass
-		else:
-			self.chat_box.tag_configure(nick_color, foreground=nick_color)
-
-		self._print("gray", channel, "white", nick, nick_color, message, ("white", "wrap_spacing"))
+		self._print("gray", channel, "white", nick, nick_color, message, ("white", "wrap_spacing"), color=nick_color)
 
 
 	def print_warning(self, message):
@@ -151,21 +174,53 @@ class UI(threading.Thread):
 		nick = f"{nick}"
 		message = f": {message}\n"
 
-		# if the tag for the specific nick color doesnt exist create one
-		if nick_color in self.chat_box.tag_names():
-			pass
-		else:
-			self.chat_box.tag_configure(nick_color, foreground=nick_color)
-
-		self._print("gray", prefix, "green", nick, nick_color, message, ("white", "wrap_spacing"))
+		self._print("gray", prefix, "green", nick, nick_color, message, ("white", "wrap_spacing"), color=nick_color)
 
 
-	def _print(self, *args):
+	# queues a line, color is a tag that has to exist before the line is added
+	def _print(self, *args, color=None):
 
 		# get the formatted time and make some padding around the text
 		current_time = datetime.datetime.now().strftime("%H:%M:%S") + " "
 
-		self.chat_box.config(state="normal")
-		self.chat_box.insert("end", current_time, *args)
-		self.chat_box.config(state="disabled")
-		self.chat_box.see("end")
+		if len(self.pending_lines) >= self.MAX_PENDING_LINES:
+			try:
+				self.pending_lines.popleft()
+				self.dropped_lines += 1
+			# the ui thread emptied the queue in the meantime
+			except IndexError:
+				pass
+		self.pending_lines.append((current_time, args, color))
+
+
+	# runs in the ui thread, adds the queued lines with a single state change and scroll
+	def _print_pending(self):
+
+		if self.pending_lines or self.dropped_lines:
+			self.chat_box.config(state="normal")
+
+			if self.dropped_lines:
+				dropped_lines = self.dropped_lines
+				self.dropped_lines = 0
+				self.chat_box.insert("end", f"{dropped_lines} lines were not shown, the ui couldn't keep up\n", ("red", "wrap_spacing"))
+
+			for count in range(self.BATCH_SIZE):
+				try:
+					current_time, args, color = self.pending_lines.popleft()
+				except IndexError:
+					break
+				# if the tag for the specific nick color doesnt exist create one
+				if color and color not in self.color_tags:
+					self.chat_box.tag_configure(color, foreground=color)
+					self.color_tags.add(color)
+				self.chat_box.insert("end", current_time, *args)
+
+			# delete the oldest lines
+			extra_lines = int(self.chat_box.index("end-1c").split(".")[0]) - self.MAX_CHAT_LINES
+			if extra_lines > 0:
+				self.chat_box.delete("1.0", f"{extra_lines + 1}.0")
+
+			self.chat_box.config(state="disabled")
+			self.chat_box.see("end")
+
+		self.root.after(self.FRAME_TIME, self._print_pending)
@@ -0,0 +1,59 @@
+# VolpesBot, IRC bot for twitch.tv
+# 	Copyright (C) 2021  Grayfox96
+
+# 	This program is free software: you can redistribute it and/or modify
+# 	it under the terms of the GNU General Public License as published by
+# 	the Free Software Foundation, either version 3 of the License, or
+# 	(at your option) any later version.
+
+# 	This program is distributed in the hope that it will be useful,
+# 	but WITHOUT ANY WARRANTY; without even the implied warranty of
+# 	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# 	GNU General Public License for more details.
+
+# 	You should have received a copy of the GNU General Public License
+# 	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import queue
+import threading
+import traceback
+
+
+# a fixed number of threads that run the functions submitted to them
+# when the queue is full new work is refused instead of making more threads
+class WorkerPool():
+
+	def __init__(self, workers, queue_size, name="worker"):
+		self.queue = queue.Queue(maxsize=queue_size)
+		self.rejected = 0
+		self.threads = []
+		for number in range(workers):
+			thread = threading.Thread(target=self._work, name=f"{name}-{number}", daemon=True)
+			thread.start()
+			self.threads.append(thread)
+
+
+	# returns False if the queue is full and the function wont be run
+	def submit(self, function, *args):
+		try:
+			self.queue.put_nowait((function, args))
+			return True
+		except queue.Full:
+			self.rejected += 1
+			return False
+
+
+	# number of functions waiting for a free thread
+	def pending(self):
+		return self.queue.qsize()
+
+
+	def _work(self):
+		while True:
+			function, args = self.queue.get()
+			try:
+				function(*args)
+			except Exception:
+				traceback.print_exc()
+			finally:
+				self.queue.task_done()